@@ -0,0 +1,34 @@
+"""embedding cache
+
+Revision ID: 4f2a9c1d7e30
+Revises: b062ca9de1b4
+Create Date: 2026-10-17 09:12:44.118203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from pgvector.sqlalchemy import Vector
+
+# revision identifiers, used by Alembic.
+revision: str = '4f2a9c1d7e30'
+down_revision: Union[str, Sequence[str], None] = 'b062ca9de1b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "embedding_cache",
+        sa.Column("content_hash", sa.String(length=64), nullable=False),
+        sa.Column("model", sa.Text(), nullable=False),
+        sa.Column("dims", sa.Integer(), nullable=False),
+        sa.Column("embedding", Vector(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.PrimaryKeyConstraint("content_hash", "model", "dims"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("embedding_cache")
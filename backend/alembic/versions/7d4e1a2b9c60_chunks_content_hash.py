@@ -0,0 +1,27 @@
+"""content_hash on chunks for incremental re-ingestion
+
+Revision ID: 7d4e1a2b9c60
+Revises: e5a0b7c93f14
+Create Date: 2026-10-17 13:05:12.480211
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '7d4e1a2b9c60'
+down_revision: Union[str, Sequence[str], None] = 'e5a0b7c93f14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("chunks", sa.Column("content_hash", sa.Text(), nullable=True))
+    # must match app.services.chunk_store.chunk_hash
+    op.execute("UPDATE chunks SET content_hash = encode(sha256(convert_to(content, 'UTF8')), 'hex')")
+
+
+def downgrade() -> None:
+    op.drop_column("chunks", "content_hash")
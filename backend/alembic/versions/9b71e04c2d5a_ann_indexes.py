@@ -0,0 +1,38 @@
+"""per-(model, dims) ANN indexes on embeddings
+
+Revision ID: 9b71e04c2d5a
+Revises: 4f2a9c1d7e30
+Create Date: 2026-10-17 10:03:27.554190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.services import ann_index
+
+# revision identifiers, used by Alembic.
+revision: str = '9b71e04c2d5a'
+down_revision: Union[str, Sequence[str], None] = '4f2a9c1d7e30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _pairs():
+    conn = op.get_bind()
+    return conn.execute(sa.text("SELECT DISTINCT model, dims FROM embeddings")).all()
+
+
+def upgrade() -> None:
+    # Index whatever (model, dims) pairs exist today; new models get theirs via
+    # `python -m app.manage ann-indexes create|sync` (CONCURRENTLY, no table lock).
+    for model, dims in _pairs():
+        if ann_index.indexable(dims):
+            op.execute(ann_index.create_index_sql(model, dims, "hnsw"))
+
+
+def downgrade() -> None:
+    for model, dims in _pairs():
+        for method in ann_index.METHODS:
+            op.execute(ann_index.drop_index_sql(model, dims, method))
@@ -0,0 +1,40 @@
+"""source_type/captured_at on embeddings + (user_id, captured_at) indexes for filtered retrieval
+
+Revision ID: a8c2e6f0d413
+Revises: 7d4e1a2b9c60
+Create Date: 2026-10-17 14:02:37.615904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8c2e6f0d413'
+down_revision: Union[str, Sequence[str], None] = '7d4e1a2b9c60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # copies of documents.source_type / chunks.captured_at, so vector search
+    # can filter without joining
+    op.add_column("embeddings", sa.Column("source_type", sa.String(), nullable=True))
+    op.add_column("embeddings", sa.Column("captured_at", sa.DateTime(timezone=True), nullable=True))
+    op.execute("""
+        UPDATE embeddings e
+        SET source_type = d.source_type, captured_at = c.captured_at
+        FROM chunks c
+        JOIN documents d ON d.id = c.document_id
+        WHERE c.id = e.chunk_id
+    """)
+    op.create_index("ix_embeddings_user_captured", "embeddings", ["user_id", "captured_at"])
+    op.create_index("ix_chunks_user_captured", "chunks", ["user_id", "captured_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_chunks_user_captured", table_name="chunks")
+    op.drop_index("ix_embeddings_user_captured", table_name="embeddings")
+    op.drop_column("embeddings", "captured_at")
+    op.drop_column("embeddings", "source_type")
@@ -0,0 +1,66 @@
+"""move hex-encoded upload bytes from artifacts.metadata into the blob store
+
+Revision ID: c3d8f5a61e92
+Revises: 9b71e04c2d5a
+Create Date: 2026-10-17 11:26:05.901447
+
+"""
+import io
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.services.blob_store import get_blob_store, new_object_key
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3d8f5a61e92'
+down_revision: Union[str, Sequence[str], None] = '9b71e04c2d5a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    store = get_blob_store()
+    # Ids first, then one row at a time, so only a single upload is in memory.
+    ids = conn.execute(sa.text(
+        "SELECT id FROM artifacts WHERE object_key IS NULL AND metadata ? 'bytes'"
+    )).scalars().all()
+    for artifact_id in ids:
+        row = conn.execute(
+            sa.text("SELECT user_id, metadata->>'filename' AS filename, metadata->>'bytes' AS hex FROM artifacts WHERE id = :id"),
+            {"id": artifact_id},
+        ).one()
+        key = new_object_key(str(row.user_id), row.filename)
+        size, sha256 = store.put(key, io.BytesIO(bytes.fromhex(row.hex)))
+        conn.execute(
+            sa.text("""
+                UPDATE artifacts
+                SET object_key = :key,
+                    metadata = (metadata - 'bytes') || jsonb_build_object('size', :size, 'sha256', CAST(:sha256 AS text))
+                WHERE id = :id
+            """),
+            {"key": key, "size": size, "sha256": sha256, "id": artifact_id},
+        )
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    store = get_blob_store()
+    rows = conn.execute(sa.text(
+        "SELECT id, object_key FROM artifacts WHERE object_key IS NOT NULL AND NOT (metadata ? 'bytes')"
+    )).all()
+    for artifact_id, key in rows:
+        with store.open(key) as fh:
+            hex_bytes = fh.read().hex()
+        conn.execute(
+            sa.text("""
+                UPDATE artifacts
+                SET object_key = NULL,
+                    metadata = (metadata - 'size' - 'sha256') || jsonb_build_object('bytes', CAST(:hex AS text))
+                WHERE id = :id
+            """),
+            {"hex": hex_bytes, "id": artifact_id},
+        )
+        store.delete(key)
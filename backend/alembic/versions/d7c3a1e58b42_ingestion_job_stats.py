@@ -0,0 +1,31 @@
+"""per-stage seconds, bytes, chunk and token counts on ingestion_jobs
+
+Revision ID: d7c3a1e58b42
+Revises: f1b9d3c57a28
+Create Date: 2026-10-17 18:21:09.402113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7c3a1e58b42'
+down_revision: Union[str, Sequence[str], None] = 'f1b9d3c57a28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("ingestion_jobs", sa.Column("stage_seconds", sa.JSON(), nullable=True))
+    op.add_column("ingestion_jobs", sa.Column("byte_count", sa.BigInteger(), nullable=True))
+    op.add_column("ingestion_jobs", sa.Column("chunk_count", sa.Integer(), nullable=True))
+    op.add_column("ingestion_jobs", sa.Column("token_count", sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("ingestion_jobs", "token_count")
+    op.drop_column("ingestion_jobs", "chunk_count")
+    op.drop_column("ingestion_jobs", "byte_count")
+    op.drop_column("ingestion_jobs", "stage_seconds")
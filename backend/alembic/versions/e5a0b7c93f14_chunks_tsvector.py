@@ -0,0 +1,35 @@
+"""generated tsvector column + GIN index on chunks for lexical retrieval
+
+Revision ID: e5a0b7c93f14
+Revises: c3d8f5a61e92
+Create Date: 2026-10-17 12:40:51.337820
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a0b7c93f14'
+down_revision: Union[str, Sequence[str], None] = 'c3d8f5a61e92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "chunks",
+        sa.Column(
+            "content_tsv",
+            postgresql.TSVECTOR(),
+            sa.Computed("to_tsvector('english', content)", persisted=True),
+        ),
+    )
+    op.create_index("ix_chunks_content_tsv", "chunks", ["content_tsv"], postgresql_using="gin")
+
+
+def downgrade() -> None:
+    op.drop_index("ix_chunks_content_tsv", table_name="chunks")
+    op.drop_column("chunks", "content_tsv")
@@ -0,0 +1,34 @@
+"""compact halfvec / bit copies of embeddings for two-phase search
+
+Revision ID: f1b9d3c57a28
+Revises: a8c2e6f0d413
+Create Date: 2026-10-17 15:21:44.093512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from pgvector.sqlalchemy import HALFVEC
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1b9d3c57a28'
+down_revision: Union[str, Sequence[str], None] = 'a8c2e6f0d413'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # halfvec, bit and binary_quantize need pgvector >= 0.7
+    op.execute("ALTER EXTENSION vector UPDATE")
+    # Empty until written by ingestion (COMPACT_VECTORS) or filled by
+    # `python -m app.manage compact-vectors backfill`; indexes per (model,
+    # dims) via `python -m app.manage ann-indexes sync --kind halfvec|bit`.
+    op.add_column("embeddings", sa.Column("embedding_half", HALFVEC(), nullable=True))
+    op.add_column("embeddings", sa.Column("embedding_bit", postgresql.BIT(varying=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("embeddings", "embedding_bit")
+    op.drop_column("embeddings", "embedding_half")
@@ -1,13 +1,25 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from typing import List, Literal, Optional, Tuple
 from sqlalchemy.orm import Session
 
+import asyncio
+import json
 import os
-from openai import OpenAI
+from datetime import datetime
 
 from app.db.session import get_db
-from app.services.retrieval import retrieve_top_chunks
-from app.services.rerank import rerank
+from app.services.ai_provider import get_async_llm
+from app.services.retrieval import RetrievalFilter, resolve_mode, search_chunks
+from app.services.query_filters import extract_time_range
+from app.services.mmr import mmr_rerank
+from app.services.rerank import arerank
+from app.services import query_cache, tracing
+from app.services.hot_tier import get_hot_tier
+from app.services.query_cache import aembed_query
 
 
 router = APIRouter()
@@ -16,10 +28,22 @@ class ChatRequest(BaseModel):
     user_id: str
     query: str
     top_k: int = 8
+    ef_search: Optional[int] = None  # HNSW candidate list size for this request
+    probes: Optional[int] = None  # IVFFlat lists probed for this request
+    mode: Optional[Literal["vector", "lexical", "hybrid"]] = None  # default: RETRIEVAL_MODE
+    reranker: Optional[Literal["llm", "mmr", "none"]] = None  # default: RERANKER
+    # Only content captured in [captured_after, captured_before); without either,
+    # a time range stated in the query ("last month") is used (QUERY_DATE_PARSING).
+    captured_after: Optional[datetime] = None
+    captured_before: Optional[datetime] = None
+    source_types: Optional[List[Literal["web", "pdf", "audio"]]] = None
+    debug: bool = False  # always trace this request and return the spans as `trace`
 
 class ChatResponse(BaseModel):
     answer: str
     sources: list
+    filters: Optional[dict] = None  # filters applied to retrieval, if any
+    trace: Optional[dict] = None  # per-step timings, only for debug requests
 
 def _format_context(hits: list) -> str:
     parts = []
@@ -46,51 +70,214 @@ def _fallback_answer(query: str, hits: list) -> str:
         f"{top.get('content') or ''}"
     )
 
-@router.post("/chat", response_model=ChatResponse)
-def chat(req: ChatRequest, db: Session = Depends(get_db)):
-    hits = retrieve_top_chunks(db=db, user_id=req.user_id, query=req.query, top_k=req.top_k)
-    hits = [dict(h) for h in hits]
-    hits = rerank(req.query, hits)
-    if not hits:
-        return {"answer": "No saved content found for this user yet.", "sources": []}
-
-    use_fake_llm = (os.getenv("USE_FAKE_LLM") == "1") or (not os.getenv("OPENAI_API_KEY"))
+def _timeout(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
 
-    if use_fake_llm:
-        return {"answer": _fallback_answer(req.query, hits), "sources": hits}
+def _use_fake_llm() -> bool:
+    if os.getenv("USE_FAKE_LLM") == "1":
+        return True
+    return os.getenv("LLM_PROVIDER", "openai").lower() == "openai" and not os.getenv("OPENAI_API_KEY")
 
-    model = os.getenv("OPENAI_CHAT_MODEL", "gpt-4.1-mini")
-    context = _format_context(hits)
+SYSTEM_PROMPT = (
+    "You are a personal 'second brain' assistant.\n"
+    "Answer using ONLY the provided context.\n"
+    "If the context is insufficient, say what’s missing.\n"
+    "When you use facts from a source, cite it like [1], [2].\n"
+    "Be concise and helpful."
+)
 
-    system = (
-        "You are a personal 'second brain' assistant.\n"
-        "Answer using ONLY the provided context.\n"
-        "If the context is insufficient, say what’s missing.\n"
-        "When you use facts from a source, cite it like [1], [2].\n"
-        "Be concise and helpful."
+def _user_prompt(query: str, hits: list) -> str:
+    return (
+        f"User question: {query}\n\n"
+        f"Context:\n{_format_context(hits)}\n\n"
+        "Write a synthesized answer now."
     )
 
-    user = (
-        f"User question: {req.query}\n\n"
-        f"Context:\n{context}\n\n"
-        "Write a synthesized answer now."
+def _reranker(req: ChatRequest) -> str:
+    if req.reranker:
+        return req.reranker
+    return os.getenv("RERANKER") or ("llm" if os.getenv("USE_RERANK") == "1" else "none")
+
+def _filters(req: ChatRequest) -> Tuple[RetrievalFilter, str, Optional[dict]]:
+    """(retrieval filter, text to search with, filters to report back or None)."""
+    after, before, phrase = req.captured_after, req.captured_before, None
+    search_query = req.query
+    if after is None and before is None and os.getenv("QUERY_DATE_PARSING", "1") == "1":
+        found, search_query = extract_time_range(req.query)
+        if found:
+            after, before, phrase = found.after, found.before, found.phrase
+    filters = RetrievalFilter(after, before, req.source_types)
+    tracing.annotate(time_range_from_query=phrase is not None)
+    if not filters.active:
+        return filters, search_query, None
+    return filters, search_query, {
+        "captured_after": after,
+        "captured_before": before,
+        "source_types": req.source_types,
+        "from_query": phrase,
+    }
+
+async def _retrieve(req: ChatRequest, db: Session, filters: RetrievalFilter, search_query: str) -> list:
+    mode = resolve_mode(req.mode)
+    use_mmr = _reranker(req) == "mmr"
+    qvec, qdims, qmodel = [], 0, ""
+    if mode != "lexical" or use_mmr:
+        try:
+            with tracing.span("embed_query"):
+                qvec, qdims, qmodel = await asyncio.wait_for(
+                    aembed_query(search_query), timeout=_timeout("EMBED_TIMEOUT", 15)
+                )
+        except asyncio.TimeoutError:
+            # embedding provider too slow: answer from full-text search instead of failing
+            mode, use_mmr = "lexical", False
+    # MMR picks top_k out of a wider candidate pool
+    n = max(req.top_k, int(os.getenv("MMR_CANDIDATES", str(req.top_k * 4)))) if use_mmr else req.top_k
+    # The ORM session is synchronous; keep the SQL off the event loop.
+    hits = await run_in_threadpool(
+        search_chunks, db, req.user_id, search_query, qvec, qdims, qmodel,
+        n, req.ef_search, req.probes, mode, use_mmr, filters,
     )
+    hits = [dict(h) for h in hits]
+    if use_mmr:
+        with tracing.span("mmr", candidates=len(hits)):
+            hits = mmr_rerank(qvec, hits, top_k=req.top_k)
+    return hits
 
+async def _rerank(req: ChatRequest, hits: list) -> list:
+    if _reranker(req) != "llm":
+        return hits
     try:
-        client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": user},
-            ],
-            temperature=0.2,
-        )
-        answer = resp.choices[0].message.content.strip()
-        return {"answer": answer, "sources": hits}
+        return await asyncio.wait_for(arerank(req.query, hits), timeout=_timeout("RERANK_TIMEOUT", 10))
+    except Exception:
+        # rerank is an optimization; keep vector order on timeout/error
+        return hits
+
+def _start_trace(request: Request, req: ChatRequest) -> Optional[tracing.Trace]:
+    trace = tracing.start_trace(request.url.path, request.headers.get("traceparent"), force=req.debug)
+    if trace:
+        trace.root.set(user_id=req.user_id, top_k=req.top_k)
+    return trace
+
+@router.post("/chat", response_model=ChatResponse)
+async def chat(req: ChatRequest, request: Request, response: Response, db: Session = Depends(get_db)):
+    """
+    Sampled requests (TRACE_SAMPLE_RATE, an upstream traceparent, or
+    debug=true) get a Server-Timing header with per-step milliseconds;
+    debug requests also get the spans in the body.
+    """
+    trace = _start_trace(request, req)
+    error = None
+    try:
+        with tracing.use(trace):
+            result = await _answer(req, db)
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        tracing.finish(trace, error)
+    if trace:
+        response.headers["Server-Timing"] = trace.server_timing()
+        if req.debug:
+            result["trace"] = trace.to_dict()
+    return result
+
+async def _answer(req: ChatRequest, db: Session) -> dict:
+    with tracing.span("query_filters"):
+        filters, search_query, applied = _filters(req)
+    hits = await _retrieve(req, db, filters, search_query)
+    hits = await _rerank(req, hits)
+    if not hits:
+        answer = "No saved content found for this user yet." if not applied else "No saved content matches those filters."
+        return {"answer": answer, "sources": [], "filters": applied}
+
+    if _use_fake_llm():
+        return {"answer": _fallback_answer(req.query, hits), "sources": hits, "filters": applied}
+
+    try:
+        with tracing.span("completion", provider=os.getenv("LLM_PROVIDER", "openai").lower()):
+            answer = await asyncio.wait_for(
+                get_async_llm().chat(_user_prompt(req.query, hits), system=SYSTEM_PROMPT),
+                timeout=_timeout("CHAT_TIMEOUT", 60),
+            )
+        return {"answer": answer.strip(), "sources": hits, "filters": applied}
 
     except Exception as e:
+        reason = "timeout" if isinstance(e, asyncio.TimeoutError) else e
         return {
-            "answer": _fallback_answer(req.query, hits) + f"\n\n(LLM unavailable: {e})",
+            "answer": _fallback_answer(req.query, hits) + f"\n\n(LLM unavailable: {reason})",
             "sources": hits,
+            "filters": applied,
         }
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+@router.post("/chat/stream")
+async def chat_stream(req: ChatRequest, request: Request, db: Session = Depends(get_db)):
+    """
+    Server-sent events: one `sources` event as soon as retrieval is done,
+    then `token` events ({"text": delta}) as the LLM streams, then `done`.
+    On LLM failure an `error` event carries the fallback snippet. The
+    Server-Timing header covers the steps before the first event; the
+    exported trace (and `done`, for debug requests) includes the completion.
+    """
+    trace = _start_trace(request, req)
+    try:
+        with tracing.use(trace):
+            with tracing.span("query_filters"):
+                filters, search_query, applied = _filters(req)
+            hits = await _retrieve(req, db, filters, search_query)
+            hits = await _rerank(req, hits)
+    except BaseException as e:
+        tracing.finish(trace, e)
+        raise
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if trace:
+        headers["Server-Timing"] = trace.server_timing()
+
+    async def events():
+        # runs in the response's own task, outside the request context
+        with tracing.use(trace):
+            try:
+                async for event in _stream_answer(req, hits, applied):
+                    yield event
+            finally:
+                tracing.finish(trace)
+        yield _sse("done", {"trace": trace.to_dict()} if trace and req.debug else {})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+async def _stream_answer(req: ChatRequest, hits: list, applied: Optional[dict]):
+    yield _sse("sources", {"sources": hits, "filters": applied})
+    if not hits:
+        text = "No saved content found for this user yet." if not applied else "No saved content matches those filters."
+        yield _sse("token", {"text": text})
+    elif _use_fake_llm():
+        yield _sse("token", {"text": _fallback_answer(req.query, hits)})
+    else:
+        idle_timeout = _timeout("CHAT_TIMEOUT", 60)
+        stream = get_async_llm().stream_chat(_user_prompt(req.query, hits), system=SYSTEM_PROMPT)
+        with tracing.span("completion", provider=os.getenv("LLM_PROVIDER", "openai").lower()) as span:
+            try:
+                while True:
+                    try:
+                        # bound the wait for each delta, not the whole answer
+                        delta = await asyncio.wait_for(stream.__anext__(), timeout=idle_timeout)
+                    except StopAsyncIteration:
+                        break
+                    yield _sse("token", {"text": delta})
+            except Exception as e:
+                reason = "timeout" if isinstance(e, asyncio.TimeoutError) else str(e)
+                span.set(error=f"LLM unavailable: {reason}")
+                yield _sse("error", {"message": f"LLM unavailable: {reason}", "fallback": _fallback_answer(req.query, hits)})
+            finally:
+                await stream.aclose()
+
+@router.get("/chat/query-cache")
+def query_cache_stats():
+    return query_cache.stats()
+
+@router.get("/chat/hot-tier")
+def hot_tier_stats():
+    tier = get_hot_tier()
+    return tier.stats() if tier else {"enabled": False}
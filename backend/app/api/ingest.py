@@ -1,13 +1,19 @@
 import uuid
 from datetime import datetime, timezone
 
+from celery import group
 from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
-from app.api.schemas import IngestUrlRequest, IngestResponse, JobStatusResponse
+from app.api.schemas import (
+    IngestBatchResponse, IngestUrlRequest, IngestUrlsRequest, IngestResponse, JobStatusResponse
+)
 from app.db.deps import get_db
 from app.models.memory import Artifact, IngestionJob
-from app.workers.tasks import process_audio_job, process_pdf_job, process_url_job
+from app.services import metrics
+from app.services.blob_store import get_blob_store, new_object_key
+from app.workers.tasks import ingestion_signature
 
 router = APIRouter(prefix="/ingest", tags=["ingest"])
 
@@ -20,16 +26,20 @@ def _create_job(db: Session, artifact: Artifact) -> IngestionJob:
     db.add(job)
     db.commit()
     db.refresh(job)
+    metrics.SUBMITTED.labels(artifact.type).inc()
     return job
 
+def _parse_captured_at(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="captured_at must be ISO-8601")
+
 @router.post("/url", response_model=IngestResponse)
 def ingest_url(payload: IngestUrlRequest, db: Session = Depends(get_db)):
-    captured_at = None
-    if payload.captured_at:
-        try:
-            captured_at = datetime.fromisoformat(payload.captured_at)
-        except ValueError:
-            raise HTTPException(status_code=400, detail="captured_at must be ISO-8601")
+    captured_at = _parse_captured_at(payload.captured_at)
 
     artifact = Artifact(
         user_id=uuid.UUID(payload.user_id),
@@ -44,33 +54,79 @@ def ingest_url(payload: IngestUrlRequest, db: Session = Depends(get_db)):
 
     job = _create_job(db, artifact)
 
-    process_url_job.delay(str(job.id))
+    ingestion_signature(str(job.id), artifact.type).apply_async()
     return IngestResponse(job_id=str(job.id), artifact_id=str(artifact.id), status=job.status)
 
+@router.post("/urls", response_model=IngestBatchResponse)
+def ingest_urls(payload: IngestUrlsRequest, db: Session = Depends(get_db)):
+    """
+    Bulk variant of /url: all Artifact and IngestionJob rows go in with two
+    multi-row INSERTs and one commit, and the jobs are enqueued as one Celery group.
+    """
+    captured_at = _parse_captured_at(payload.captured_at)
+    owner = uuid.UUID(payload.user_id)
+    urls = list(dict.fromkeys(str(u) for u in payload.urls))
+
+    artifacts = [
+        {
+            "id": uuid.uuid4(),
+            "user_id": owner,
+            "type": "web",
+            "source_uri": url,
+            "object_key": None,
+            "captured_at": captured_at,
+            "meta": {"source": "url"},
+        }
+        for url in urls
+    ]
+    jobs = [
+        {"id": uuid.uuid4(), "artifact_id": a["id"], "status": "PENDING", "attempts": 0}
+        for a in artifacts
+    ]
+    db.execute(insert(Artifact), artifacts)
+    db.execute(insert(IngestionJob), jobs)
+    db.commit()
+    metrics.SUBMITTED.labels("web").inc(len(jobs))
+
+    group(ingestion_signature(str(j["id"]), "web") for j in jobs).apply_async()
+    return IngestBatchResponse(jobs=[
+        IngestResponse(job_id=str(j["id"]), artifact_id=str(j["artifact_id"]), status=j["status"])
+        for j in jobs
+    ])
+
 def _ingest_file(
     db: Session,
     user_id: str,
     file: UploadFile,
     source_type: str,
+    source_id: str | None = None,
 ) -> tuple[Artifact, IngestionJob]:
     if not file.filename:
         raise HTTPException(status_code=400, detail="filename required")
+    owner = uuid.UUID(user_id)
 
-    content = file.file.read()
-    if not content:
+    store = get_blob_store()
+    object_key = new_object_key(str(owner), file.filename)
+    size, sha256 = store.put(object_key, file.file)
+    if not size:
+        store.delete(object_key)
         raise HTTPException(status_code=400, detail="uploaded file is empty")
 
     artifact = Artifact(
-        user_id=uuid.UUID(user_id),
+        user_id=owner,
         type=source_type,
         source_uri=file.filename,
+        object_key=object_key,
         captured_at=datetime.now(timezone.utc),
         meta={
             "filename": file.filename,
             "content_type": file.content_type,
-            "bytes": content.hex(),
+            "size": size,
+            "sha256": sha256,
         },
     )
+    if source_id:
+        artifact.meta["source_id"] = source_id
     db.add(artifact)
     db.flush()
 
@@ -78,15 +134,25 @@ def _ingest_file(
     return artifact, job
 
 @router.post("/pdf", response_model=IngestResponse)
-def ingest_pdf(user_id: str = Form(...), file: UploadFile = File(...), db: Session = Depends(get_db)):
-    artifact, job = _ingest_file(db, user_id=user_id, file=file, source_type="pdf")
-    process_pdf_job.delay(str(job.id))
+def ingest_pdf(
+    user_id: str = Form(...),
+    file: UploadFile = File(...),
+    source_id: str | None = Form(None),
+    db: Session = Depends(get_db),
+):
+    """
+    source_id names the document across uploads: a later upload with the same
+    source_id replaces its chunks (only changed ones are embedded). Without it
+    only a byte-identical re-upload is treated as the same document.
+    """
+    artifact, job = _ingest_file(db, user_id=user_id, file=file, source_type="pdf", source_id=source_id)
+    ingestion_signature(str(job.id), artifact.type).apply_async()
     return IngestResponse(job_id=str(job.id), artifact_id=str(artifact.id), status=job.status)
 
 @router.post("/audio", response_model=IngestResponse)
 def ingest_audio(user_id: str = Form(...), file: UploadFile = File(...), db: Session = Depends(get_db)):
     artifact, job = _ingest_file(db, user_id=user_id, file=file, source_type="audio")
-    process_audio_job.delay(str(job.id))
+    ingestion_signature(str(job.id), artifact.type).apply_async()
     return IngestResponse(job_id=str(job.id), artifact_id=str(artifact.id), status=job.status)
 
 @router.get("/job/{job_id}", response_model=JobStatusResponse)
@@ -94,4 +160,13 @@ def get_job(job_id: str, db: Session = Depends(get_db)):
     job = db.get(IngestionJob, uuid.UUID(job_id))
     if not job:
         raise HTTPException(status_code=404, detail="job not found")
-    return JobStatusResponse(job_id=str(job.id), status=job.status, error_message=job.error_message)
+    return JobStatusResponse(
+        job_id=str(job.id),
+        status=job.status,
+        error_message=job.error_message,
+        attempts=job.attempts or 0,
+        stage_seconds=job.stage_seconds,
+        byte_count=job.byte_count,
+        chunk_count=job.chunk_count,
+        token_count=job.token_count,
+    )
@@ -1,17 +1,32 @@
-from pydantic import BaseModel, HttpUrl
-from typing import Optional, List
+from pydantic import BaseModel, Field, HttpUrl
+from typing import Dict, Optional, List
+
+MAX_BATCH_URLS = 1000
 
 class IngestUrlRequest(BaseModel):
     user_id: str
     url: HttpUrl
     captured_at: Optional[str] = None
 
+class IngestUrlsRequest(BaseModel):
+    user_id: str
+    urls: List[HttpUrl] = Field(..., min_length=1, max_length=MAX_BATCH_URLS)
+    captured_at: Optional[str] = None
+
 class IngestResponse(BaseModel):
     job_id: str
     artifact_id: str
     status: str
 
+class IngestBatchResponse(BaseModel):
+    jobs: List[IngestResponse]  # one per distinct URL, in request order
+
 class JobStatusResponse(BaseModel):
     job_id: str
     status: str
     error_message: Optional[str] = None
+    attempts: int = 0
+    stage_seconds: Optional[Dict[str, float]] = None  # fetch/extract/chunk/embed/persist, summed over attempts
+    byte_count: Optional[int] = None  # source bytes fetched or uploaded
+    chunk_count: Optional[int] = None  # chunks embedded and written (0 when nothing changed)
+    token_count: Optional[int] = None
@@ -1,3 +1,4 @@
+from pgvector.psycopg import register_vector
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
@@ -13,4 +14,16 @@ def get_db() -> Generator[Session, None, None]:
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def raw_connection(db: Session):
+    """
+    The psycopg connection under a Session (same transaction), with pgvector
+    types registered so vectors travel in binary and load as numpy arrays.
+    """
+    conn = db.connection().connection.driver_connection
+    if not getattr(conn, "_twinmind_vector_registered", False):
+        register_vector(conn)
+        conn._twinmind_vector_registered = True
+    return conn
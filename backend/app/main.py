@@ -1,22 +1,37 @@
+from contextlib import asynccontextmanager
 from pathlib import Path
 
-from fastapi import FastAPI, HTTPException
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 
 from app.api.chat import router as chat_router
 from app.api.ingest import router as ingest_router
-from dotenv import load_dotenv
+from app.services import metrics, tracing
+from app.services.ai_provider import aclose_async_clients
 
-load_dotenv()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await aclose_async_clients()
+    tracing.shutdown()
 
-app = FastAPI(title="TwinMind Second Brain prototype project")
+app = FastAPI(title="TwinMind Second Brain prototype project", lifespan=lifespan)
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
 app.include_router(ingest_router)
 app.include_router(chat_router)
 app.add_middleware(
@@ -0,0 +1,101 @@
+"""
+Management commands.
+
+    python -m app.manage ann-indexes list
+    python -m app.manage ann-indexes sync [--method hnsw|ivfflat]
+    python -m app.manage ann-indexes create --model nomic-embed-text --dims 768 [--method hnsw]
+    python -m app.manage ann-indexes drop --model nomic-embed-text --dims 768 [--method hnsw]
+    python -m app.manage ann-indexes sync --kind halfvec|bit   (indexes on the compact copies)
+    python -m app.manage compact-vectors backfill --kind halfvec|bit [--batch 5000]
+    python -m app.manage compact-vectors status
+"""
+import argparse
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+load_dotenv()
+
+from app.db.session import engine  # noqa: E402
+from app.services import ann_index, compact_vectors  # noqa: E402
+
+
+def _autocommit():
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction block.
+    return engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+
+
+def ann_indexes(args) -> None:
+    with _autocommit() as conn:
+        if args.action == "list":
+            for row in ann_index.list_indexes(conn):
+                print(f"{row['indexname']}\n    {row['indexdef']}")
+            return
+
+        if args.action == "sync":
+            pairs = conn.execute(text("SELECT DISTINCT model, dims FROM embeddings ORDER BY model, dims")).all()
+        else:
+            if not args.model or not args.dims:
+                raise SystemExit("--model and --dims are required")
+            pairs = [(args.model, args.dims)]
+
+        for model, dims in pairs:
+            if args.action == "drop":
+                sql = ann_index.drop_index_sql(model, dims, args.method, concurrently=True, kind=args.kind)
+            else:
+                sql = ann_index.create_index_sql(
+                    model, dims, args.method, concurrently=True, lists=args.lists, kind=args.kind
+                )
+            print(sql)
+            conn.execute(text(sql))
+
+
+def compact(args) -> None:
+    if args.action == "status":
+        with engine.connect() as conn:
+            row = conn.execute(text(
+                "SELECT count(*) AS total, count(embedding_half) AS halfvec, count(embedding_bit) AS bit FROM embeddings"
+            )).mappings().one()
+        print(", ".join(f"{k}: {v}" for k, v in row.items()))
+        return
+
+    # Batches of --batch rows, each its own transaction, so the backfill can
+    # run against a live database and be stopped/resumed at any point.
+    sql = text(compact_vectors.backfill_sql(args.kind))
+    done, started = 0, time.monotonic()
+    while True:
+        with engine.begin() as conn:
+            n = conn.execute(sql, {"batch": args.batch}).rowcount
+        if not n:
+            break
+        done += n
+        print(f"{args.kind}: {done} rows ({done / (time.monotonic() - started):.0f}/s)")
+    print(f"{args.kind}: backfill complete, {done} rows")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(prog="python -m app.manage")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("ann-indexes", help="manage per-(model, dims) ANN indexes on embeddings")
+    p.add_argument("action", choices=["list", "sync", "create", "drop"])
+    p.add_argument("--model")
+    p.add_argument("--dims", type=int)
+    p.add_argument("--method", choices=ann_index.METHODS, default="hnsw")
+    p.add_argument("--lists", type=int, help="ivfflat lists (default IVFFLAT_LISTS or 100)")
+    p.add_argument("--kind", choices=ann_index.KINDS, default="embedding", help="column to index")
+    p.set_defaults(func=ann_indexes)
+
+    p = sub.add_parser("compact-vectors", help="fill the compact halfvec/bit copies of existing embeddings")
+    p.add_argument("action", choices=["backfill", "status"])
+    p.add_argument("--kind", choices=compact_vectors.KINDS, default="halfvec")
+    p.add_argument("--batch", type=int, default=5000)
+    p.set_defaults(func=compact)
+
+    args = ap.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
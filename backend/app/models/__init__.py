@@ -1 +1 @@
-from .memory import Artifact, IngestionJob, Document, Chunk, Embedding 
\ No newline at end of file
+from .memory import Artifact, IngestionJob, Document, Chunk, Embedding, EmbeddingCacheEntry 
\ No newline at end of file
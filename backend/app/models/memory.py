@@ -1,10 +1,10 @@
 import uuid
 from sqlalchemy import (
-    Column, String, Text, Integer, DateTime, ForeignKey, JSON, func
+    BigInteger, Column, Computed, String, Text, Integer, DateTime, ForeignKey, Index, JSON, func
 )
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import BIT, TSVECTOR, UUID
 from sqlalchemy.orm import relationship
-from pgvector.sqlalchemy import Vector
+from pgvector.sqlalchemy import HALFVEC, Vector
 from app.db.base import Base
 
 class Artifact(Base):
@@ -33,6 +33,11 @@ class IngestionJob(Base):
     error_message = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+    # seconds per stage (fetch/extract/chunk/embed/persist), summed over attempts
+    stage_seconds = Column(JSON, nullable=True)
+    byte_count = Column(BigInteger, nullable=True)  # source bytes: fetched page or uploaded file
+    chunk_count = Column(Integer, nullable=True)  # chunks embedded and written (not kept ones)
+    token_count = Column(Integer, nullable=True)  # tokens of those chunks
 
     artifact = relationship("Artifact", back_populates="jobs")
 
@@ -68,10 +73,17 @@ class Chunk(Base):
     time_start_ms = Column(Integer, nullable=True)
     time_end_ms = Column(Integer, nullable=True)
     meta = Column("metadata", JSON, nullable=True)
+    content_hash = Column(Text, nullable=True)  # sha256 of content, for incremental re-ingest
+    content_tsv = Column(TSVECTOR, Computed("to_tsvector('english', content)", persisted=True))
 
     document = relationship("Document", back_populates="chunks")
     embedding = relationship("Embedding", back_populates="chunk", uselist=False, cascade="all,delete-orphan")
 
+    __table_args__ = (
+        Index("ix_chunks_content_tsv", "content_tsv", postgresql_using="gin"),
+        Index("ix_chunks_user_captured", "user_id", "captured_at"),
+    )
+
 
 class Embedding(Base):
     __tablename__ = "embeddings"
@@ -82,5 +94,25 @@ class Embedding(Base):
     dims = Column(Integer, nullable=False)
     embedding = Column(Vector(), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # denormalized from documents/chunks so filtered vector search needs no join
+    source_type = Column(String, nullable=True)
+    captured_at = Column(DateTime(timezone=True), nullable=True)
+    # compact copies for coarse search (app.services.compact_vectors)
+    embedding_half = Column(HALFVEC(), nullable=True)
+    embedding_bit = Column(BIT(varying=True), nullable=True)
 
     chunk = relationship("Chunk", back_populates="embedding")
+
+    __table_args__ = (
+        Index("ix_embeddings_user_captured", "user_id", "captured_at"),
+    )
+
+
+class EmbeddingCacheEntry(Base):
+    __tablename__ = "embedding_cache"
+
+    content_hash = Column(String(64), primary_key=True)  # sha256 of normalized chunk text
+    model = Column(Text, primary_key=True)
+    dims = Column(Integer, primary_key=True)
+    embedding = Column(Vector(), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -1,8 +1,17 @@
 # app/services/ai_provider.py
+import asyncio
+import hashlib
+import json
 import os
-from typing import List, Tuple
+import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
 import httpx
-from openai import OpenAI
+import numpy as np
+from openai import AsyncOpenAI, OpenAI
+
+from app.services.rate_limit import estimate_tokens, get_scheduler
 
 def vector_to_pgvector_literal(vec: list[float]) -> str:
     return "[" + ",".join(f"{x:.6f}" for x in vec) + "]"
@@ -14,61 +23,212 @@ class LLM:
     def chat(self, prompt: str) -> str:
         raise NotImplementedError
 
+    def stream_chat(self, prompt: str, system: Optional[str] = None) -> Iterator[str]:
+        raise NotImplementedError
+
+class AsyncEmbedder:
+    async def embed_texts(self, texts: List[str]) -> Tuple[List[List[float]], int, str]:
+        raise NotImplementedError
+
+class AsyncLLM:
+    async def chat(self, prompt: str, system: Optional[str] = None) -> str:
+        raise NotImplementedError
+
+    def stream_chat(self, prompt: str, system: Optional[str] = None) -> AsyncIterator[str]:
+        """Async iterator over answer text deltas."""
+        raise NotImplementedError
+
+def _messages(prompt: str, system: Optional[str]) -> list:
+    messages = [{"role": "system", "content": system}] if system else []
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+def _ollama_generate_payload(model: str, prompt: str, system: Optional[str], stream: bool) -> dict:
+    payload = {"model": model, "prompt": prompt, "stream": stream}
+    if system:
+        payload["system"] = system
+    return payload
+
+def _ollama_stream_lines(lines) -> Iterator[str]:
+    # /api/generate with stream=true emits NDJSON: {"response": "...", "done": false}
+    for line in lines:
+        if not line:
+            continue
+        part = json.loads(line)
+        if part.get("response"):
+            yield part["response"]
+        if part.get("done"):
+            return
+
+_http_clients: dict = {}
+
+
+def get_http_client(timeout: float = 60.0) -> httpx.Client:
+    # One pooled client per worker process; Celery forks after import, so key on pid.
+    key = (os.getpid(), timeout)
+    client = _http_clients.get(key)
+    if client is None:
+        client = httpx.Client(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "32")),
+                max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "16")),
+            ),
+        )
+        _http_clients[key] = client
+    return client
+
+
+_openai_clients: dict = {}
+
+
+def get_openai_client() -> OpenAI:
+    # Shared per process like the httpx pools. SDK retries are off: 429s and
+    # transient errors are retried by the provider scheduler (rate_limit.py),
+    # which also backs off every worker when one of them gets rate limited.
+    client = _openai_clients.get(os.getpid())
+    if client is None:
+        client = OpenAI(api_key=os.environ["OPENAI_API_KEY"], max_retries=0)
+        _openai_clients[os.getpid()] = client
+    return client
+
+
 class OllamaEmbedder(Embedder):
     def __init__(self):
         self.base = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
         self.model = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+        self.batch_size = max(1, int(os.getenv("OLLAMA_EMBED_BATCH_SIZE", "32")))
+        self.concurrency = max(1, int(os.getenv("OLLAMA_EMBED_CONCURRENCY", "4")))
+        self.client = get_http_client(timeout=120.0)
+
+    def _post(self, batch: List[str]) -> httpx.Response:
+        r = self.client.post(f"{self.base}/api/embed", json={"model": self.model, "input": batch})
+        r.raise_for_status()
+        return r
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        r = get_scheduler("embed").run(lambda: self._post(batch), tokens=estimate_tokens(batch))
+        vecs = r.json()["embeddings"]
+        if len(vecs) != len(batch):
+            raise RuntimeError(f"Ollama returned {len(vecs)} embeddings for {len(batch)} inputs")
+        return vecs
 
     def embed_texts(self, texts: List[str]):
-        vecs = []
-        for t in texts:
-            r = httpx.post(f"{self.base}/api/embeddings", json={"model": self.model, "prompt": t}, timeout=60.0)
-            r.raise_for_status()
-            vecs.append(r.json()["embedding"])
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) <= 1 or self.concurrency == 1:
+            results = [self._embed_batch(b) for b in batches]
+        else:
+            # map() keeps input order; at most `concurrency` batches in flight.
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches))) as pool:
+                results = list(pool.map(self._embed_batch, batches))
+        vecs = [v for batch in results for v in batch]
         return vecs, (len(vecs[0]) if vecs else 0), self.model
 
 class OpenAIEmbedder(Embedder):
     def __init__(self):
-        self.client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+        self.client = get_openai_client()
         self.model = os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small")
 
     def embed_texts(self, texts: List[str]):
-        resp = self.client.embeddings.create(model=self.model, input=texts)
+        resp = get_scheduler("embed").run(
+            lambda: self.client.embeddings.create(model=self.model, input=texts),
+            tokens=estimate_tokens(texts),
+        )
         vecs = [d.embedding for d in resp.data]
         return vecs, (len(vecs[0]) if vecs else 0), self.model
 
+_WORD_RE = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=65536)
+def _fake_word_vector(word: str, dims: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+    return np.random.default_rng(seed).standard_normal(dims).astype(np.float32)
+
+
+class FakeEmbedder(Embedder):
+    """
+    Deterministic offline embedder (EMBEDDING_PROVIDER=fake) for benchmarks and
+    provider-less runs: every word gets a fixed pseudo-random vector seeded by
+    its hash and a text is the normalized sum of its words, so texts sharing
+    words land close together. FAKE_EMBED_DIMS sets the width (default 768).
+    """
+
+    def __init__(self):
+        self.dims = int(os.getenv("FAKE_EMBED_DIMS", "768"))
+        self.model = f"fake-embed-{self.dims}"
+
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dims), dtype=np.float32)
+        for i, t in enumerate(texts):
+            for word in _WORD_RE.findall(t.lower()) or [""]:
+                out[i] += _fake_word_vector(word, self.dims)
+        return out / np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+
+    def embed_texts(self, texts: List[str]):
+        return self.embed_array(texts).tolist(), self.dims, self.model
+
 class OpenAILLM(LLM):
     def __init__(self):
-        self.client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+        self.client = get_openai_client()
         self.model = os.getenv("OPENAI_CHAT_MODEL", "gpt-4.1-mini")
 
     def chat(self, prompt: str) -> str:
-        resp = self.client.chat.completions.create(
-            model=self.model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2,
+        resp = get_scheduler("chat").run(
+            lambda: self.client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.2,
+            ),
+            tokens=estimate_tokens([prompt]),
         )
         return resp.choices[0].message.content.strip()
 
+    def stream_chat(self, prompt: str, system: Optional[str] = None) -> Iterator[str]:
+        # scheduled (and retried) up to the response headers; the stream itself is not
+        stream = get_scheduler("chat").run(
+            lambda: self.client.chat.completions.create(
+                model=self.model,
+                messages=_messages(prompt, system),
+                temperature=0.2,
+                stream=True,
+            ),
+            tokens=estimate_tokens([prompt, system or ""]),
+        )
+        for event in stream:
+            if event.choices and event.choices[0].delta.content:
+                yield event.choices[0].delta.content
+
 class OllamaLLM(LLM):
     def __init__(self):
         self.base = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
         self.model = os.getenv("OLLAMA_CHAT_MODEL", "llama3.1")
 
-    def chat(self, prompt: str) -> str:
-        r = httpx.post(
+    def _generate(self, prompt: str) -> httpx.Response:
+        r = get_http_client(timeout=120.0).post(
             f"{self.base}/api/generate",
             json={"model": self.model, "prompt": prompt, "stream": False},
-            timeout=120.0,
         )
         r.raise_for_status()
+        return r
+
+    def chat(self, prompt: str) -> str:
+        r = get_scheduler("chat").run(lambda: self._generate(prompt), tokens=estimate_tokens([prompt]))
         return r.json().get("response", "")
 
+    def stream_chat(self, prompt: str, system: Optional[str] = None) -> Iterator[str]:
+        payload = _ollama_generate_payload(self.model, prompt, system, stream=True)
+        with get_http_client(timeout=120.0).stream("POST", f"{self.base}/api/generate", json=payload) as r:
+            r.raise_for_status()
+            yield from _ollama_stream_lines(r.iter_lines())
+
 def get_embedder() -> Embedder:
     # Hybrid default: Ollama embeddings (384) ALWAYS
     provider = os.getenv("EMBEDDING_PROVIDER", "ollama").lower()
     if provider == "openai":
         return OpenAIEmbedder()
+    if provider == "fake":
+        return FakeEmbedder()
     return OllamaEmbedder()
 
 def get_llm() -> LLM:
@@ -76,3 +236,162 @@ def get_llm() -> LLM:
     if provider == "ollama":
         return OllamaLLM()
     return OpenAILLM()
+
+
+# --- async providers (used by the API event loop) ---
+
+_async_http_clients: dict = {}
+_async_openai_clients: dict = {}
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    # Shared per process: the API runs a single event loop.
+    client = _async_http_clients.get(os.getpid())
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=120.0,
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "32")),
+                max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "16")),
+            ),
+        )
+        _async_http_clients[os.getpid()] = client
+    return client
+
+
+def get_async_openai_client() -> AsyncOpenAI:
+    client = _async_openai_clients.get(os.getpid())
+    if client is None:
+        client = AsyncOpenAI(api_key=os.environ["OPENAI_API_KEY"], max_retries=0)
+        _async_openai_clients[os.getpid()] = client
+    return client
+
+
+async def aclose_async_clients() -> None:
+    for client in _async_http_clients.values():
+        await client.aclose()
+    for client in _async_openai_clients.values():
+        await client.close()
+    _async_http_clients.clear()
+    _async_openai_clients.clear()
+
+
+class AsyncOllamaEmbedder(AsyncEmbedder):
+    def __init__(self):
+        self.base = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+        self.model = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+        self.batch_size = max(1, int(os.getenv("OLLAMA_EMBED_BATCH_SIZE", "32")))
+        self.concurrency = max(1, int(os.getenv("OLLAMA_EMBED_CONCURRENCY", "4")))
+        self.client = get_async_http_client()
+
+    async def _post(self, batch: List[str]) -> httpx.Response:
+        r = await self.client.post(f"{self.base}/api/embed", json={"model": self.model, "input": batch})
+        r.raise_for_status()
+        return r
+
+    async def _embed_batch(self, batch: List[str], sem: asyncio.Semaphore) -> List[List[float]]:
+        async with sem:
+            r = await get_scheduler("embed").arun(lambda: self._post(batch), tokens=estimate_tokens(batch))
+        vecs = r.json()["embeddings"]
+        if len(vecs) != len(batch):
+            raise RuntimeError(f"Ollama returned {len(vecs)} embeddings for {len(batch)} inputs")
+        return vecs
+
+    async def embed_texts(self, texts: List[str]):
+        sem = asyncio.Semaphore(self.concurrency)
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = await asyncio.gather(*(self._embed_batch(b, sem) for b in batches))
+        vecs = [v for batch in results for v in batch]
+        return vecs, (len(vecs[0]) if vecs else 0), self.model
+
+class AsyncOpenAIEmbedder(AsyncEmbedder):
+    def __init__(self):
+        self.client = get_async_openai_client()
+        self.model = os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small")
+
+    async def embed_texts(self, texts: List[str]):
+        resp = await get_scheduler("embed").arun(
+            lambda: self.client.embeddings.create(model=self.model, input=texts),
+            tokens=estimate_tokens(texts),
+        )
+        vecs = [d.embedding for d in resp.data]
+        return vecs, (len(vecs[0]) if vecs else 0), self.model
+
+class AsyncFakeEmbedder(AsyncEmbedder):
+    def __init__(self):
+        self.inner = FakeEmbedder()
+        self.model = self.inner.model
+
+    async def embed_texts(self, texts: List[str]):
+        return self.inner.embed_texts(texts)
+
+class AsyncOpenAILLM(AsyncLLM):
+    def __init__(self):
+        self.client = get_async_openai_client()
+        self.model = os.getenv("OPENAI_CHAT_MODEL", "gpt-4.1-mini")
+
+    async def chat(self, prompt: str, system: Optional[str] = None) -> str:
+        resp = await get_scheduler("chat").arun(
+            lambda: self.client.chat.completions.create(
+                model=self.model,
+                messages=_messages(prompt, system),
+                temperature=0.2,
+            ),
+            tokens=estimate_tokens([prompt, system or ""]),
+        )
+        return resp.choices[0].message.content.strip()
+
+    async def stream_chat(self, prompt: str, system: Optional[str] = None) -> AsyncIterator[str]:
+        # scheduled (and retried) up to the response headers; the stream itself is not
+        stream = await get_scheduler("chat").arun(
+            lambda: self.client.chat.completions.create(
+                model=self.model,
+                messages=_messages(prompt, system),
+                temperature=0.2,
+                stream=True,
+            ),
+            tokens=estimate_tokens([prompt, system or ""]),
+        )
+        async for event in stream:
+            if event.choices and event.choices[0].delta.content:
+                yield event.choices[0].delta.content
+
+class AsyncOllamaLLM(AsyncLLM):
+    def __init__(self):
+        self.base = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+        self.model = os.getenv("OLLAMA_CHAT_MODEL", "llama3.1")
+        self.client = get_async_http_client()
+
+    async def _generate(self, payload: dict) -> httpx.Response:
+        r = await self.client.post(f"{self.base}/api/generate", json=payload)
+        r.raise_for_status()
+        return r
+
+    async def chat(self, prompt: str, system: Optional[str] = None) -> str:
+        payload = _ollama_generate_payload(self.model, prompt, system, stream=False)
+        r = await get_scheduler("chat").arun(
+            lambda: self._generate(payload), tokens=estimate_tokens([prompt, system or ""])
+        )
+        return r.json().get("response", "")
+
+    async def stream_chat(self, prompt: str, system: Optional[str] = None) -> AsyncIterator[str]:
+        payload = _ollama_generate_payload(self.model, prompt, system, stream=True)
+        async with self.client.stream("POST", f"{self.base}/api/generate", json=payload) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                for text in _ollama_stream_lines([line]):
+                    yield text
+
+def get_async_embedder() -> AsyncEmbedder:
+    provider = os.getenv("EMBEDDING_PROVIDER", "ollama").lower()
+    if provider == "openai":
+        return AsyncOpenAIEmbedder()
+    if provider == "fake":
+        return AsyncFakeEmbedder()
+    return AsyncOllamaEmbedder()
+
+def get_async_llm() -> AsyncLLM:
+    provider = os.getenv("LLM_PROVIDER", "openai").lower()
+    if provider == "ollama":
+        return AsyncOllamaLLM()
+    return AsyncOpenAILLM()
@@ -0,0 +1,101 @@
+# app/services/ann_index.py
+import os
+import re
+from typing import List, Optional
+
+from sqlalchemy import text
+
+from app.services import compact_vectors
+
+# pgvector can index `vector` up to 2000 dims; wider models are indexed as halfvec (<= 4000).
+MAX_VECTOR_INDEX_DIMS = 2000
+MAX_HALFVEC_INDEX_DIMS = 4000
+METHODS = ("hnsw", "ivfflat")
+# which column an index covers: the full vector, or a compact copy (compact_vectors)
+KINDS = ("embedding",) + compact_vectors.KINDS
+
+
+def sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def indexable(dims: int, kind: str = "embedding") -> bool:
+    limit = MAX_HALFVEC_INDEX_DIMS if kind == "embedding" else compact_vectors.MAX_INDEX_DIMS[kind]
+    return 0 < dims <= limit
+
+
+def cast_type(dims: int) -> str:
+    return f"halfvec({int(dims)})" if dims > MAX_VECTOR_INDEX_DIMS else f"vector({int(dims)})"
+
+
+def ann_expr(dims: int, column: str = "embedding") -> str:
+    """
+    The expression the per-dimension indexes are built on. Retrieval must
+    order by exactly this expression for the planner to pick the index.
+    """
+    return f"({column}::{cast_type(dims)})"
+
+
+def query_expr(dims: int, param: str = ":qvec") -> str:
+    return f"({param})::{cast_type(dims)}"
+
+
+def index_predicate(model: str, dims: int, alias: Optional[str] = None) -> str:
+    # Inlined as literals: partial indexes are only matched against constants,
+    # not bind parameters under a generic plan.
+    p = f"{alias}." if alias else ""
+    return f"{p}model = {sql_literal(model)} AND {p}dims = {int(dims)}"
+
+
+def index_name(model: str, dims: int, method: str, kind: str = "embedding") -> str:
+    slug = re.sub(r"[^a-z0-9]+", "_", model.lower()).strip("_")
+    prefix = "ix_embeddings" if kind == "embedding" else f"ix_embeddings_{kind}"
+    name = f"{prefix}_{method}_{int(dims)}_{slug}"
+    return name[:63]
+
+
+def create_index_sql(
+    model: str,
+    dims: int,
+    method: str = "hnsw",
+    concurrently: bool = False,
+    lists: Optional[int] = None,
+    kind: str = "embedding",
+) -> str:
+    if method not in METHODS:
+        raise ValueError(f"unknown ANN method {method!r}, expected one of {METHODS}")
+    if kind not in KINDS:
+        raise ValueError(f"unknown index kind {kind!r}, expected one of {KINDS}")
+    if not indexable(dims, kind):
+        raise ValueError(f"pgvector cannot index {dims}-dim {kind} values")
+    if kind == "embedding":
+        expr = ann_expr(dims)
+        opclass = ("halfvec" if dims > MAX_VECTOR_INDEX_DIMS else "vector") + "_cosine_ops"
+    else:
+        expr = compact_vectors.column_expr(kind, dims)
+        opclass = compact_vectors.OPCLASSES[kind]
+    if method == "hnsw":
+        m = int(os.getenv("HNSW_M", "16"))
+        ef_construction = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+        with_ = f"m = {m}, ef_construction = {ef_construction}"
+    else:
+        with_ = f"lists = {int(lists or os.getenv('IVFFLAT_LISTS', '100'))}"
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {index_name(model, dims, method, kind)} "
+        f"ON embeddings USING {method} ({expr} {opclass}) WITH ({with_}) "
+        f"WHERE {index_predicate(model, dims)}"
+    )
+
+
+def drop_index_sql(model: str, dims: int, method: str = "hnsw", concurrently: bool = False, kind: str = "embedding") -> str:
+    return f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS {index_name(model, dims, method, kind)}"
+
+
+def list_indexes(conn) -> List[dict]:
+    rows = conn.execute(text("""
+        SELECT indexname, indexdef FROM pg_indexes
+        WHERE tablename = 'embeddings'
+          AND (indexname ~ '^ix_embeddings_((halfvec|bit)_)?(hnsw|ivfflat)_')
+        ORDER BY indexname
+    """)).mappings().all()
+    return [dict(r) for r in rows]
@@ -0,0 +1,88 @@
+# app/services/blob_store.py
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Optional, Tuple
+
+from app.core.config import settings
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class BlobStore:
+    def put(self, key: str, stream: BinaryIO) -> Tuple[int, str]:
+        """Streams `stream` into the store; returns (size in bytes, sha256 hex)."""
+        raise NotImplementedError
+
+    def open(self, key: str) -> BinaryIO:
+        raise NotImplementedError
+
+    def size(self, key: str) -> int:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+
+class LocalBlobStore(BlobStore):
+    """Blobs as files under `root`; API and workers must share the directory."""
+
+    def __init__(self, root: str):
+        self.root = Path(root).resolve()
+
+    def path(self, key: str) -> Path:
+        p = (self.root / key).resolve()
+        if self.root not in p.parents:
+            raise ValueError(f"object key escapes blob dir: {key!r}")
+        return p
+
+    def put(self, key: str, stream: BinaryIO) -> Tuple[int, str]:
+        dest = self.path(key)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(dest.name + ".part")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp, "wb") as out:
+                while True:
+                    buf = stream.read(CHUNK_SIZE)
+                    if not buf:
+                        break
+                    out.write(buf)
+                    digest.update(buf)
+                    size += len(buf)
+            os.replace(tmp, dest)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        return size, digest.hexdigest()
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.path(key), "rb")
+
+    def size(self, key: str) -> int:
+        return self.path(key).stat().st_size
+
+    def delete(self, key: str) -> None:
+        self.path(key).unlink(missing_ok=True)
+
+
+_store: Optional[BlobStore] = None
+
+
+def get_blob_store() -> BlobStore:
+    global _store
+    if _store is None:
+        mode = settings.object_store_mode.lower()
+        if mode != "local":
+            raise RuntimeError(f"OBJECT_STORE_MODE={mode!r} is not supported (only 'local')")
+        _store = LocalBlobStore(settings.local_blob_dir)
+    return _store
+
+
+def new_object_key(user_id: str, filename: Optional[str] = None) -> str:
+    ext = ""
+    if filename and "." in filename:
+        ext = "." + "".join(ch for ch in filename.rsplit(".", 1)[1].lower()[:8] if ch.isalnum())
+    return f"{user_id}/{uuid.uuid4().hex}{ext.rstrip('.')}"
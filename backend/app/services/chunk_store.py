@@ -0,0 +1,203 @@
+# app/services/chunk_store.py
+import hashlib
+import json
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.db.session import raw_connection
+from app.services import compact_vectors
+
+# Column order must match the type lists below.
+CHUNK_COLUMNS = (
+    "id", "document_id", "user_id", "chunk_index", "content", "token_count",
+    "char_start", "char_end", "captured_at", "time_start_ms", "time_end_ms", "metadata",
+    "content_hash",
+)
+CHUNK_TYPES = [
+    "uuid", "uuid", "uuid", "int4", "text", "int4",
+    "int4", "int4", "timestamptz", "int4", "int4", "jsonb",
+    "text",
+]
+
+# chunk fields that may move when surrounding content changes; compared on re-ingest
+_POSITION_FIELDS = ("chunk_index", "token_count", "char_start", "char_end", "time_start_ms", "time_end_ms")
+
+EMBEDDING_COLUMNS = ("chunk_id", "user_id", "model", "dims", "embedding", "source_type", "captured_at")
+EMBEDDING_TYPES = ["uuid", "uuid", "text", "int4", "vector", "text", "timestamptz"]
+
+ChunkInput = Union[str, Dict[str, Any]]
+
+
+def chunk_hash(content: str) -> str:
+    # Exact content: a kept row must hold the same text the new chunk would.
+    # Same as the SQL backfill: encode(sha256(convert_to(content, 'UTF8')), 'hex').
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _as_row(chunk: ChunkInput) -> Dict[str, Any]:
+    if isinstance(chunk, str):
+        return {"content": chunk}
+    return chunk
+
+
+def bulk_insert_chunks(
+    db: Session,
+    document_id: uuid.UUID,
+    user_id: uuid.UUID,
+    captured_at: Optional[datetime],
+    chunks: Sequence[ChunkInput],
+    vectors: Sequence[Sequence[float]],
+    dims: int,
+    model: str,
+    start_index: int = 0,
+    source_type: Optional[str] = None,
+) -> List[uuid.UUID]:
+    """
+    Writes all chunks + embeddings of a document with two binary COPYs.
+    Chunk ids are generated client-side so embeddings can reference them
+    without a round-trip per row. `chunks` are plain strings or dicts with
+    any of content/token_count/char_start/char_end/time_start_ms/time_end_ms/meta
+    (and chunk_index, which otherwise is start_index + position).
+    source_type and captured_at are copied onto the embeddings for filtered search,
+    and the COMPACT_VECTORS forms are written next to the full vector.
+    Returns the new chunk ids in input order.
+    """
+    if len(chunks) != len(vectors):
+        raise ValueError(f"got {len(chunks)} chunks but {len(vectors)} vectors")
+    if not chunks:
+        return []
+
+    rows = [_as_row(c) for c in chunks]
+    ids = [uuid.uuid4() for _ in rows]
+    # Same connection (and transaction) the session is using, so the COPY
+    # commits or rolls back together with the Document row.
+    conn = raw_connection(db)
+
+    with conn.cursor() as cur:
+        with cur.copy(
+            f"COPY chunks ({', '.join(CHUNK_COLUMNS)}) FROM STDIN WITH (FORMAT BINARY)"
+        ) as copy:
+            copy.set_types(CHUNK_TYPES)
+            for i, (chunk_id, row) in enumerate(zip(ids, rows)):
+                copy.write_row((
+                    chunk_id,
+                    document_id,
+                    user_id,
+                    row.get("chunk_index", start_index + i),
+                    row["content"],
+                    row.get("token_count"),
+                    row.get("char_start"),
+                    row.get("char_end"),
+                    captured_at,
+                    row.get("time_start_ms"),
+                    row.get("time_end_ms"),
+                    row.get("meta"),
+                    row.get("content_hash") or chunk_hash(row["content"]),
+                ))
+
+        compact = compact_vectors.write_kinds()
+        extra = compact_vectors.copy_columns(compact)
+        with cur.copy(
+            f"COPY embeddings ({', '.join(EMBEDDING_COLUMNS + tuple(extra))}) FROM STDIN WITH (FORMAT BINARY)"
+        ) as copy:
+            copy.set_types(EMBEDDING_TYPES + list(extra.values()))
+            for chunk_id, vec in zip(ids, vectors):
+                vec = np.asarray(vec, dtype=np.float32)
+                copy.write_row((
+                    chunk_id, user_id, model, dims, vec, source_type, captured_at,
+                    *(compact_vectors.encode(kind, vec) for kind in compact),
+                ))
+
+    return ids
+
+
+def delete_documents(db: Session, document_ids: Sequence[uuid.UUID]) -> None:
+    """Removes documents with their chunks and embeddings (no FK cascades in the schema)."""
+    if not document_ids:
+        return
+    ids = list(document_ids)
+    db.execute(text(
+        "DELETE FROM embeddings WHERE chunk_id IN (SELECT id FROM chunks WHERE document_id = ANY(:ids))"
+    ), {"ids": ids})
+    db.execute(text("DELETE FROM chunks WHERE document_id = ANY(:ids)"), {"ids": ids})
+    db.execute(text("DELETE FROM documents WHERE id = ANY(:ids)"), {"ids": ids})
+
+
+class ChunkDiff:
+    """
+    Incremental re-ingest of an existing document. route() passes through only
+    chunks whose content hash has no unused match among the document's current
+    chunks (those need embedding and insertion); apply() then renumbers the
+    matched rows and deletes the unmatched ones, keeping their embeddings.
+    Only chunks embedded with (model, dims) can match: after a provider or
+    model switch, re-ingesting replaces the old vectors instead of keeping
+    chunks that retrieval for the new model cannot see. Everything runs in
+    the caller's transaction.
+    """
+
+    def __init__(self, db: Session, document_id: uuid.UUID, model: str, dims: int):
+        self.db = db
+        self.document_id = document_id
+        self._existing: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._updates: List[Dict[str, Any]] = []
+        self._stale: List[uuid.UUID] = []  # rows with no embedding for (model, dims)
+        self.kept = 0
+        self.added = 0
+        self.deleted = 0
+
+        rows = db.execute(text(f"""
+            SELECT c.id, c.content, c.content_hash, c.metadata,
+              {", ".join("c." + f for f in _POSITION_FIELDS)},
+              (e.chunk_id IS NOT NULL) AS current
+            FROM chunks c
+            LEFT JOIN embeddings e ON e.chunk_id = c.id AND e.model = :model AND e.dims = :dims
+            WHERE c.document_id = :doc
+            ORDER BY c.chunk_index
+        """), {"doc": document_id, "model": model, "dims": dims}).mappings()
+        for row in rows:
+            if not row["current"]:
+                # embedded with another model (or not at all): delete and embed afresh
+                self._stale.append(row["id"])
+                continue
+            # rows written before content_hash existed and were never backfilled
+            h = row["content_hash"] or chunk_hash(row["content"])
+            self._existing.setdefault(h, deque()).append({k: v for k, v in row.items() if k != "current"})
+
+    def route(self, chunks: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        for i, chunk in enumerate(chunks):
+            chunk["chunk_index"] = i
+            chunk["content_hash"] = h = chunk_hash(chunk["content"])
+            matches = self._existing.get(h)
+            if not matches:
+                self.added += 1
+                yield chunk
+                continue
+            old = matches.popleft()
+            self.kept += 1
+            if any(old[f] != chunk.get(f) for f in _POSITION_FIELDS) or old["metadata"] != chunk.get("meta"):
+                self._updates.append({
+                    "id": old["id"],
+                    **{f: chunk.get(f) for f in _POSITION_FIELDS},
+                    "meta": chunk.get("meta"),
+                })
+
+    def apply(self) -> None:
+        if self._updates:
+            assignments = ", ".join(f"{f} = :{f}" for f in _POSITION_FIELDS)
+            self.db.execute(
+                text(f"UPDATE chunks SET {assignments}, metadata = CAST(:meta AS jsonb) WHERE id = :id"),
+                [{**u, "meta": json.dumps(u["meta"]) if u["meta"] is not None else None} for u in self._updates],
+            )
+        stale = self._stale + [row["id"] for rows in self._existing.values() for row in rows]
+        if stale:
+            self.db.execute(text("DELETE FROM embeddings WHERE chunk_id = ANY(:ids)"), {"ids": stale})
+            self.db.execute(text("DELETE FROM chunks WHERE id = ANY(:ids)"), {"ids": stale})
+        self.deleted = len(stale)
+        self._existing.clear()
+        self._stale = []
@@ -0,0 +1,92 @@
+# app/services/compact_vectors.py
+"""
+Compact copies of embeddings.embedding for coarse search:
+
+- "halfvec": float16 (`embedding_half`), half the size, near-identical ranking;
+- "bit": sign bits (`embedding_bit`, binary_quantize), 1/32 the size, ranked
+  by Hamming distance.
+
+A full 768-dim vector (3 KB) is TOASTed out of line while both compact forms
+stay in the heap row, so a coarse scan (and its per-(model, dims) index)
+never touches the full vectors; only the top COMPACT_RESCORE_CANDIDATES are
+read back and reranked exactly. COMPACT_VECTORS lists the forms ingestion
+writes, COMPACT_SEARCH the one retrieval uses; `python -m app.manage
+compact-vectors backfill` fills rows written before.
+"""
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from pgvector import Bit, HalfVector
+
+KINDS = ("halfvec", "bit")
+COLUMNS = {"halfvec": "embedding_half", "bit": "embedding_bit"}
+# COPY types: a `bit` value has the same binary form as the varbit column
+COPY_TYPES = {"halfvec": "halfvec", "bit": "bit"}
+OPCLASSES = {"halfvec": "halfvec_cosine_ops", "bit": "bit_hamming_ops"}
+MAX_INDEX_DIMS = {"halfvec": 4000, "bit": 64000}
+
+
+def _kinds(value: str) -> List[str]:
+    kinds = [k.strip() for k in value.split(",") if k.strip()]
+    for kind in kinds:
+        if kind not in KINDS:
+            raise ValueError(f"unknown compact vector kind {kind!r}, expected one of {KINDS}")
+    return kinds
+
+
+def write_kinds() -> List[str]:
+    """Compact forms ingestion writes next to the full vector (COMPACT_VECTORS)."""
+    return _kinds(os.getenv("COMPACT_VECTORS", ""))
+
+
+def search_kind() -> Optional[str]:
+    """Compact form vector retrieval searches first (COMPACT_SEARCH), or None for exact/ANN on the full vectors."""
+    kinds = _kinds(os.getenv("COMPACT_SEARCH", ""))
+    return kinds[0] if kinds else None
+
+
+def rescore_candidates(top_k: int) -> int:
+    return max(top_k * 4, int(os.getenv("COMPACT_RESCORE_CANDIDATES", "200")))
+
+
+def encode(kind: str, vec: np.ndarray) -> Any:
+    if kind == "halfvec":
+        return HalfVector(vec.astype(np.float16))
+    return Bit(vec > 0)  # same as SQL binary_quantize()
+
+
+def column_expr(kind: str, dims: int, alias: Optional[str] = None) -> str:
+    """The expression the compact indexes are built on; search must order by exactly this."""
+    column = f"{alias}.{COLUMNS[kind]}" if alias else COLUMNS[kind]
+    return f"({column}::{'halfvec' if kind == 'halfvec' else 'bit'}({int(dims)}))"
+
+
+def query_expr(kind: str, dims: int, param: str = ":qvec") -> str:
+    if kind == "halfvec":
+        return f"({param})::halfvec({int(dims)})"
+    return f"binary_quantize(({param})::vector({int(dims)}))::bit({int(dims)})"
+
+
+def distance_op(kind: str) -> str:
+    return "<=>" if kind == "halfvec" else "<~>"
+
+
+def backfill_sql(kind: str) -> str:
+    # one batch; SKIP LOCKED lets several backfills (or live ingestion) run side by side
+    value = "e.embedding::halfvec" if kind == "halfvec" else "binary_quantize(e.embedding)::varbit"
+    column = COLUMNS[kind]
+    return f"""
+        WITH batch AS (
+          SELECT chunk_id FROM embeddings
+          WHERE {column} IS NULL
+          LIMIT :batch
+          FOR UPDATE SKIP LOCKED
+        )
+        UPDATE embeddings e SET {column} = {value}
+        FROM batch WHERE e.chunk_id = batch.chunk_id
+    """
+
+
+def copy_columns(kinds: Sequence[str]) -> Dict[str, str]:
+    return {COLUMNS[k]: COPY_TYPES[k] for k in kinds}
@@ -0,0 +1,117 @@
+# app/services/embed_batcher.py
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from app.services.ai_provider import Embedder
+
+
+class _Request:
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.enqueued = time.monotonic()
+        self.done = threading.Event()
+        self.vectors: List[List[float]] = []
+        self.dims = 0
+        self.model = ""
+        self.error: Optional[BaseException] = None
+
+
+class MicroBatchingEmbedder(Embedder):
+    """
+    Merges embed_texts() calls made concurrently in this process (jobs on a
+    thread-pool worker, pipelined PDF batches) into shared provider requests.
+    A batch is sent once it holds max_items texts or its oldest caller has
+    waited max_wait seconds; each caller gets back its own slice. Works with
+    any Embedder, since it only relies on embed_texts().
+    """
+
+    def __init__(self, inner: Embedder, max_items: int = 128, max_wait: float = 0.02, concurrency: int = 2):
+        self.inner = inner
+        self.model = inner.model
+        self.max_items = max(1, max_items)
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._pending: List[_Request] = []
+        self._pending_items = 0
+        self.requests = 0  # provider calls made, for stats/benchmarks
+        self._pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="embed-batch")
+        self._thread = threading.Thread(target=self._collect, name="embed-batcher", daemon=True)
+        self._thread.start()
+
+    def embed_texts(self, texts: List[str]) -> Tuple[List[List[float]], int, str]:
+        if not texts or len(texts) >= self.max_items:
+            # already a full request on its own
+            return self.inner.embed_texts(texts)
+        req = _Request(texts)
+        with self._cond:
+            self._pending.append(req)
+            self._pending_items += len(texts)
+            self._cond.notify()
+        req.done.wait()
+        if req.error:
+            raise req.error
+        return req.vectors, req.dims, req.model
+
+    def _collect(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = self._pending[0].enqueued + self.max_wait
+                while self._pending_items < self.max_items:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, n = [], 0
+                while self._pending and (not batch or n + len(self._pending[0].texts) <= self.max_items):
+                    req = self._pending.pop(0)
+                    batch.append(req)
+                    n += len(req.texts)
+                self._pending_items -= n
+            self.requests += 1
+            self._pool.submit(self._send, batch)
+
+    def _send(self, batch: List[_Request]) -> None:
+        texts = [t for req in batch for t in req.texts]
+        try:
+            vectors, dims, model = self.inner.embed_texts(texts)
+            pos = 0
+            for req in batch:
+                req.vectors = vectors[pos:pos + len(req.texts)]
+                req.dims, req.model = dims, model
+                pos += len(req.texts)
+        except BaseException as e:
+            for req in batch:
+                req.error = e
+        finally:
+            for req in batch:
+                req.done.set()
+
+
+_batchers: Dict[Tuple[int, str, str], MicroBatchingEmbedder] = {}
+_lock = threading.Lock()
+
+
+def get_batching_embedder(inner: Embedder) -> MicroBatchingEmbedder:
+    """
+    Process-wide batcher for the configured provider and model (the collector
+    thread does not survive a fork, so key on pid). Sized by
+    EMBED_MICROBATCH_MAX_ITEMS, EMBED_MICROBATCH_MAX_WAIT_MS and
+    EMBED_MICROBATCH_CONCURRENCY.
+    """
+    key = (os.getpid(), type(inner).__name__, inner.model)
+    with _lock:
+        batcher = _batchers.get(key)
+        if batcher is None:
+            batcher = MicroBatchingEmbedder(
+                inner,
+                max_items=int(os.getenv("EMBED_MICROBATCH_MAX_ITEMS", "128")),
+                max_wait=float(os.getenv("EMBED_MICROBATCH_MAX_WAIT_MS", "20")) / 1000,
+                concurrency=int(os.getenv("EMBED_MICROBATCH_CONCURRENCY", "2")),
+            )
+            _batchers[key] = batcher
+        return batcher
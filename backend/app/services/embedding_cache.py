@@ -0,0 +1,216 @@
+# app/services/embedding_cache.py
+import hashlib
+import logging
+import os
+import re
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.core.config import settings
+from app.db.session import engine
+from app.models.memory import EmbeddingCacheEntry
+from app.services.ai_provider import Embedder, get_embedder
+from app.services.embed_batcher import get_batching_embedder
+from app.services.lru import LRUCache
+
+log = logging.getLogger(__name__)
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_text(t: str) -> str:
+    return _WS.sub(" ", unicodedata.normalize("NFC", t)).strip()
+
+
+def content_hash(t: str) -> str:
+    return hashlib.sha256(normalize_text(t).encode("utf-8")).hexdigest()
+
+
+_lru: Optional[LRUCache] = None
+_redis = None
+# model -> dims, learned from the provider or the Postgres tier
+_model_dims: Dict[str, int] = {}
+
+
+def _get_lru() -> Optional[LRUCache]:
+    global _lru
+    size = int(os.getenv("EMBED_CACHE_LRU_SIZE", "10000"))
+    if size <= 0:
+        return None
+    if _lru is None:
+        _lru = LRUCache(maxsize=size)
+    return _lru
+
+
+def _get_redis():
+    global _redis
+    if os.getenv("EMBED_CACHE_REDIS") != "1":
+        return None
+    if _redis is None:
+        import redis
+
+        _redis = redis.Redis.from_url(settings.redis_url)
+    return _redis
+
+
+def _redis_key(model: str, dims: int, h: str) -> str:
+    return f"emb:{model}:{dims}:{h}"
+
+
+class CachedEmbedder(Embedder):
+    """
+    Content-addressed cache around another Embedder, keyed by
+    (sha256(normalized text), model, dims). Lookup order is in-process LRU,
+    Redis (EMBED_CACHE_REDIS=1), then the `embedding_cache` table; only the
+    remaining misses are sent to the wrapped provider. Cache tiers fail open.
+    """
+
+    def __init__(self, inner: Embedder):
+        self.inner = inner
+        self.model = inner.model
+
+    def embed_texts(self, texts: List[str]):
+        hashes = [content_hash(t) for t in texts]
+        found: Dict[str, List[float]] = {}
+        dims = _model_dims.get(self.model)
+
+        if dims:
+            self._lookup_memory(hashes, dims, found)
+            self._lookup_redis(hashes, dims, found)
+        dims = self._lookup_db(hashes, dims, found) or dims
+
+        # Embed each distinct missing text once.
+        miss_idx: Dict[str, int] = {}
+        for i, h in enumerate(hashes):
+            if h not in found and h not in miss_idx:
+                miss_idx[h] = i
+
+        if miss_idx:
+            miss_texts = [texts[i] for i in miss_idx.values()]
+            vecs, new_dims, model = self.inner.embed_texts(miss_texts)
+            if model != self.model:
+                raise RuntimeError(f"embedder returned model {model!r}, expected {self.model!r}")
+            dims = new_dims
+            _model_dims[self.model] = dims
+            fresh = dict(zip(miss_idx.keys(), vecs))
+            found.update(fresh)
+            self._store(fresh, dims)
+
+        vectors = [found[h] for h in hashes]
+        return vectors, (dims or (len(vectors[0]) if vectors else 0)), self.model
+
+    def _lookup_memory(self, hashes: List[str], dims: int, found: Dict[str, List[float]]) -> None:
+        lru = _get_lru()
+        if lru is None:
+            return
+        for h in hashes:
+            if h not in found:
+                v = lru.get((h, self.model, dims))
+                if v is not None:
+                    found[h] = v
+
+    def _lookup_redis(self, hashes: List[str], dims: int, found: Dict[str, List[float]]) -> None:
+        r = _get_redis()
+        todo = [h for h in dict.fromkeys(hashes) if h not in found]
+        if r is None or not todo:
+            return
+        try:
+            raw = r.mget([_redis_key(self.model, dims, h) for h in todo])
+        except Exception as e:
+            log.warning("embedding cache: redis lookup failed: %s", e)
+            return
+        lru = _get_lru()
+        for h, blob in zip(todo, raw):
+            if blob:
+                vec = np.frombuffer(blob, dtype=np.float32).tolist()
+                found[h] = vec
+                if lru is not None:
+                    lru.set((h, self.model, dims), vec)
+
+    def _lookup_db(self, hashes: List[str], dims: Optional[int], found: Dict[str, List[float]]) -> Optional[int]:
+        todo = [h for h in dict.fromkeys(hashes) if h not in found]
+        if not todo:
+            return None
+        sql = """
+            SELECT content_hash, dims, embedding::real[] AS vec
+            FROM embedding_cache
+            WHERE model = :model AND content_hash = ANY(:hashes)
+        """
+        params = {"model": self.model, "hashes": todo}
+        if dims:
+            sql += " AND dims = :dims"
+            params["dims"] = dims
+        try:
+            with engine.connect() as conn:
+                rows = conn.execute(text(sql), params).all()
+        except Exception as e:
+            log.warning("embedding cache: postgres lookup failed: %s", e)
+            return None
+
+        seen_dims = None
+        lru = _get_lru()
+        for h, row_dims, vec in rows:
+            if seen_dims is not None and row_dims != seen_dims:
+                continue
+            seen_dims = row_dims
+            found[h] = list(vec)
+            if lru is not None:
+                lru.set((h, self.model, row_dims), found[h])
+        if seen_dims:
+            _model_dims.setdefault(self.model, seen_dims)
+        return seen_dims
+
+    def _store(self, fresh: Dict[str, List[float]], dims: int) -> None:
+        lru = _get_lru()
+        if lru is not None:
+            for h, vec in fresh.items():
+                lru.set((h, self.model, dims), vec)
+
+        r = _get_redis()
+        if r is not None:
+            ttl = int(os.getenv("EMBED_CACHE_REDIS_TTL", str(7 * 24 * 3600)))
+            try:
+                pipe = r.pipeline(transaction=False)
+                for h, vec in fresh.items():
+                    pipe.set(_redis_key(self.model, dims, h), np.asarray(vec, dtype=np.float32).tobytes(), ex=ttl)
+                pipe.execute()
+            except Exception as e:
+                log.warning("embedding cache: redis store failed: %s", e)
+
+        rows = [
+            {"content_hash": h, "model": self.model, "dims": dims, "embedding": vec}
+            for h, vec in fresh.items()
+        ]
+        try:
+            with engine.begin() as conn:
+                conn.execute(pg_insert(EmbeddingCacheEntry.__table__).values(rows).on_conflict_do_nothing())
+        except Exception as e:
+            log.warning("embedding cache: postgres store failed: %s", e)
+
+
+def embedding_space(embedder: Optional[Embedder] = None) -> Tuple[str, int]:
+    """
+    (model, dims) that ingestion writes embeddings with now. Providers only
+    report dims with a response, so an unknown model is probed once per
+    process with a one-word request.
+    """
+    embedder = embedder or get_cached_embedder()
+    dims = getattr(embedder, "dims", 0) or _model_dims.get(embedder.model)
+    if not dims:
+        _, dims, _ = embedder.embed_texts(["dimensions"])
+        _model_dims[embedder.model] = dims
+    return embedder.model, dims
+
+
+def get_cached_embedder() -> Embedder:
+    embedder = get_embedder()
+    if os.getenv("EMBED_MICROBATCH") == "1":
+        # cache misses from concurrent jobs share provider requests
+        embedder = get_batching_embedder(embedder)
+    if os.getenv("USE_EMBED_CACHE") == "1":
+        return CachedEmbedder(embedder)
+    return embedder
@@ -0,0 +1,293 @@
+# app/services/hot_tier.py
+"""
+Optional in-process vector tier for recently active users (HOT_TIER=1).
+
+Each (user, model, dims) gets one contiguous float32 matrix of unit-length
+embeddings plus chunk ids, capture times and source types, so a vector query
+is a single matmul + argpartition instead of a pgvector scan (and exact, not
+ANN). Matrices are loaded on a background thread the first time a user
+searches (that search still goes to pgvector) and evicted LRU once they
+exceed HOT_TIER_MAX_MB.
+
+Ingestion publishes the user id on a Redis channel when a job succeeds; the
+API drops that user's matrices and reloads on their next query.
+HOT_TIER_TTL bounds staleness if a message is missed.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+log = logging.getLogger(__name__)
+
+CHANNEL = "twinmind:hot-tier:invalidate"
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_NO_TIME = np.iinfo(np.int64).min  # captured_at NULL
+
+
+def enabled() -> bool:
+    return os.getenv("HOT_TIER") == "1"
+
+
+class HotHit(NamedTuple):
+    chunk_id: str
+    distance: float  # cosine distance, as pgvector's <=>
+    vector: np.ndarray
+
+
+def _ms(d: datetime) -> int:
+    if d.tzinfo is None:
+        d = d.replace(tzinfo=timezone.utc)
+    return int((d - _EPOCH).total_seconds() * 1000)
+
+
+class UserMatrix:
+    def __init__(self, chunk_ids: List[str], vectors: np.ndarray, captured_ms: np.ndarray, source_types: List[str]):
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.vectors = np.ascontiguousarray(vectors / np.maximum(norms, 1e-12), dtype=np.float32)
+        self.chunk_ids = chunk_ids
+        self.captured_ms = captured_ms
+        self.type_names = sorted(set(source_types))
+        codes = {t: i for i, t in enumerate(self.type_names)}
+        self.type_codes = np.asarray([codes[t] for t in source_types], dtype=np.int16)
+        self.loaded_at = time.monotonic()
+
+    @property
+    def nbytes(self) -> int:
+        # ~100 bytes per id string on top of the arrays
+        return self.vectors.nbytes + self.captured_ms.nbytes + self.type_codes.nbytes + 100 * len(self.chunk_ids)
+
+    def _mask(self, after: Optional[datetime], before: Optional[datetime],
+              source_types: Optional[Sequence[str]]) -> Optional[np.ndarray]:
+        mask = None
+        if after is not None:
+            mask = (self.captured_ms >= _ms(after)) & (self.captured_ms != _NO_TIME)
+        if before is not None:
+            m = (self.captured_ms < _ms(before)) & (self.captured_ms != _NO_TIME)
+            mask = m if mask is None else mask & m
+        if source_types:
+            wanted = [i for i, t in enumerate(self.type_names) if t in set(source_types)]
+            m = np.isin(self.type_codes, wanted)
+            mask = m if mask is None else mask & m
+        return mask
+
+    def search(self, qvec: Sequence[float], top_k: int, after: Optional[datetime] = None,
+               before: Optional[datetime] = None, source_types: Optional[Sequence[str]] = None) -> List[HotHit]:
+        q = np.asarray(qvec, dtype=np.float32)
+        q = q / max(float(np.linalg.norm(q)), 1e-12)
+        scores = self.vectors @ q
+        mask = self._mask(after, before, source_types)
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+            top_k = min(top_k, int(mask.sum()))
+        top_k = min(top_k, len(scores))
+        if top_k <= 0:
+            return []
+        idx = np.argpartition(-scores, top_k - 1)[:top_k] if top_k < len(scores) else np.arange(len(scores))
+        idx = idx[np.argsort(-scores[idx], kind="stable")]
+        return [HotHit(self.chunk_ids[i], float(1.0 - scores[i]), self.vectors[i]) for i in idx]
+
+
+Key = Tuple[str, str, int]  # (user_id, model, dims)
+
+
+def _canonical_user(user_id) -> Optional[str]:
+    """The user id as invalidations carry it (lowercase, hyphenated UUID), or None if it is not a UUID."""
+    try:
+        return str(user_id if isinstance(user_id, uuid.UUID) else uuid.UUID(str(user_id)))
+    except ValueError:
+        return None
+
+
+class HotTier:
+    def __init__(self, max_bytes: int, max_rows: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self._matrices: "OrderedDict[Key, UserMatrix]" = OrderedDict()
+        self._bytes = 0
+        self._generation: Dict[str, int] = {}  # per user, bumped on invalidation
+        self._loading: Set[Key] = set()
+        self._too_big: Dict[Key, float] = {}  # keys over max_rows, rechecked after ttl
+        self._lock = threading.Lock()
+        self._loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="hot-tier-load")
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, user_id: str, model: str, dims: int) -> Optional[UserMatrix]:
+        """
+        The user's matrix if loaded (and fresh); otherwise starts loading it
+        and returns None. An id that is not a UUID is never cached (None).
+        """
+        user = _canonical_user(user_id)
+        if user is None:
+            return None
+        key = (user, model, int(dims))
+        with self._lock:
+            matrix = self._matrices.get(key)
+            if matrix is not None and time.monotonic() - matrix.loaded_at > self.ttl:
+                self._drop(key)
+                matrix = None
+            if matrix is not None:
+                self._matrices.move_to_end(key)
+                self.hits += 1
+                return matrix
+            self.misses += 1
+            too_big_at = self._too_big.get(key)
+            if key in self._loading or (too_big_at and time.monotonic() - too_big_at < self.ttl):
+                return None
+            self._loading.add(key)
+            generation = self._generation.get(key[0], 0)
+        self._loader.submit(self._load, key, generation)
+        return None
+
+    def _drop(self, key: Key) -> None:
+        matrix = self._matrices.pop(key, None)
+        if matrix is not None:
+            self._bytes -= matrix.nbytes
+
+    def _load(self, key: Key, generation: int) -> None:
+        from app.db.session import SessionLocal, raw_connection
+
+        user_id, model, dims = key
+        db = SessionLocal()
+        try:
+            conn = raw_connection(db)
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT count(*) FROM embeddings WHERE user_id = %s AND model = %s AND dims = %s",
+                    (uuid.UUID(user_id), model, dims),
+                )
+                n = cur.fetchone()[0]
+                if n == 0 or n > self.max_rows:
+                    with self._lock:
+                        self._too_big[key] = time.monotonic()
+                    return
+                cur.execute(
+                    "SELECT chunk_id::text, embedding, captured_at, source_type FROM embeddings"
+                    " WHERE user_id = %s AND model = %s AND dims = %s",
+                    (uuid.UUID(user_id), model, dims),
+                )
+                ids: List[str] = []
+                vectors = np.empty((n, dims), dtype=np.float32)
+                captured = np.full(n, _NO_TIME, dtype=np.int64)
+                types: List[str] = []
+                for i, (chunk_id, vec, captured_at, source_type) in enumerate(cur):
+                    if i >= n:  # rows added since the count
+                        break
+                    ids.append(chunk_id)
+                    vectors[i] = vec
+                    if captured_at is not None:
+                        captured[i] = _ms(captured_at)
+                    types.append(source_type or "")
+            db.rollback()
+            matrix = UserMatrix(ids, vectors[:len(ids)], captured[:len(ids)], types)
+            with self._lock:
+                if self._generation.get(user_id, 0) != generation:
+                    return  # invalidated while loading; the next query loads again
+                self._drop(key)
+                self._matrices[key] = matrix
+                self._bytes += matrix.nbytes
+                self._too_big.pop(key, None)
+                self.loads += 1
+                while self._bytes > self.max_bytes and len(self._matrices) > 1:
+                    self._drop(next(iter(self._matrices)))
+                    self.evictions += 1
+        except Exception as e:
+            log.warning("hot tier: loading %s failed: %s", key, e)
+        finally:
+            with self._lock:
+                self._loading.discard(key)
+            db.close()
+
+    def invalidate(self, user_id: Optional[str] = None) -> None:
+        """Drops one user's matrices (or all of them, user_id=None)."""
+        if user_id is not None:
+            user_id = _canonical_user(user_id)
+            if user_id is None:
+                return  # no matrix is cached under an id that is not a UUID
+        with self._lock:
+            for key in [k for k in self._matrices if user_id is None or k[0] == user_id]:
+                self._drop(key)
+            for key in [k for k in self._too_big if user_id is None or k[0] == user_id]:
+                del self._too_big[key]
+            users = {k[0] for k in self._loading} | set(self._generation)
+            for user in ([user_id] if user_id else users):
+                self._generation[user] = self._generation.get(user, 0) + 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "users": len({k[0] for k in self._matrices}),
+                "rows": sum(len(m.chunk_ids) for m in self._matrices.values()),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+
+
+# --- invalidation over Redis pub/sub ---
+
+def _listen(tier: HotTier) -> None:
+    import redis
+
+    while True:
+        try:
+            pubsub = redis.Redis.from_url(settings.redis_url).pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(CHANNEL)
+            # messages sent while we were not subscribed are lost: start clean
+            tier.invalidate()
+            for message in pubsub.listen():
+                tier.invalidate(message["data"].decode())
+        except Exception as e:
+            log.warning("hot tier: invalidation channel down, retrying in 5 s: %s", e)
+            time.sleep(5)
+
+
+def publish_invalidation(user_id) -> None:
+    """Called by ingestion after a job changes a user's chunks."""
+    if not enabled():
+        return
+    try:
+        import redis
+
+        redis.Redis.from_url(settings.redis_url).publish(CHANNEL, str(user_id))
+    except Exception as e:
+        log.warning("hot tier: publish for %s failed: %s", user_id, e)
+
+
+_tiers: Dict[int, HotTier] = {}
+_tiers_lock = threading.Lock()
+
+
+def get_hot_tier() -> Optional[HotTier]:
+    """This process's tier (None unless HOT_TIER=1); the first call starts the invalidation listener."""
+    if not enabled():
+        return None
+    pid = os.getpid()
+    with _tiers_lock:
+        tier = _tiers.get(pid)
+        if tier is None:
+            tier = HotTier(
+                max_bytes=int(float(os.getenv("HOT_TIER_MAX_MB", "1024")) * 1024 * 1024),
+                max_rows=int(os.getenv("HOT_TIER_MAX_ROWS", "200000")),
+                ttl=float(os.getenv("HOT_TIER_TTL", "600")),
+            )
+            threading.Thread(target=_listen, args=(tier,), name="hot-tier-invalidate", daemon=True).start()
+            _tiers[pid] = tier
+        return tier
@@ -0,0 +1,87 @@
+# app/services/metrics.py
+"""
+Prometheus metrics for ingestion.
+
+Workers observe each stage's seconds as it finishes and per-job bytes,
+chunks and tokens when a job ends; the API counts submitted jobs. Prefork
+Celery workers (and uvicorn --workers) are several processes: with
+PROMETHEUS_MULTIPROC_DIR set, every process writes its samples there and the
+exporter merges them (prometheus_client multiprocess mode). The API serves
+GET /metrics; a worker serves its own on WORKER_METRICS_PORT (off by
+default, one port per worker on a host).
+"""
+import os
+from typing import Dict, Optional, Tuple
+
+import app.core.config  # noqa: F401  loads .env before prometheus_client reads PROMETHEUS_MULTIPROC_DIR
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+    start_http_server,
+)
+
+# prometheus_client picks in-memory or file-backed values once, at import; follow the same choice
+_MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+STAGE_SECONDS = Histogram(
+    "twinmind_ingest_stage_seconds",
+    "Seconds an ingestion job spent in a stage",
+    ["stage", "source_type"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+JOB_CHUNKS = Histogram(
+    "twinmind_ingest_job_chunks",
+    "Chunks embedded and written per successful job",
+    ["source_type"],
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500),
+)
+JOBS = Counter(
+    "twinmind_ingest_jobs",
+    "Ingestion job attempts by outcome (failed includes attempts that are retried)",
+    ["source_type", "outcome"],
+)
+BYTES = Counter("twinmind_ingest_bytes", "Source bytes of successful jobs", ["source_type"])
+CHUNKS = Counter("twinmind_ingest_chunks", "Chunks embedded and written", ["source_type"])
+TOKENS = Counter("twinmind_ingest_tokens", "Tokens in chunks embedded and written", ["source_type"])
+SUBMITTED = Counter("twinmind_ingest_submitted", "Ingestion jobs accepted by the API", ["source_type"])
+
+
+def registry() -> CollectorRegistry:
+    if not _MULTIPROCESS:
+        return REGISTRY
+    merged = CollectorRegistry()
+    multiprocess.MultiProcessCollector(merged)
+    return merged
+
+
+def render() -> Tuple[bytes, str]:
+    """Exposition body and content type for a /metrics response."""
+    return generate_latest(registry()), CONTENT_TYPE_LATEST
+
+
+def observe_stages(source_type: str, seconds: Dict[str, float]) -> None:
+    for stage, s in seconds.items():
+        if s:
+            STAGE_SECONDS.labels(stage, source_type).observe(s)
+
+
+def observe_job(source_type: str, succeeded: bool, byte_count: Optional[int] = None,
+                chunk_count: Optional[int] = None, token_count: Optional[int] = None) -> None:
+    JOBS.labels(source_type, "succeeded" if succeeded else "failed").inc()
+    if not succeeded:
+        return
+    BYTES.labels(source_type).inc(byte_count or 0)
+    CHUNKS.labels(source_type).inc(chunk_count or 0)
+    TOKENS.labels(source_type).inc(token_count or 0)
+    JOB_CHUNKS.labels(source_type).observe(chunk_count or 0)
+
+
+def start_worker_exporter() -> None:
+    port = int(os.getenv("WORKER_METRICS_PORT", "0"))
+    if port:
+        start_http_server(port, registry=registry())
+
+
+def process_exited(pid: int) -> None:
+    # drops the dead process's live gauges; its counters and histograms stay in the totals
+    if _MULTIPROCESS:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,74 @@
+# app/services/mmr.py
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+def _recency(hits: List[Dict[str, Any]], half_life_days: float, now: datetime) -> np.ndarray:
+    # 1.0 for "now", 0.5 one half-life ago; undated hits get 0.
+    out = np.zeros(len(hits), dtype=np.float32)
+    for i, h in enumerate(hits):
+        ts = h.get("captured_at")
+        if isinstance(ts, datetime):
+            if ts.tzinfo is None:
+                ts = ts.replace(tzinfo=timezone.utc)
+            age_days = max(0.0, (now - ts).total_seconds() / 86400.0)
+            out[i] = 0.5 ** (age_days / half_life_days)
+    return out
+
+
+def mmr_rerank(
+    query_vec: Sequence[float],
+    hits: List[Dict[str, Any]],
+    top_k: Optional[int] = None,
+    lambda_: Optional[float] = None,
+    recency_weight: Optional[float] = None,
+    half_life_days: Optional[float] = None,
+    now: Optional[datetime] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Maximal marginal relevance over candidate hits carrying a "vector" key:
+    picks greedily by lambda * relevance - (1 - lambda) * max similarity to
+    what is already picked, which drops near-duplicate overlapping chunks.
+    Relevance is cosine similarity to the query, optionally blended with an
+    exponential recency score on captured_at. Hits without a usable vector
+    keep their order after the MMR picks. The "vector" key is removed.
+    """
+    lambda_ = float(os.getenv("MMR_LAMBDA", "0.7")) if lambda_ is None else lambda_
+    recency_weight = float(os.getenv("MMR_RECENCY_WEIGHT", "0")) if recency_weight is None else recency_weight
+    half_life_days = float(os.getenv("MMR_HALF_LIFE_DAYS", "30")) if half_life_days is None else half_life_days
+    top_k = len(hits) if top_k is None else top_k
+
+    q = np.asarray(query_vec, dtype=np.float32)
+    cands, rest = [], []
+    for h in hits:
+        v = h.get("vector")
+        (cands if v is not None and len(v) == len(q) else rest).append(h)
+
+    picked: List[Dict[str, Any]] = []
+    if cands and q.size:
+        V = np.asarray([h["vector"] for h in cands], dtype=np.float32)
+        V /= np.maximum(np.linalg.norm(V, axis=1, keepdims=True), 1e-12)
+        q = q / max(float(np.linalg.norm(q)), 1e-12)
+
+        rel = V @ q
+        if recency_weight > 0:
+            rec = _recency(cands, half_life_days, now or datetime.now(timezone.utc))
+            rel = (1.0 - recency_weight) * rel + recency_weight * rec
+        sim = V @ V.T
+
+        n = len(cands)
+        max_sim = np.full(n, -np.inf, dtype=np.float32)
+        available = np.ones(n, dtype=bool)
+        for _ in range(min(top_k, n)):
+            penalty = np.where(np.isfinite(max_sim), max_sim, 0.0)
+            score = np.where(available, lambda_ * rel - (1.0 - lambda_) * penalty, -np.inf)
+            j = int(np.argmax(score))
+            picked.append(cands[j])
+            available[j] = False
+            max_sim = np.maximum(max_sim, sim[:, j])
+
+    out = (picked + rest)[:top_k]
+    return [{k: v for k, v in h.items() if k != "vector"} for h in out]
@@ -0,0 +1,151 @@
+# app/services/query_cache.py
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.ai_provider import AsyncEmbedder, Embedder, get_async_embedder, get_embedder
+from app.services.embedding_cache import normalize_text
+from app.services.lru import LRUCache
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_lru: Optional[LRUCache] = None
+_redis = None
+_embedder: Optional[Embedder] = None
+_async_embedder: Optional[AsyncEmbedder] = None
+_redis_hits = 0
+_misses = 0
+
+
+def _ttl() -> int:
+    return int(os.getenv("QUERY_CACHE_TTL", "3600"))
+
+
+def _get_lru() -> LRUCache:
+    global _lru
+    if _lru is None:
+        with _lock:
+            if _lru is None:
+                _lru = LRUCache(maxsize=int(os.getenv("QUERY_CACHE_SIZE", "2048")), ttl=_ttl())
+    return _lru
+
+
+def _get_redis():
+    global _redis
+    if os.getenv("QUERY_CACHE_REDIS") != "1":
+        return None
+    if _redis is None:
+        import redis
+
+        _redis = redis.Redis.from_url(settings.redis_url)
+    return _redis
+
+
+def _get_embedder() -> Embedder:
+    # Built once per process instead of once per /chat call.
+    global _embedder
+    if _embedder is None:
+        with _lock:
+            if _embedder is None:
+                _embedder = get_embedder()
+    return _embedder
+
+
+def _get_async_embedder() -> AsyncEmbedder:
+    global _async_embedder
+    if _async_embedder is None:
+        _async_embedder = get_async_embedder()
+    return _async_embedder
+
+
+def query_key(query: str, model: str) -> str:
+    # over the exact text sent to the provider (normalize_text only folds whitespace
+    # and Unicode form), so a hit returns the vector a miss would have computed
+    return f"qemb:{model}:{hashlib.sha256(normalize_text(query).encode('utf-8')).hexdigest()}"
+
+
+def _lookup(key: str) -> Optional[List[float]]:
+    global _redis_hits
+    lru = _get_lru()
+    vec = lru.get(key)
+    if vec is not None:
+        return vec
+    r = _get_redis()
+    if r is None:
+        return None
+    try:
+        blob = r.get(key)
+    except Exception as e:
+        log.warning("query cache: redis lookup failed: %s", e)
+        return None
+    if not blob:
+        return None
+    vec = np.frombuffer(blob, dtype=np.float32).tolist()
+    lru.set(key, vec)
+    with _lock:
+        _redis_hits += 1
+    return vec
+
+
+def _store(key: str, vec: List[float]) -> None:
+    global _misses
+    with _lock:
+        _misses += 1
+    _get_lru().set(key, vec)
+    r = _get_redis()
+    if r is not None:
+        try:
+            r.set(key, np.asarray(vec, dtype=np.float32).tobytes(), ex=_ttl())
+        except Exception as e:
+            log.warning("query cache: redis store failed: %s", e)
+
+
+def embed_query(query: str) -> Tuple[List[float], int, str]:
+    """Returns (vector, dims, model) for a chat query, served from cache when possible."""
+    embedder = _get_embedder()
+    key = query_key(query, embedder.model)
+    vec = _lookup(key)
+    if vec is None:
+        vecs, _, _ = embedder.embed_texts([normalize_text(query)])
+        if not vecs or not vecs[0]:
+            return [], 0, embedder.model
+        vec = vecs[0]
+        _store(key, vec)
+    return vec, len(vec), embedder.model
+
+
+async def aembed_query(query: str) -> Tuple[List[float], int, str]:
+    """embed_query for the event loop: async provider call, Redis off-loop."""
+    embedder = _get_async_embedder()
+    key = query_key(query, embedder.model)
+    vec = _get_lru().get(key) if _get_redis() is None else await asyncio.to_thread(_lookup, key)
+    if vec is None:
+        vecs, _, _ = await embedder.embed_texts([normalize_text(query)])
+        if not vecs or not vecs[0]:
+            return [], 0, embedder.model
+        vec = vecs[0]
+        if _get_redis() is None:
+            _store(key, vec)
+        else:
+            await asyncio.to_thread(_store, key, vec)
+    return vec, len(vec), embedder.model
+
+
+def stats() -> dict:
+    lru = _get_lru()
+    # lru.misses also counts lookups that were then served by Redis
+    return {
+        "memory_hits": lru.hits,
+        "redis_hits": _redis_hits,
+        "misses": _misses,
+        "size": len(lru),
+        "max_size": lru.maxsize,
+        "ttl_seconds": lru.ttl,
+    }
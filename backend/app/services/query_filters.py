@@ -0,0 +1,198 @@
+# app/services/query_filters.py
+"""
+Time ranges stated in a chat query ("last month", "since March 3", "in 2024",
+"between May 1 and May 15"), turned into captured_at bounds for retrieval.
+
+Only explicit phrases are recognised: relative periods by pattern, and dates
+after an anchor word (since/after/before/until/on/from/in/between) via dateparser. Free
+text is never scanned for dates (dateparser.search would read "may" or
+"second" as one). The matched phrase is removed from the search text, where
+it would only add noise to the embedding and to full-text matching.
+"""
+import calendar
+import re
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional, Tuple
+
+import dateparser
+
+_UNITS = {"day": 1, "week": 7, "month": 30, "year": 365}
+_MONTHS = "|".join(calendar.month_name[1:] + [m for m in calendar.month_abbr[1:] if m != "May"])
+_PREFIX = r"(?:(?:in|during|from|over|within)\s+)?(?:the\s+)?"
+_MAX_DATE_WORDS = 5
+
+_RELATIVE_RE = re.compile(
+    _PREFIX + r"\b(?:(?P<day>today|yesterday)"
+    r"|(?P<which>this|last|past|previous)\s+(?:(?P<n>\d+|few|couple of)\s+)?(?P<unit>day|week|month|year)s?"
+    r"|(?P<ago_n>\d+)\s+(?P<ago_unit>day|week|month|year)s?\s+ago)\b",
+    re.I,
+)
+_IN_PERIOD_RE = re.compile(
+    r"\b(?:in|during)\s+(?:(?P<month>" + _MONTHS + r")\.?(?:\s+(?P<month_year>\d{4}))?|(?P<year>\d{4}))\b",
+    re.I,
+)
+_BETWEEN_RE = re.compile(r"\bbetween\s+(?P<a>.+?)\s+and\s+(?P<b>.+)", re.I)
+_ANCHOR_RE = re.compile(r"\b(?P<anchor>since|after|from|before|until|till|prior to|on)\s+(?P<rest>.+)", re.I)
+_YEAR_RE = re.compile(r"^\d{4}$")
+_BARE_NUMBER_RE = re.compile(r"^\d{1,3}$")  # "on 3 projects" is not the 3rd
+_MONTH_RE = re.compile(r"^(?:" + _MONTHS + r")\.?(?:\s+\d{4})?$", re.I)
+# words a date phrase is made of; dateparser skips words it does not know
+# ("since March 3 about kafka" parses), so candidates stop at the first other word
+_DATE_WORD_RE = re.compile(
+    r"^(?:(?:" + _MONTHS + r"|monday|tuesday|wednesday|thursday|friday|saturday|sunday)\.?,?"
+    r"|\d{1,4}(?:st|nd|rd|th)?,?|\d{1,4}[-/.]\d{1,2}(?:[-/.]\d{1,4})?(?:t[\d:]+z?)?,?"
+    r"|of|the|last|ago|today|yesterday|(?:day|week|month|year)s?)$",
+    re.I,
+)
+
+
+class TimeRange(NamedTuple):
+    after: Optional[datetime]  # inclusive
+    before: Optional[datetime]  # exclusive
+    phrase: str  # the text it was read from
+
+
+def _day(d: datetime) -> datetime:
+    return d.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _month_start(year: int, month: int) -> datetime:
+    return datetime(year, month, 1, tzinfo=timezone.utc)
+
+
+def _add_months(d: datetime, n: int) -> datetime:
+    month = d.month - 1 + n
+    return _month_start(d.year + month // 12, month % 12 + 1)
+
+
+def _parse(text: str, now: datetime) -> Optional[datetime]:
+    parsed = dateparser.parse(
+        text,
+        languages=["en"],
+        settings={"PREFER_DATES_FROM": "past", "RELATIVE_BASE": now.replace(tzinfo=None)},
+    )
+    return parsed.replace(tzinfo=timezone.utc) if parsed else None
+
+
+def _period(text: str, now: datetime) -> Optional[Tuple[datetime, datetime]]:
+    """[start, end) of the year, month or day `text` names."""
+    start = _parse(text, now)
+    if start is None:
+        return None
+    text = text.strip()
+    if _YEAR_RE.match(text):
+        return datetime(start.year, 1, 1, tzinfo=timezone.utc), datetime(start.year + 1, 1, 1, tzinfo=timezone.utc)
+    if _MONTH_RE.match(text):
+        first = _month_start(start.year, start.month)
+        return first, _add_months(first, 1)
+    return _day(start), _day(start) + timedelta(days=1)
+
+
+def _leading_period(text: str, now: datetime) -> Optional[Tuple[Tuple[datetime, datetime], str]]:
+    # the longest run of leading date words that parses as a date
+    words = []
+    for word in text.split()[:_MAX_DATE_WORDS]:
+        if not _DATE_WORD_RE.match(word.rstrip("?!.;")):
+            break
+        words.append(word)
+    for n in range(len(words), 0, -1):
+        candidate = " ".join(words[:n]).rstrip("?,.!;")
+        if _BARE_NUMBER_RE.match(candidate):
+            continue
+        period = _period(candidate, now)
+        if period:
+            return period, candidate
+    return None
+
+
+def _relative(m: re.Match, now: datetime) -> Optional[Tuple[datetime, datetime]]:
+    today = _day(now)
+    if m.group("day"):
+        start = today if m.group("day").lower() == "today" else today - timedelta(days=1)
+        return start, start + timedelta(days=1)
+    if m.group("ago_n"):
+        start = today - timedelta(days=int(m.group("ago_n")) * _UNITS[m.group("ago_unit").lower()])
+        return start, start + timedelta(days=1)
+
+    which, unit = m.group("which").lower(), m.group("unit").lower()
+    n = m.group("n")
+    if n:  # "last 3 weeks", "past few days": rolling window up to now
+        count = int(n) if n.isdigit() else 3 if n == "few" else 2
+        return now - timedelta(days=count * _UNITS[unit]), now
+    if which == "past":  # "past week": rolling
+        return now - timedelta(days=_UNITS[unit]), now
+    # "this" / "last" / "previous": calendar periods
+    if unit == "day":
+        start = today if which == "this" else today - timedelta(days=1)
+        return start, start + timedelta(days=1)
+    if unit == "week":
+        start = today - timedelta(days=today.weekday())
+        return (start, now) if which == "this" else (start - timedelta(days=7), start)
+    if unit == "month":
+        start = _month_start(now.year, now.month)
+        return (start, now) if which == "this" else (_add_months(start, -1), start)
+    start = datetime(now.year, 1, 1, tzinfo=timezone.utc)
+    return (start, now) if which == "this" else (datetime(now.year - 1, 1, 1, tzinfo=timezone.utc), start)
+
+
+def _in_period(m: re.Match, now: datetime) -> Tuple[datetime, datetime]:
+    if m.group("year"):
+        year = int(m.group("year"))
+        return datetime(year, 1, 1, tzinfo=timezone.utc), datetime(year + 1, 1, 1, tzinfo=timezone.utc)
+    month = _period(m.group("month"), now)[0].month
+    year = int(m.group("month_year")) if m.group("month_year") else now.year
+    if not m.group("month_year") and _month_start(year, month) > now:
+        year -= 1  # "in December", asked in October: the last one
+    first = _month_start(year, month)
+    return first, _add_months(first, 1)
+
+
+def _strip(query: str, start: int, end: int) -> str:
+    cleaned = re.sub(r"\s{2,}", " ", query[:start] + " " + query[end:]).strip()
+    cleaned = re.sub(r"\s+([?.!,;])", r"\1", cleaned).strip(" ,;:")
+    # an empty (or punctuation-only) remainder would match nothing; keep the query
+    return cleaned if re.search(r"\w", cleaned) else query
+
+
+def extract_time_range(query: str, now: Optional[datetime] = None) -> Tuple[Optional[TimeRange], str]:
+    """
+    (TimeRange or None, query without the time phrase). Times are UTC; the
+    first phrase found wins.
+    """
+    now = now or datetime.now(timezone.utc)
+
+    m = _RELATIVE_RE.search(query)
+    if m:
+        period = _relative(m, now)
+        if period:
+            return TimeRange(*period, m.group(0).strip()), _strip(query, m.start(), m.end())
+
+    m = _IN_PERIOD_RE.search(query)
+    if m:
+        return TimeRange(*_in_period(m, now), m.group(0)), _strip(query, m.start(), m.end())
+
+    m = _BETWEEN_RE.search(query)
+    if m:
+        first = _leading_period(m.group("a"), now) if len(m.group("a").split()) <= _MAX_DATE_WORDS else None
+        second = _leading_period(m.group("b"), now)
+        if first and second and first[1] == m.group("a").strip():
+            end = m.start("b") + m.group("b").index(second[1]) + len(second[1])
+            return TimeRange(first[0][0], second[0][1], query[m.start():end]), _strip(query, m.start(), end)
+
+    for m in _ANCHOR_RE.finditer(query):
+        found = _leading_period(m.group("rest"), now)
+        if not found:
+            continue
+        (start, stop), text = found
+        anchor = m.group("anchor").lower()
+        end = m.start("rest") + m.group("rest").index(text) + len(text)
+        phrase = query[m.start():end]
+        if anchor == "since":
+            return TimeRange(start, None, phrase), _strip(query, m.start(), end)
+        if anchor == "after":
+            return TimeRange(stop, None, phrase), _strip(query, m.start(), end)
+        if anchor in ("on", "from"):
+            return TimeRange(start, stop, phrase), _strip(query, m.start(), end)
+        return TimeRange(None, start, phrase), _strip(query, m.start(), end)
+
+    return None, query
@@ -0,0 +1,440 @@
+# app/services/rate_limit.py
+"""
+Provider scheduler: every embedding, transcription, rerank and chat call goes
+through a ProviderScheduler, which
+
+- spends from token buckets for requests and tokens per minute (<NAME>_RPM,
+  <NAME>_TPM), kept in Redis so all worker processes share one budget;
+- caps calls in flight with an AIMD limit (<NAME>_MAX_CONCURRENCY): +1 per
+  window of successes, halved on a 429, cut by 10% when calls slow down;
+- on a 429 pauses every process for Retry-After and retries the call in place,
+  instead of failing the Celery task and re-running its earlier stages.
+
+A scheduler with no RPM, TPM or concurrency cap only does the retries.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+import httpx
+import openai
+from sqlalchemy.exc import DBAPIError
+
+from app.core.config import settings
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# (default max concurrency per process; 0 = no cap)
+SCHEDULERS = {"embed": 16, "transcribe": 8, "rerank": 0, "chat": 0}
+
+
+# --- error classification ---
+
+def _status(error: BaseException) -> Optional[int]:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code
+    return None
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    return isinstance(error, openai.RateLimitError) or _status(error) == 429
+
+
+def is_transient(error: BaseException) -> bool:
+    """Worth retrying: 429s, provider 5xx, timeouts and dropped connections."""
+    status = _status(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(error, DBAPIError):
+        return bool(error.connection_invalidated)
+    return isinstance(error, (
+        httpx.TransportError, openai.APIConnectionError, TimeoutError, ConnectionError,
+    ))
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds from the Retry-After (or retry-after-ms) header of a failed provider call."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def estimate_tokens(texts: List[str]) -> int:
+    # ~4 chars per token; only sizes TPM spends, so no tokenizer round-trip
+    return sum(len(t) for t in texts) // 4 + len(texts)
+
+
+# --- token buckets ---
+
+# KEYS: rpm bucket, tpm bucket, cooldown. ARGV: per bucket (rate/s, capacity,
+# cost), then cooldown seconds to set (0 = none). Buckets may go negative: a
+# caller reserves its cost and waits out the debt, so waiters are served FIFO.
+# Returns the seconds to wait, as a string (Lua numbers are truncated to ints).
+_RESERVE_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local wait = 0
+local cool = tonumber(ARGV[7])
+if cool > 0 then
+  local untl = now + cool
+  local cur = tonumber(redis.call('GET', KEYS[3]) or '0')
+  if untl > cur then
+    redis.call('SET', KEYS[3], tostring(untl), 'PX', math.ceil(cool * 1000) + 1000)
+  end
+  return '0'
+end
+local cd = tonumber(redis.call('GET', KEYS[3]) or '0')
+if cd > now then wait = cd - now end
+for i = 1, 2 do
+  local rate = tonumber(ARGV[i * 3 - 2])
+  local cap = tonumber(ARGV[i * 3 - 1])
+  local cost = tonumber(ARGV[i * 3])
+  if rate > 0 and cost > 0 then
+    local b = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local tokens = tonumber(b[1]) or cap
+    local ts = tonumber(b[2]) or now
+    tokens = math.min(cap, tokens + (now - ts) * rate) - math.min(cost, cap)
+    redis.call('HSET', KEYS[i], 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[i], math.ceil(cap / rate) + 60)
+    if tokens < 0 then wait = math.max(wait, -tokens / rate) end
+  end
+end
+return tostring(wait)
+"""
+
+
+class _LocalBuckets:
+    """Same arithmetic as _RESERVE_LUA, for one process (no Redis, or Redis down)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens: Dict[int, Tuple[float, float]] = {}
+        self._cooldown_until = 0.0
+
+    def reserve(self, buckets: List[Tuple[float, float, float]]) -> float:
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._cooldown_until - now)
+            for i, (rate, cap, cost) in enumerate(buckets):
+                if rate <= 0 or cost <= 0:
+                    continue
+                tokens, ts = self._tokens.get(i, (cap, now))
+                tokens = min(cap, tokens + (now - ts) * rate) - min(cost, cap)
+                self._tokens[i] = (tokens, now)
+                if tokens < 0:
+                    wait = max(wait, -tokens / rate)
+            return wait
+
+    def cool_down(self, seconds: float) -> None:
+        with self._lock:
+            self._cooldown_until = max(self._cooldown_until, time.monotonic() + seconds)
+
+
+_redis = None
+_redis_lock = threading.Lock()
+
+
+def _get_redis():
+    global _redis
+    if os.getenv("RATE_LIMIT_REDIS", "1") != "1":
+        return None
+    with _redis_lock:
+        if _redis is None:
+            import redis
+
+            _redis = redis.Redis.from_url(settings.redis_url, socket_timeout=1, socket_connect_timeout=1)
+        return _redis
+
+
+# --- adaptive concurrency ---
+
+class AdaptiveLimit:
+    """
+    AIMD cap on calls in flight. Only one decrease per round trip: a signal
+    from a call that started before the last decrease is ignored, since that
+    call was sent under the old limit.
+    """
+
+    def __init__(self, max_limit: int, latency_tolerance: float = 3.0):
+        self.max_limit = max(1, max_limit)
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self.latency_tolerance = latency_tolerance
+        self._floor: Optional[float] = None  # fastest recent latency per unit of work
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    async def acquire_async(self) -> None:
+        """
+        acquire() for the event loop. Waits on a future rather than a thread,
+        so a cancelled caller (wait_for timeout) never ends up holding a slot.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                waiter = (loop, loop.create_future())
+                self._async_waiters.append(waiter)
+            try:
+                await waiter[1]
+            finally:
+                with self._cond:
+                    if waiter in self._async_waiters:
+                        self._async_waiters.remove(waiter)
+
+    def _wake(self) -> None:
+        # caller holds _cond; woken coroutines race for the slot and re-wait if they lose
+        self._cond.notify_all()
+        for loop, fut in self._async_waiters:
+            loop.call_soon_threadsafe(_resolve, fut)
+        self._async_waiters.clear()
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._wake()
+
+    def _decrease(self, started: float, factor: float) -> None:
+        if started < self._last_decrease:
+            return
+        self.limit = max(1.0, self.limit * factor)
+        self._last_decrease = time.monotonic()
+
+    def on_success(self, started: float, latency: float, units: int = 1) -> None:
+        per_unit = latency / max(1, units)
+        with self._cond:
+            # the floor creeps up 1% per call, so it follows a provider that got slower for good
+            self._floor = per_unit if self._floor is None else min(per_unit, self._floor * 1.01)
+            if self.latency_tolerance > 0 and per_unit > self._floor * self.latency_tolerance:
+                self._decrease(started, 0.9)
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+                self._wake()
+
+    def on_rate_limited(self, started: float) -> None:
+        with self._cond:
+            self._decrease(started, 0.5)
+
+
+def _resolve(fut: asyncio.Future) -> None:
+    if not fut.done():
+        fut.set_result(None)
+
+
+# --- scheduler ---
+
+class ProviderScheduler:
+    def __init__(self, name: str, rpm: float = 0, tpm: float = 0, max_concurrency: int = 0,
+                 max_retries: int = 5, cooldown: float = 2.0, latency_tolerance: float = 3.0):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self.cooldown = cooldown
+        self.limit = AdaptiveLimit(max_concurrency, latency_tolerance) if max_concurrency > 0 else None
+        self.enabled = bool(rpm or tpm or self.limit)
+        self._local = _LocalBuckets()
+        self._redis_down_until = 0.0
+        self._keys = [f"ratelimit:{name}:rpm", f"ratelimit:{name}:tpm", f"ratelimit:{name}:cooldown"]
+        # stats, for benchmarks and logs
+        self.calls = 0
+        self.rate_limited = 0
+        self.waited = 0.0
+
+    def _buckets(self, tokens: int) -> List[Tuple[float, float, float]]:
+        # capacity is 10 s of budget, so an idle minute does not turn into a burst the provider rejects
+        return [
+            (self.rpm / 60, max(1.0, self.rpm / 6), 1 if self.rpm else 0),
+            (self.tpm / 60, max(1.0, self.tpm / 6), tokens if self.tpm else 0),
+        ]
+
+    def _redis_call(self, buckets: List[Tuple[float, float, float]], cool: float) -> Optional[float]:
+        r = _get_redis()
+        if r is None or time.monotonic() < self._redis_down_until:
+            return None
+        args = [x for b in buckets for x in b] + [cool]
+        try:
+            return float(r.eval(_RESERVE_LUA, 3, *self._keys, *args))
+        except Exception as e:
+            log.warning("rate limit %s: redis unavailable, limiting per process for 30 s: %s", self.name, e)
+            self._redis_down_until = time.monotonic() + 30
+            return None
+
+    def reserve(self, tokens: int = 0) -> float:
+        """Spend one request and `tokens` from the buckets; returns the seconds to wait first."""
+        buckets = self._buckets(tokens)
+        wait = self._redis_call(buckets, 0)
+        return self._local.reserve(buckets) if wait is None else wait
+
+    def cool_down(self, seconds: float) -> None:
+        """Hold back every caller (in all processes, via Redis) for `seconds`."""
+        self._local.cool_down(seconds)
+        self._redis_call(self._buckets(0), seconds)
+
+    def _backoff(self, error: BaseException, attempt: int) -> float:
+        """Seconds to sleep before retrying `error`."""
+        if is_rate_limited(error):
+            self.rate_limited += 1
+            seconds = retry_after(error) or self.cooldown * 2 ** attempt
+            if not self.enabled:
+                return seconds
+            self.cool_down(seconds)
+            return 0.0  # the next reserve() waits out the cool-down
+        return min(30.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+    def _should_retry(self, error: BaseException, attempt: int) -> bool:
+        return attempt < self.max_retries and is_transient(error)
+
+    def _done(self, started: float, error: Optional[BaseException], units: int) -> None:
+        self.calls += 1
+        if self.limit is None:
+            return
+        if error is None:
+            self.limit.on_success(started, time.monotonic() - started, units)
+        elif is_rate_limited(error):
+            self.limit.on_rate_limited(started)
+        self.limit.release()
+
+    def _abandoned(self) -> None:
+        # cancelled or interrupted mid-call: give the slot back without a latency signal
+        if self.limit is not None:
+            self.limit.release()
+
+    def run(self, call: Callable[[], T], tokens: int = 0, units: Optional[int] = None) -> T:
+        """
+        Make a provider call under this scheduler's limits, retrying 429s and
+        transient errors. `tokens` is spent from the TPM bucket; `units` sizes
+        the call for the latency signal (defaults to `tokens`). Provider
+        clients are built with max_retries=0, so retries happen here only.
+        """
+        units = tokens if units is None else units
+        attempt = 0
+        while True:
+            if self.enabled:
+                wait = self.reserve(tokens)
+                if wait > 0:
+                    self.waited += wait
+                    time.sleep(wait)
+                if self.limit:
+                    self.limit.acquire()
+            started = time.monotonic()
+            try:
+                result = call()
+            except Exception as e:
+                self._done(started, e, units)
+                if not self._should_retry(e, attempt):
+                    raise
+                pause = self._backoff(e, attempt)
+            except BaseException:
+                if self.enabled:
+                    self._abandoned()
+                raise
+            else:
+                self._done(started, None, units)
+                return result
+            attempt += 1
+            if pause:
+                time.sleep(pause)
+
+    async def arun(self, call: Callable[[], Awaitable[T]], tokens: int = 0, units: Optional[int] = None) -> T:
+        """
+        run() for coroutines on the API event loop; Redis reservations go to a
+        thread. Safe to cancel: the concurrency slot is released on CancelledError.
+        """
+        units = tokens if units is None else units
+        attempt = 0
+        while True:
+            if self.enabled:
+                wait = await asyncio.to_thread(self.reserve, tokens)
+                if wait > 0:
+                    self.waited += wait
+                    await asyncio.sleep(wait)
+                if self.limit:
+                    await self.limit.acquire_async()
+            started = time.monotonic()
+            try:
+                result = await call()
+            except Exception as e:
+                self._done(started, e, units)
+                if not self._should_retry(e, attempt):
+                    raise
+                pause = await asyncio.to_thread(self._backoff, e, attempt)
+            except BaseException:
+                if self.enabled:
+                    self._abandoned()
+                raise
+            else:
+                self._done(started, None, units)
+                return result
+            attempt += 1
+            if pause:
+                await asyncio.sleep(pause)
+
+
+_schedulers: Dict[Tuple[int, str], ProviderScheduler] = {}
+_lock = threading.Lock()
+
+
+def get_scheduler(name: str) -> ProviderScheduler:
+    """
+    Per-process scheduler for `name` (embed, transcribe, rerank, chat), from
+    <NAME>_RPM, <NAME>_TPM and <NAME>_MAX_CONCURRENCY. The concurrency limit
+    is per process; the buckets and cool-downs are shared through Redis.
+    """
+    key = (os.getpid(), name)
+    with _lock:
+        scheduler = _schedulers.get(key)
+        if scheduler is None:
+            prefix = name.upper()
+            scheduler = ProviderScheduler(
+                name,
+                rpm=float(os.getenv(f"{prefix}_RPM", "0")),
+                tpm=float(os.getenv(f"{prefix}_TPM", "0")),
+                max_concurrency=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", str(SCHEDULERS.get(name, 0)))),
+                max_retries=int(os.getenv("RATE_LIMIT_MAX_RETRIES", "5")),
+                cooldown=float(os.getenv("RATE_LIMIT_COOLDOWN", "2")),
+                latency_tolerance=float(os.getenv("RATE_LIMIT_LATENCY_TOLERANCE", "3")),
+            )
+            _schedulers[key] = scheduler
+        return scheduler
@@ -1,19 +1,26 @@
+import json
 import os
 from typing import List, Dict, Any
-from openai import OpenAI
 
-def rerank(query: str, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    if not hits or os.getenv("USE_RERANK") != "1" or not os.getenv("OPENAI_API_KEY"):
-        return hits
+from app.services.ai_provider import get_async_openai_client, get_openai_client
+from app.services import tracing
+from app.services.rate_limit import estimate_tokens, get_scheduler
+
+
+def _enabled(hits: List[Dict[str, Any]]) -> bool:
+    return bool(hits) and bool(os.getenv("OPENAI_API_KEY"))
 
-    client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
-    model = os.getenv("RERANK_MODEL", os.getenv("OPENAI_CHAT_MODEL", "gpt-4.1-mini"))
 
+def _model() -> str:
+    return os.getenv("RERANK_MODEL", os.getenv("OPENAI_CHAT_MODEL", "gpt-4.1-mini"))
+
+
+def _build_prompt(query: str, hits: List[Dict[str, Any]]) -> str:
     items = []
     for i, h in enumerate(hits, start=1):
         items.append(f"#{i}\nTITLE: {h.get('title','')}\nCONTENT:\n{(h.get('content','') or '')[:1500]}\n")
 
-    prompt = (
+    return (
         "You are reranking search results for a personal knowledge base.\n"
         "Given a user query and candidate passages, output a JSON array of item numbers "
         "sorted from most relevant to least relevant.\n"
@@ -22,11 +29,10 @@ def rerank(query: str, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         "ITEMS:\n" + "\n---\n".join(items)
     )
 
-    resp = client.responses.create(model=model, input=prompt)
-    text = resp.output_text.strip()
 
+def _apply_order(text: str, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     try:
-        order = __import__("json").loads(text)
+        order = json.loads(text)
         ordered = []
         seen = set()
         for idx in order:
@@ -40,3 +46,34 @@ def rerank(query: str, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         return ordered
     except Exception:
         return hits
+
+
+def rerank(query: str, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    if os.getenv("USE_RERANK") != "1" or not _enabled(hits):
+        return hits
+
+    client = get_openai_client()
+    prompt = _build_prompt(query, hits)
+    with tracing.span("rerank", model=_model(), candidates=len(hits)):
+        resp = get_scheduler("rerank").run(
+            lambda: client.responses.create(model=_model(), input=prompt), tokens=estimate_tokens([prompt])
+        )
+    return _apply_order(resp.output_text.strip(), hits)
+
+
+async def arerank(query: str, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    rerank() on the event loop with the shared AsyncOpenAI client. The caller
+    decides whether LLM rerank is on (RERANKER / USE_RERANK) and applies the timeout.
+    """
+    if not _enabled(hits):
+        return hits
+
+    client = get_async_openai_client()
+    prompt = _build_prompt(query, hits)
+    # includes any wait for the rerank rate limit
+    with tracing.span("rerank", model=_model(), candidates=len(hits)):
+        resp = await get_scheduler("rerank").arun(
+            lambda: client.responses.create(model=_model(), input=prompt), tokens=estimate_tokens([prompt])
+        )
+    return _apply_order(resp.output_text.strip(), hits)
@@ -1,30 +1,372 @@
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
 from sqlalchemy import text
-from app.services.ai_provider import get_embedder, vector_to_pgvector_literal
+from app.db.session import raw_connection
+from app.services.ai_provider import vector_to_pgvector_literal
+from app.services import compact_vectors, tracing
+from app.services.ann_index import ann_expr, index_predicate, query_expr
+from app.services.hot_tier import HotHit, get_hot_tier
+from app.services.query_cache import embed_query
 
-def retrieve_top_chunks(db, user_id: str, query: str, top_k: int = 5):
-    embedder = get_embedder()
-    qvecs, qdims, _ = embedder.embed_texts([query])
-    if not qvecs or not qvecs[0]:
-        return []
-    qvec_literal = vector_to_pgvector_literal(qvecs[0])
+log = logging.getLogger(__name__)
+
+MODES = ("vector", "lexical", "hybrid")
 
-    sql = text("""
-        SELECT
+_SELECT_HIT = """
           c.id::text AS chunk_id,
           c.content AS content,
           d.title AS title,
           d.source_uri AS source_uri,
-          c.captured_at AS captured_at,
-          (e.embedding <=> (:qvec)::vector) AS distance
-        FROM embeddings e
-        JOIN chunks c ON c.id = e.chunk_id
+          d.source_type AS source_type,
+          c.captured_at AS captured_at"""
+
+# Candidate vectors for local reranking (MMR); loaded as numpy via raw_connection().
+_SELECT_VECTOR = """,
+          (SELECT ev.embedding FROM embeddings ev WHERE ev.chunk_id = c.id) AS vector"""
+
+
+
+class RetrievalFilter(NamedTuple):
+    """Applied in SQL before ranking. captured_before is exclusive; naive datetimes are UTC."""
+    captured_after: Optional[datetime] = None
+    captured_before: Optional[datetime] = None
+    source_types: Optional[Sequence[str]] = None
+
+    @property
+    def active(self) -> bool:
+        return bool(self.captured_after or self.captured_before or self.source_types)
+
+
+def _utc(d: Optional[datetime]) -> Optional[datetime]:
+    return d.replace(tzinfo=timezone.utc) if d is not None and d.tzinfo is None else d
+
+
+def _filter_sql(filters: Optional[RetrievalFilter], alias: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Extra WHERE terms for `alias`: "e" (embeddings, which carry copies of
+    source_type and captured_at, so vector search needs no join) or "c"
+    (chunks, for full-text candidates; source_type comes from documents).
+    Both tables have a (user_id, captured_at) index.
+    """
+    if filters is None or not filters.active:
+        return "", {}
+    terms, params = [], {}
+    if filters.captured_after:
+        terms.append(f"{alias}.captured_at >= :captured_after")
+        params["captured_after"] = _utc(filters.captured_after)
+    if filters.captured_before:
+        terms.append(f"{alias}.captured_at < :captured_before")
+        params["captured_before"] = _utc(filters.captured_before)
+    if filters.source_types:
+        if alias == "e":
+            terms.append("e.source_type = ANY(:source_types)")
+        else:
+            terms.append(
+                f"{alias}.document_id IN (SELECT fd.id FROM documents fd"
+                " WHERE fd.user_id = :user_id AND fd.source_type = ANY(:source_types))"
+            )
+        params["source_types"] = list(filters.source_types)
+    return "".join(f"\n              AND {t}" for t in terms), params
+
+
+def _lexical_candidates(where: str = "") -> str:
+    # websearch_to_tsquery accepts free text ("quoted phrases", -exclusions) without syntax errors.
+    return f"""
+        SELECT c.id AS chunk_id,
+               ROW_NUMBER() OVER (ORDER BY ts_rank_cd(c.content_tsv, q.tsq) DESC) AS rnk
+        FROM chunks c, websearch_to_tsquery('english', :query) AS q(tsq)
+        WHERE c.user_id = :user_id
+          AND c.content_tsv @@ q.tsq{where}
+        ORDER BY ts_rank_cd(c.content_tsv, q.tsq) DESC
+        LIMIT :n_candidates"""
+
+
+_iterative_scan_supported: Optional[bool] = None
+
+
+def _supports_iterative_scan(db) -> bool:
+    """Whether the installed pgvector (>= 0.8) has the *.iterative_scan settings; checked once per process."""
+    global _iterative_scan_supported
+    if _iterative_scan_supported is None:
+        version = db.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+        try:
+            parts = tuple(int(p) for p in (version or "0").split(".")[:2])
+        except ValueError:
+            parts = (0,)
+        _iterative_scan_supported = parts >= (0, 8)
+        if not _iterative_scan_supported and os.getenv("ANN_ITERATIVE_SCAN", "relaxed_order"):
+            log.info("pgvector %s has no iterative index scans; ANN_ITERATIVE_SCAN ignored", version)
+    return _iterative_scan_supported
+
+
+def _set_ann_params(db, top_k: int, ef_search: Optional[int], probes: Optional[int]) -> None:
+    # set_config(..., true) == SET LOCAL: scoped to the session's current transaction.
+    ef = ef_search or int(os.getenv("HNSW_EF_SEARCH", "40"))
+    probes = probes or int(os.getenv("IVFFLAT_PROBES", "1"))
+    params = {"hnsw.ef_search": str(max(ef, top_k)), "ivfflat.probes": str(probes)}
+    # pgvector >= 0.8: keep scanning the index until enough rows pass the user_id filter.
+    # Older versions reject the settings (the hnsw. prefix is reserved once the extension is loaded).
+    iterative = os.getenv("ANN_ITERATIVE_SCAN", "relaxed_order")
+    if iterative and _supports_iterative_scan(db):
+        params["hnsw.iterative_scan"] = iterative
+        params["ivfflat.iterative_scan"] = iterative
+    for name, value in params.items():
+        db.execute(text("SELECT set_config(:name, :value, true)"), {"name": name, "value": value})
+
+
+def _distance_expr(qdims: int) -> str:
+    # Cast to the fixed dimension so the partial per-(model, dims) HNSW/IVFFlat
+    # indexes from app.services.ann_index apply.
+    return f"{ann_expr(qdims, 'e.embedding')} <=> {query_expr(qdims)}"
+
+
+def _rescored_candidates(kind: str, qdims: int, predicate: str, vec_where: str, limit: str) -> str:
+    """
+    Two-phase vector candidates: the nearest :n_coarse rows by the compact
+    column (halfvec cosine or bit Hamming, via its own index), reranked by
+    exact distance on the full vectors, best `limit` kept.
+    """
+    coarse = (
+        f"{compact_vectors.column_expr(kind, qdims, 'e')} {compact_vectors.distance_op(kind)} "
+        f"{compact_vectors.query_expr(kind, qdims)}"
+    )
+    return f"""
+            SELECT e.chunk_id, ({_distance_expr(qdims)}) AS distance
+            FROM (
+              SELECT e.chunk_id
+              FROM embeddings e
+              WHERE e.user_id = :user_id
+                AND {predicate}{vec_where}
+              ORDER BY {coarse}
+              LIMIT :n_coarse
+            ) coarse
+            JOIN embeddings e ON e.chunk_id = coarse.chunk_id
+            ORDER BY distance
+            LIMIT {limit}"""
+
+
+def _hot_search(user_id: str, qvec: List[float], qdims: int, qmodel: str, top_k: int,
+                filters: Optional[RetrievalFilter]) -> Optional[List[HotHit]]:
+    """Exact top-k from the in-process hot tier, or None when the user's matrix is not loaded."""
+    tier = get_hot_tier()
+    matrix = tier.get(user_id, qmodel, qdims) if tier else None
+    if matrix is None:
+        return None
+    f = filters or RetrievalFilter()
+    return matrix.search(qvec, top_k, _utc(f.captured_after), _utc(f.captured_before), f.source_types)
+
+
+def _hot_hits(db, user_id: str, hot: List[HotHit], with_vectors: bool) -> List[Dict[str, Any]]:
+    # the ranking is done; Postgres only supplies the hit rows, by primary key
+    if not hot:
+        return []
+    rows = db.execute(text(f"""
+        SELECT {_SELECT_HIT},
+          x.distance AS distance
+        FROM unnest(CAST(:ids AS uuid[]), CAST(:distances AS float8[])) WITH ORDINALITY AS x(chunk_id, distance, ord)
+        JOIN chunks c ON c.id = x.chunk_id
         JOIN documents d ON d.id = c.document_id
-        WHERE e.user_id = :user_id
-          AND e.dims = :qdims
-        ORDER BY e.embedding <=> (:qvec)::vector
-        LIMIT :top_k
-    """)
+        WHERE c.user_id = :user_id
+        ORDER BY x.ord
+    """), {
+        "ids": [h.chunk_id for h in hot],
+        "distances": [h.distance for h in hot],
+        "user_id": user_id,
+    }).mappings().all()
+    if not with_vectors:
+        return [dict(r) for r in rows]
+    vectors = {h.chunk_id: h.vector for h in hot}
+    return [{**r, "vector": vectors[r["chunk_id"]]} for r in rows]
+
+
+def resolve_mode(mode: Optional[str]) -> str:
+    mode = (mode or os.getenv("RETRIEVAL_MODE", "vector")).lower()
+    if mode not in MODES:
+        raise ValueError(f"unknown retrieval mode {mode!r}, expected one of {MODES}")
+    return mode
+
+
+def retrieve_top_chunks(
+    db,
+    user_id: str,
+    query: str,
+    top_k: int = 5,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    mode: Optional[str] = None,
+    with_vectors: bool = False,
+    filters: Optional[RetrievalFilter] = None,
+):
+    """
+    mode: "vector" (pgvector cosine), "lexical" (tsvector full-text) or
+    "hybrid" (both candidate lists fused with reciprocal rank fusion in one
+    query). Defaults to RETRIEVAL_MODE, else "vector". with_vectors adds each
+    hit's embedding as "vector" for local reranking. filters restricts the
+    candidates by captured_at and source type before ranking.
+    """
+    mode = resolve_mode(mode)
+    qvec, qdims, qmodel = [], 0, ""
+    if mode != "lexical":
+        with tracing.span("embed_query"):
+            qvec, qdims, qmodel = embed_query(query)
+    return search_chunks(
+        db, user_id, query, qvec, qdims, qmodel, top_k, ef_search, probes, mode, with_vectors, filters
+    )
+
 
-    return db.execute(
-        sql, {"qvec": qvec_literal, "user_id": user_id, "qdims": qdims, "top_k": top_k}
-    ).mappings().all()
+def search_chunks(
+    db,
+    user_id: str,
+    query: str,
+    qvec: List[float],
+    qdims: int,
+    qmodel: str,
+    top_k: int = 5,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    mode: str = "vector",
+    with_vectors: bool = False,
+    filters: Optional[RetrievalFilter] = None,
+):
+    """The SQL half of retrieve_top_chunks, for callers that embed the query themselves."""
+    with tracing.span("search", mode=mode, top_k=top_k) as span:
+        hits = _search_chunks(
+            db, user_id, query, qvec, qdims, qmodel, top_k, ef_search, probes, mode, with_vectors, filters
+        )
+        span.set(hits=len(hits))
+        return hits
+
+
+def _search_chunks(
+    db,
+    user_id: str,
+    query: str,
+    qvec: List[float],
+    qdims: int,
+    qmodel: str,
+    top_k: int,
+    ef_search: Optional[int],
+    probes: Optional[int],
+    mode: str,
+    with_vectors: bool,
+    filters: Optional[RetrievalFilter],
+):
+    select_hit = _SELECT_HIT
+    vec_where, params = _filter_sql(filters, "e")
+    lex_where, lex_params = _filter_sql(filters, "c")
+    params.update(lex_params)
+    if with_vectors:
+        raw_connection(db)
+        select_hit += _SELECT_VECTOR
+
+    if mode == "lexical":
+        sql = text(f"""
+            WITH lex AS ({_lexical_candidates(lex_where)})
+            SELECT {select_hit},
+              NULL::float8 AS distance
+            FROM lex
+            JOIN chunks c ON c.id = lex.chunk_id
+            JOIN documents d ON d.id = c.document_id
+            ORDER BY lex.rnk
+        """)
+        return db.execute(
+            sql, {"query": query, "user_id": user_id, "n_candidates": top_k, **params}
+        ).mappings().all()
+
+    if not qvec:
+        return []
+    if mode == "vector":
+        hot = _hot_search(user_id, qvec, qdims, qmodel, top_k, filters)
+        tracing.annotate(hot_tier=hot is not None)
+        if hot is not None:
+            return _hot_hits(db, user_id, hot, with_vectors)
+    qvec_literal = vector_to_pgvector_literal(qvec)
+
+    kind = compact_vectors.search_kind()
+    if kind:
+        tracing.annotate(compact=kind)
+    n_candidates = max(top_k, int(os.getenv("HYBRID_CANDIDATES", "50")))
+    n_coarse = compact_vectors.rescore_candidates(top_k if mode == "vector" else n_candidates)
+    # the compact index has to return all n_coarse rows
+    _set_ann_params(db, n_coarse if kind else top_k, ef_search, probes)
+    distance = _distance_expr(qdims)
+    predicate = index_predicate(qmodel, qdims, alias="e")
+
+    if mode == "vector" and kind:
+        sql = text(f"""
+            WITH v AS ({_rescored_candidates(kind, qdims, predicate, vec_where, ":top_k")})
+            SELECT {select_hit},
+              v.distance AS distance
+            FROM v
+            JOIN chunks c ON c.id = v.chunk_id
+            JOIN documents d ON d.id = c.document_id
+            ORDER BY v.distance
+        """)
+        return db.execute(
+            sql, {"qvec": qvec_literal, "user_id": user_id, "top_k": top_k, "n_coarse": n_coarse, **params}
+        ).mappings().all()
+
+    if mode == "vector":
+        sql = text(f"""
+            SELECT {select_hit},
+              ({distance}) AS distance
+            FROM embeddings e
+            JOIN chunks c ON c.id = e.chunk_id
+            JOIN documents d ON d.id = c.document_id
+            WHERE e.user_id = :user_id
+              AND {predicate}{vec_where}
+            ORDER BY {distance}
+            LIMIT :top_k
+        """)
+        return db.execute(
+            sql, {"qvec": qvec_literal, "user_id": user_id, "top_k": top_k, **params}
+        ).mappings().all()
+
+    # hybrid: RRF score = sum over lists of 1 / (k + rank)
+    if kind:
+        vec_candidates = _rescored_candidates(kind, qdims, predicate, vec_where, ":n_candidates")
+    else:
+        vec_candidates = f"""
+            SELECT e.chunk_id, ({distance}) AS distance
+            FROM embeddings e
+            WHERE e.user_id = :user_id
+              AND {predicate}{vec_where}
+            ORDER BY {distance}
+            LIMIT :n_candidates"""
+    sql = text(f"""
+        WITH vec AS (
+          SELECT chunk_id, distance, ROW_NUMBER() OVER (ORDER BY distance) AS rnk
+          FROM ({vec_candidates}
+          ) v
+        ),
+        lex AS ({_lexical_candidates(lex_where)}),
+        fused AS (
+          SELECT COALESCE(vec.chunk_id, lex.chunk_id) AS chunk_id,
+                 vec.distance AS distance,
+                 COALESCE(1.0 / (:rrf_k + vec.rnk), 0) + COALESCE(1.0 / (:rrf_k + lex.rnk), 0) AS score
+          FROM vec
+          FULL OUTER JOIN lex ON lex.chunk_id = vec.chunk_id
+          ORDER BY score DESC
+          LIMIT :top_k
+        )
+        SELECT {select_hit},
+          f.distance AS distance,
+          f.score AS score
+        FROM fused f
+        JOIN chunks c ON c.id = f.chunk_id
+        JOIN documents d ON d.id = c.document_id
+        ORDER BY f.score DESC
+    """)
+    return db.execute(sql, {
+        "qvec": qvec_literal,
+        "query": query,
+        "user_id": user_id,
+        "top_k": top_k,
+        "n_candidates": n_candidates,
+        "n_coarse": n_coarse,
+        "rrf_k": int(os.getenv("RRF_K", "60")),
+        **params,
+    }).mappings().all()
@@ -0,0 +1,332 @@
+# app/services/tracing.py
+"""
+Lightweight request tracing for /chat.
+
+A sampled request gets a Trace: a root span plus child spans opened with
+span() anywhere below it (query embedding, the retrieval SQL, rerank, the
+completion). The current span lives in a contextvar, so spans nest across
+awaits and into run_in_threadpool. An unsampled request has no Trace and
+span() costs one contextvar lookup, which keeps TRACE_SAMPLE_RATE cheap to
+leave on.
+
+Finished traces are summarized in a Server-Timing header by the caller and,
+with TRACE_EXPORT set, written as OTLP/JSON (ExportTraceServiceRequest) by a
+background thread: one JSON line per batch appended to a file, or POSTed to
+a collector's /v1/traces. A W3C traceparent header on the request is
+honoured: its trace id and parent span are kept and its sampled flag decides.
+"""
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+log = logging.getLogger(__name__)
+
+# OTLP span kinds and status codes
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+STATUS_ERROR = 2
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("trace_span", default=None)
+
+
+def _sample_rate() -> float:
+    return float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+
+
+def _random_id(n_bytes: int) -> str:
+    return f"{random.getrandbits(n_bytes * 8):0{n_bytes * 2}x}"
+
+
+class Span:
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], kind: int = KIND_INTERNAL,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.trace = trace
+        self.name = name
+        self.span_id = _random_id(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.error: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self._t0 = time.perf_counter_ns()
+        self.duration_ns: Optional[int] = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        if self.duration_ns is not None:
+            return
+        self.duration_ns = time.perf_counter_ns() - self._t0
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}" if str(error) else type(error).__name__
+
+    @property
+    def duration_ms(self) -> float:
+        """Milliseconds from start to end, or until now while the span is open."""
+        if self.duration_ns is None:
+            return (time.perf_counter_ns() - self._t0) / 1e6
+        return self.duration_ns / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        out = {"name": self.name, "duration_ms": round(self.duration_ms, 3), **self.attributes}
+        if self.error:
+            out["error"] = self.error
+        return out
+
+    def to_otlp(self) -> Dict[str, Any]:
+        out = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.start_ns + (self.duration_ns or 0)),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items() if v is not None],
+        }
+        if self.parent_id:
+            out["parentSpanId"] = self.parent_id
+        if self.error:
+            out["status"] = {"code": STATUS_ERROR, "message": self.error}
+        return out
+
+
+class _NoopSpan:
+    def set(self, **attributes: Any) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    def __init__(self, name: str, trace_id: Optional[str] = None, parent_id: Optional[str] = None):
+        self.trace_id = trace_id or _random_id(16)
+        self.spans: List[Span] = []  # finished children, in end order (list.append is thread-safe)
+        self.root = Span(self, name, parent_id, KIND_SERVER)
+
+    def server_timing(self) -> str:
+        """
+        Server-Timing header value: total (so far, if the trace is still open),
+        then milliseconds per finished span name, repeats summed.
+        """
+        totals: Dict[str, float] = OrderedDict()
+        for s in sorted(self.spans, key=lambda s: s.start_ns):
+            totals[s.name] = totals.get(s.name, 0.0) + s.duration_ms
+        parts = [f"total;dur={self.root.duration_ms:.1f}"]
+        parts += [f"{name};dur={ms:.1f}" for name, ms in totals.items()]
+        return ", ".join(parts)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The trace for a debug response body: id, total and spans in start order."""
+        return {
+            "trace_id": self.trace_id,
+            "total_ms": round(self.root.duration_ms, 3),
+            "spans": [s.to_dict() for s in sorted(self.spans, key=lambda s: s.start_ns)],
+        }
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        v = {"boolValue": value}
+    elif isinstance(value, int):
+        v = {"intValue": str(value)}
+    elif isinstance(value, float):
+        v = {"doubleValue": value}
+    else:
+        v = {"stringValue": str(value)}
+    return {"key": key, "value": v}
+
+
+def start_trace(name: str, traceparent: Optional[str] = None, force: bool = False) -> Optional[Trace]:
+    """
+    A new Trace if this request is sampled, else None. A valid traceparent
+    header makes the decision (its sampled flag) and supplies the ids;
+    otherwise TRACE_SAMPLE_RATE does. force samples regardless.
+    """
+    trace_id = parent_id = None
+    m = _TRACEPARENT.match((traceparent or "").strip().lower())
+    if m and int(m.group(1), 16) and int(m.group(2), 16):
+        trace_id, parent_id = m.group(1), m.group(2)
+        sampled = bool(int(m.group(3), 16) & 1)
+    else:
+        rate = _sample_rate()
+        sampled = rate > 0 and (rate >= 1 or random.random() < rate)
+    if not (sampled or force):
+        return None
+    return Trace(name, trace_id, parent_id)
+
+
+def _reset(token: contextvars.Token) -> None:
+    try:
+        _current.reset(token)
+    except ValueError:
+        # an async generator closed from another task (client went away)
+        pass
+
+
+@contextmanager
+def use(trace: Optional[Trace]) -> Iterator[Optional[Trace]]:
+    """Makes trace's root span the parent of span() calls in this context."""
+    if trace is None:
+        yield None
+        return
+    token = _current.set(trace.root)
+    try:
+        yield trace
+    finally:
+        _reset(token)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Any]:
+    """
+    Child span of the current one, timed over the block; yields it so the
+    block can set() attributes. Outside a sampled trace this yields a no-op.
+    An exception leaving the block marks the span as an error.
+    """
+    parent = _current.get()
+    if parent is None:
+        yield NOOP_SPAN
+        return
+    s = Span(parent.trace, name, parent.span_id, attributes=attributes)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.end(e)
+        raise
+    finally:
+        _reset(token)
+        s.end()
+        parent.trace.spans.append(s)
+
+
+def annotate(**attributes: Any) -> None:
+    """Sets attributes on the current span, if any."""
+    s = _current.get()
+    if s is not None:
+        s.set(**attributes)
+
+
+def finish(trace: Optional[Trace], error: Optional[BaseException] = None) -> None:
+    """Ends the root span and queues the trace for export (TRACE_EXPORT)."""
+    if trace is None:
+        return
+    trace.root.end(error)
+    exporter = get_exporter()
+    if exporter:
+        exporter.submit(trace)
+
+
+# ---------------------------------------------------------------- export
+
+def otlp_request(traces: List[Trace]) -> Dict[str, Any]:
+    """OTLP/JSON ExportTraceServiceRequest for finished traces."""
+    spans = [s.to_otlp() for t in traces for s in [t.root, *t.spans]]
+    return {"resourceSpans": [{
+        "resource": {"attributes": [_otlp_attribute("service.name", os.getenv("OTEL_SERVICE_NAME", "twinmind-api"))]},
+        "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+    }]}
+
+
+class Exporter:
+    """
+    Writes traces off the request path: submit() only enqueues (dropping
+    when TRACE_EXPORT_QUEUE traces are already waiting), and a daemon thread
+    sends whatever has queued up, up to TRACE_EXPORT_BATCH traces at a time.
+    """
+
+    def __init__(self, target: str, max_queue: int = 2048, batch: int = 256):
+        self.target = target
+        self.batch = max(1, batch)
+        self.dropped = 0
+        self.exported = 0
+        self._queue: "queue.Queue[Optional[Trace]]" = queue.Queue(maxsize=max_queue)
+        self._client = None
+        self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+        self._thread.start()
+
+    def submit(self, trace: Trace) -> None:
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout: float = 5.0) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            traces = [first] if first is not None else []
+            while first is not None and len(traces) < self.batch:
+                try:
+                    t = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if t is None:
+                    first = None
+                    break
+                traces.append(t)
+            if traces:
+                try:
+                    self._send(otlp_request(traces))
+                    self.exported += len(traces)
+                except Exception:
+                    log.warning("trace export to %s failed; %d traces lost", self.target, len(traces), exc_info=True)
+            if first is None:
+                return
+
+    def _send(self, body: Dict[str, Any]) -> None:
+        if not self.target.startswith(("http://", "https://")):
+            with open(self.target, "a", encoding="utf-8") as f:
+                f.write(json.dumps(body, separators=(",", ":")) + "\n")
+            return
+        if self._client is None:
+            import httpx
+
+            self._client = httpx.Client(timeout=10.0)
+        url = self.target if self.target.rstrip("/").endswith("/v1/traces") else self.target.rstrip("/") + "/v1/traces"
+        self._client.post(url, json=body).raise_for_status()
+
+
+_exporters: Dict[int, Exporter] = {}
+_exporters_lock = threading.Lock()
+
+
+def get_exporter() -> Optional[Exporter]:
+    """This process's exporter, or None without TRACE_EXPORT (a file path or collector URL)."""
+    target = os.getenv("TRACE_EXPORT")
+    if not target:
+        return None
+    pid = os.getpid()
+    with _exporters_lock:
+        exporter = _exporters.get(pid)
+        if exporter is None:
+            exporter = Exporter(
+                target,
+                max_queue=int(os.getenv("TRACE_EXPORT_QUEUE", "2048")),
+                batch=int(os.getenv("TRACE_EXPORT_BATCH", "256")),
+            )
+            _exporters[pid] = exporter
+        return exporter
+
+
+def shutdown() -> None:
+    """Flushes this process's exporter (API shutdown)."""
+    with _exporters_lock:
+        exporter = _exporters.pop(os.getpid(), None)
+    if exporter:
+        exporter.close()
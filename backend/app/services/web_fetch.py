@@ -0,0 +1,87 @@
+# app/services/web_fetch.py
+import importlib.util
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
+
+import httpx
+
+USER_AGENT = "TwinMind/1.0"
+
+_clients: Dict[int, httpx.Client] = {}
+_host_slots: Dict[Tuple[int, str], threading.BoundedSemaphore] = {}
+_lock = threading.Lock()
+
+
+class FetchResult(NamedTuple):
+    status_code: int
+    text: str  # empty on 304
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status_code == 304
+
+
+def _http2() -> bool:
+    # HTTP/2 needs the optional h2 package (httpx[http2]); HTTP/1.1 otherwise.
+    return os.getenv("FETCH_HTTP2", "1") == "1" and importlib.util.find_spec("h2") is not None
+
+
+def get_web_client() -> httpx.Client:
+    """
+    One pooled client per worker process for page fetches, so URLs on the
+    same host reuse connections (and HTTP/2 multiplexes them) across jobs.
+    """
+    pid = os.getpid()
+    with _lock:
+        client = _clients.get(pid)
+        if client is None:
+            client = httpx.Client(
+                http2=_http2(),
+                follow_redirects=True,
+                timeout=float(os.getenv("FETCH_TIMEOUT", "15")),
+                headers={"User-Agent": USER_AGENT},
+                limits=httpx.Limits(
+                    max_connections=int(os.getenv("FETCH_MAX_CONNECTIONS", "64")),
+                    max_keepalive_connections=int(os.getenv("FETCH_MAX_KEEPALIVE", "32")),
+                ),
+            )
+            _clients[pid] = client
+        return client
+
+
+@contextmanager
+def host_slot(host: str) -> Iterator[None]:
+    # At most FETCH_PER_HOST_CONCURRENCY requests in flight per host in this
+    # process; matters for thread/gevent pools running many fetch jobs at once.
+    key = (os.getpid(), host.lower())
+    with _lock:
+        slot = _host_slots.get(key)
+        if slot is None:
+            slot = threading.BoundedSemaphore(max(1, int(os.getenv("FETCH_PER_HOST_CONCURRENCY", "4"))))
+            _host_slots[key] = slot
+    with slot:
+        yield
+
+
+def fetch_url(url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> FetchResult:
+    """
+    GET `url`, conditionally when validators from an earlier fetch are given.
+    A 304 comes back as FetchResult(304, "", ...) without reading a body.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    client = get_web_client()
+    with host_slot(httpx.URL(url).host):
+        r = client.get(url, headers=headers)
+    if r.status_code == 304:
+        return FetchResult(304, "", r.headers.get("etag") or etag, r.headers.get("last-modified") or last_modified)
+    r.raise_for_status()
+    return FetchResult(r.status_code, r.text, r.headers.get("etag"), r.headers.get("last-modified"))
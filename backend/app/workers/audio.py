@@ -0,0 +1,192 @@
+# app/workers/audio.py
+import difflib
+import os
+import re
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from openai import OpenAI
+
+from app.services.rate_limit import get_scheduler
+
+
+class TranscriptPiece(NamedTuple):
+    text: str
+    start_ms: Optional[int]  # absolute offsets into the recording, None if unknown
+    end_ms: Optional[int]
+
+
+# (audio path, upload filename) -> (pieces with times relative to the file, timed?)
+# timed=False means one piece covering the whole file, without word timings.
+Transcriber = Callable[[str, str], Tuple[List[TranscriptPiece], bool]]
+
+_DURATION_RE = re.compile(rb"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+_WORD_RE = re.compile(r"\w+")
+# words compared on each side of a segment boundary when stitching untimed text
+_STITCH_WORDS = 80
+_STITCH_MIN_MATCH = 3
+
+
+def _ffmpeg() -> str:
+    return os.getenv("FFMPEG_BINARY", "ffmpeg")
+
+
+def probe_duration_ms(path: str) -> Optional[int]:
+    """Duration from ffmpeg's input banner; None if ffmpeg is missing or can't read the file."""
+    try:
+        proc = subprocess.run([_ffmpeg(), "-hide_banner", "-nostdin", "-i", path], capture_output=True, timeout=60)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    m = _DURATION_RE.search(proc.stderr)
+    if not m:
+        return None
+    h, mi, s = m.groups()
+    return int((int(h) * 3600 + int(mi) * 60 + float(s)) * 1000)
+
+
+def segment_bounds(duration_ms: int, segment_ms: int, overlap_ms: int) -> List[Tuple[int, int]]:
+    if overlap_ms >= segment_ms:
+        raise ValueError("segment overlap must be shorter than the segment")
+    if duration_ms <= segment_ms:
+        return [(0, duration_ms)]
+    bounds = []
+    start = 0
+    while True:
+        end = min(start + segment_ms, duration_ms)
+        bounds.append((start, end))
+        if end >= duration_ms:
+            return bounds
+        start += segment_ms - overlap_ms
+
+
+def cut_segment(path: str, start_ms: int, end_ms: int, out_path: str) -> None:
+    # 16 kHz mono PCM: what speech models resample to anyway, ~1.9 MB per minute.
+    subprocess.run(
+        [
+            _ffmpeg(), "-hide_banner", "-nostdin", "-loglevel", "error", "-y",
+            "-ss", f"{start_ms / 1000:.3f}", "-t", f"{(end_ms - start_ms) / 1000:.3f}",
+            "-i", path, "-vn", "-ac", "1", "-ar", "16000", "-c:a", "pcm_s16le", out_path,
+        ],
+        check=True,
+        capture_output=True,
+        timeout=600,
+    )
+
+
+def openai_transcriber(client: OpenAI, model: str) -> Transcriber:
+    # Only whisper-1 returns segment timestamps (verbose_json); the gpt-4o
+    # transcribe models return text, timed at segment granularity.
+    timed = model.startswith("whisper")
+
+    scheduler = get_scheduler("transcribe")
+
+    def create(path: str, filename: str, **kwargs):
+        with open(path, "rb") as fh:  # reopened per attempt, since a retry re-sends the file
+            return client.audio.transcriptions.create(model=model, file=(filename, fh), **kwargs)
+
+    def transcribe(path: str, filename: str) -> Tuple[List[TranscriptPiece], bool]:
+        # latency is judged per 100 KB sent, so the short last segment does not skew it
+        units = os.path.getsize(path) // 100_000 + 1
+        if not timed:
+            resp = scheduler.run(lambda: create(path, filename), units=units)
+            return [TranscriptPiece(resp.text or "", 0, None)], False
+        resp = scheduler.run(lambda: create(path, filename, response_format="verbose_json"), units=units)
+        pieces = [
+            TranscriptPiece(s.text, int(s.start * 1000), int(s.end * 1000))
+            for s in (resp.segments or [])
+        ]
+        return pieces, True
+
+    return transcribe
+
+
+def _stitch_text(prev: str, text: str) -> Tuple[str, str]:
+    # Both transcripts contain the overlap; find the longest common word run
+    # between prev's tail and text's head and join there, which also drops
+    # words garbled by the cut on either side.
+    prev_words = list(_WORD_RE.finditer(prev))[-_STITCH_WORDS:]
+    words = list(_WORD_RE.finditer(text))[:_STITCH_WORDS]
+    a = [m.group().lower() for m in prev_words]
+    b = [m.group().lower() for m in words]
+    match = difflib.SequenceMatcher(None, a, b, autojunk=False).find_longest_match(0, len(a), 0, len(b))
+    if match.size < _STITCH_MIN_MATCH:
+        return prev, text
+    last = match.a + match.size - 1
+    return prev[:prev_words[last].end()], text[words[match.b + match.size - 1].end():].lstrip(" ,.;:!?-")
+
+
+def stitch(
+    segments: List[Tuple[Tuple[int, int], List[TranscriptPiece], bool]],
+    overlap_ms: int,
+) -> List[TranscriptPiece]:
+    """
+    Joins per-segment transcripts (relative times) into absolute pieces.
+    Neighbours are cut at the middle of their overlap: timed pieces by start
+    time, untimed segment texts by matching the duplicated words.
+    """
+    out: List[TranscriptPiece] = []
+    prev_timed = True
+    for i, ((seg_start, seg_end), pieces, timed) in enumerate(segments):
+        cut = seg_start + overlap_ms // 2 if i else seg_start
+        if timed:
+            pieces = [
+                TranscriptPiece(p.text, seg_start + p.start_ms, seg_start + p.end_ms)
+                for p in pieces
+            ]
+            if i:
+                out = [p for p in out if not prev_timed or p.start_ms < cut]
+                pieces = [p for p in pieces if p.start_ms >= cut]
+        else:
+            text = " ".join(p.text for p in pieces)
+            if i and out and not prev_timed:
+                head, text = _stitch_text(out[-1].text, text)
+                out[-1] = TranscriptPiece(head, out[-1].start_ms, cut)
+            pieces = [TranscriptPiece(text, cut, seg_end)]
+        out.extend(pieces)
+        prev_timed = timed
+    return [p for p in out if p.text.strip()]
+
+
+def transcribe_audio(
+    path: str,
+    filename: str,
+    transcribe: Transcriber,
+    segment_ms: Optional[int] = None,
+    overlap_ms: Optional[int] = None,
+    concurrency: Optional[int] = None,
+) -> List[TranscriptPiece]:
+    """
+    Transcript of the recording at `path` as pieces with absolute times.
+    Recordings longer than AUDIO_SEGMENT_SECONDS (default 600) are cut with
+    ffmpeg into segments overlapping by AUDIO_SEGMENT_OVERLAP_SECONDS
+    (default 5), transcribed AUDIO_TRANSCRIBE_CONCURRENCY (default 4) at a
+    time, and stitched. Without ffmpeg the file is sent whole.
+    """
+    segment_ms = segment_ms or int(float(os.getenv("AUDIO_SEGMENT_SECONDS", "600")) * 1000)
+    overlap_ms = overlap_ms if overlap_ms is not None else int(float(os.getenv("AUDIO_SEGMENT_OVERLAP_SECONDS", "5")) * 1000)
+    concurrency = concurrency or max(1, int(os.getenv("AUDIO_TRANSCRIBE_CONCURRENCY", "4")))
+
+    duration_ms = probe_duration_ms(path)
+    bounds = segment_bounds(duration_ms, segment_ms, overlap_ms) if duration_ms else []
+    if len(bounds) <= 1:
+        pieces, timed = transcribe(path, filename)
+        if not timed:
+            pieces = [TranscriptPiece(p.text, 0, duration_ms) for p in pieces]
+        return [p for p in pieces if p.text.strip()]
+
+    with tempfile.TemporaryDirectory(prefix="transcribe-") as tmp:
+        def run(i: int) -> Tuple[List[TranscriptPiece], bool]:
+            start, end = bounds[i]
+            seg_path = os.path.join(tmp, f"segment-{i:05d}.wav")
+            cut_segment(path, start, end, seg_path)
+            try:
+                return transcribe(seg_path, f"segment-{i:05d}.wav")
+            finally:
+                os.unlink(seg_path)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(run, range(len(bounds))))
+
+    return stitch([(b, pieces, timed) for b, (pieces, timed) in zip(bounds, results)], overlap_ms)
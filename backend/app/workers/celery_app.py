@@ -1,5 +1,10 @@
+import os
+
 from celery import Celery
+from celery.signals import worker_process_shutdown, worker_ready
+
 from app.core.config import settings
+from app.services import metrics
 
 celery = Celery(
     "twinmind",
@@ -8,4 +13,25 @@ celery = Celery(
     include=["app.workers.tasks"],
 )
 
-celery.conf.task_routes = {"app.workers.tasks.*": {"queue": "ingest"}}
+# Staged pipeline: one queue per stage so each worker pool can be sized for
+# its kind of work (network-bound fetch/transcribe/embed, CPU-bound extract/chunk,
+# DB-bound persist). The all-in-one tasks stay on "ingest".
+celery.conf.task_routes = {
+    "app.workers.tasks.extract_stage": {"queue": "ingest.extract"},
+    "app.workers.tasks.chunk_stage": {"queue": "ingest.chunk"},
+    "app.workers.tasks.embed_stage": {"queue": "ingest.embed"},
+    "app.workers.tasks.persist_stage": {"queue": "ingest.persist"},
+    "app.workers.tasks.*": {"queue": "ingest"},
+}
+
+
+# Prometheus: with PROMETHEUS_MULTIPROC_DIR the prefork children write their
+# samples to files and the main process serves them merged (metrics.py).
+@worker_ready.connect
+def _start_metrics_exporter(**_):
+    metrics.start_worker_exporter()
+
+
+@worker_process_shutdown.connect
+def _metrics_process_exited(pid=None, **_):
+    metrics.process_exited(pid or os.getpid())
@@ -0,0 +1,222 @@
+import os
+import re
+from collections import deque
+from functools import lru_cache
+from typing import Deque, Iterable, Iterator, List, NamedTuple, Tuple, Union
+
+import numpy as np
+import tiktoken
+
+BOUNDARIES = ("token", "sentence", "paragraph")
+PART_SEPARATOR = "\n\n"
+# token mode encodes the input in blocks of roughly this many chars, cut at whitespace
+_BLOCK_CHARS = 8192
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n")
+
+
+class TextChunk(NamedTuple):
+    content: str
+    token_count: int
+    char_start: int  # offsets into the (joined) input text
+    char_end: int
+
+
+class _Unit(NamedTuple):
+    start: int
+    end: int
+    tokens: int
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name: str = "cl100k_base") -> tiktoken.Encoding:
+    # Loading the BPE ranks is expensive; one encoder per process.
+    return tiktoken.get_encoding(name)
+
+
+def _spans(text: str, pattern: re.Pattern) -> Iterator[Tuple[int, int]]:
+    pos = 0
+    for m in pattern.finditer(text):
+        if m.start() > pos:
+            yield pos, m.start()
+        pos = m.end()
+    if pos < len(text):
+        yield pos, len(text)
+
+
+def _blocks(text: str) -> Iterator[Tuple[int, int]]:
+    pos = 0
+    while pos < len(text):
+        end = min(pos + _BLOCK_CHARS, len(text))
+        if end < len(text):
+            cut = max(text.rfind(" ", pos, end), text.rfind("\n", pos, end))
+            if cut > pos:
+                end = cut
+        yield pos, end
+        pos = end
+
+
+@lru_cache(maxsize=None)
+def _token_byte_lengths(enc: tiktoken.Encoding) -> np.ndarray:
+    lengths = np.zeros(enc.n_vocab, dtype=np.int64)
+    for i in range(enc.n_vocab):
+        try:
+            lengths[i] = len(enc.decode_single_token_bytes(i))
+        except KeyError:
+            pass
+    return lengths
+
+
+def _token_offsets(enc: tiktoken.Encoding, text: str, start: int, end: int) -> Iterator[Tuple[List[int], List[int]]]:
+    # Per block: (start offsets, end offsets) of each token, relative to `text`.
+    # Vectorized equivalent of enc.decode_with_offsets: token byte lengths are
+    # summed into byte offsets, then mapped to the character containing them.
+    byte_lengths = _token_byte_lengths(enc)
+    for b_start, b_end in _blocks(text[start:end]):
+        block = text[start + b_start:start + b_end]
+        tokens = np.asarray(enc.encode_ordinary(block), dtype=np.int64)
+        if not tokens.size:
+            continue
+        raw = np.frombuffer(block.encode("utf-8"), dtype=np.uint8)
+        char_at_byte = np.cumsum((raw & 0xC0) != 0x80) - 1
+        char_at_byte = np.append(char_at_byte, len(block))
+        byte_ends = np.cumsum(byte_lengths[tokens])
+        byte_starts = byte_ends - byte_lengths[tokens]
+        base = start + b_start
+        starts = char_at_byte[byte_starts] + base
+        ends = np.maximum(np.append(starts[1:], base + len(block)), starts)
+        yield starts.tolist(), ends.tolist()
+
+
+def _token_units(enc: tiktoken.Encoding, text: str, start: int, end: int) -> Iterator[_Unit]:
+    for starts, ends in _token_offsets(enc, text, start, end):
+        for s, e in zip(starts, ends):
+            yield _Unit(s, e, 1)
+
+
+def _span_units(
+    enc: tiktoken.Encoding, text: str, start: int, end: int, max_tokens: int, levels: List[re.Pattern]
+) -> Iterator[_Unit]:
+    # Split on the coarsest boundary first; anything still over max_tokens is
+    # split on the next level, and finally into single tokens.
+    if not levels:
+        yield from _token_units(enc, text, start, end)
+        return
+    for s, e in _spans(text[start:end], levels[0]):
+        s, e = start + s, start + e
+        n = len(enc.encode_ordinary(text[s:e]))
+        if n == 0:
+            continue
+        if n > max_tokens:
+            yield from _span_units(enc, text, s, e, max_tokens, levels[1:])
+        else:
+            yield _Unit(s, e, n)
+
+
+def iter_chunks(
+    text: Union[str, Iterable[str]],
+    max_tokens: int = 800,
+    overlap: int = 100,
+    boundary: str = "",
+) -> Iterator[TextChunk]:
+    """
+    Lazily yields token-bounded, overlapping windows over `text` with their
+    token count and character offsets. `text` may be one string or an
+    iterable of parts (e.g. PDF pages); parts are treated as joined with
+    PART_SEPARATOR and offsets refer to that joined string.
+
+    boundary="token" cuts exactly every max_tokens; "sentence" / "paragraph"
+    only cut between sentences / paragraphs (falling back to finer splits for
+    oversized ones), so windows can be somewhat shorter than max_tokens.
+    Defaults to CHUNK_BOUNDARY, else "token".
+    """
+    boundary = boundary or os.getenv("CHUNK_BOUNDARY", "token")
+    if boundary not in BOUNDARIES:
+        raise ValueError(f"unknown chunk boundary {boundary!r}, expected one of {BOUNDARIES}")
+    if overlap >= max_tokens:
+        raise ValueError("overlap must be smaller than max_tokens")
+    levels = {"token": [], "sentence": [_SENTENCE_RE], "paragraph": [_PARAGRAPH_RE, _SENTENCE_RE]}[boundary]
+    enc = get_encoding()
+    parts: Iterable[str] = [text] if isinstance(text, str) else text
+
+    held: Deque[Tuple[int, str]] = deque()  # (global start, part) still covered by a window
+
+    def text_between(start: int, end: int) -> str:
+        pieces = []
+        for p_start, p_text in held:
+            p_end = p_start + len(p_text)
+            if start < p_end and end > p_start:
+                pieces.append(p_text[max(0, start - p_start):end - p_start])
+            if start < p_end + len(PART_SEPARATOR) and end > p_end:
+                pieces.append(PART_SEPARATOR[max(0, start - p_end):end - p_end])
+        return "".join(pieces)
+
+    def release(upto: int) -> None:
+        # drop parts that every future window starts after
+        while len(held) > 1 and held[0][0] + len(held[0][1]) <= upto:
+            held.popleft()
+
+    if boundary == "token":
+        yield from _token_windows(enc, parts, max_tokens, overlap, held, text_between, release)
+        return
+
+    window: Deque[_Unit] = deque()
+    window_tokens = 0
+    fresh = False  # window holds units not yet emitted
+
+    def emit() -> TextChunk:
+        start, end = window[0].start, window[-1].end
+        return TextChunk(text_between(start, end), window_tokens, start, end)
+
+    offset = 0
+    for part in parts:
+        held.append((offset, part))
+        for unit in _span_units(enc, part, 0, len(part), max_tokens, levels):
+            unit = _Unit(unit.start + offset, unit.end + offset, unit.tokens)
+            if window and window_tokens + unit.tokens > max_tokens:
+                yield emit()
+                fresh = False
+                while window and (window_tokens > overlap or window_tokens + unit.tokens > max_tokens):
+                    window_tokens -= window.popleft().tokens
+            window.append(unit)
+            window_tokens += unit.tokens
+            fresh = True
+            release(window[0].start)
+        offset += len(part) + len(PART_SEPARATOR)
+
+    if window and fresh:
+        yield emit()
+
+
+def _token_windows(enc, parts, max_tokens, overlap, held, text_between, release) -> Iterator[TextChunk]:
+    # Exact max_tokens windows advancing by max_tokens - overlap, like slicing
+    # one big token list, but only a block plus a window of offsets is held.
+    starts: List[int] = []
+    ends: List[int] = []
+    carried = 0  # leading tokens already emitted as the previous window's overlap
+    step = max_tokens - overlap
+
+    offset = 0
+    for part in parts:
+        held.append((offset, part))
+        for b_starts, b_ends in _token_offsets(enc, part, 0, len(part)):
+            starts.extend(offset + x for x in b_starts)
+            ends.extend(offset + x for x in b_ends)
+            # strictly more than a window left: this window is not the last one
+            while len(starts) > max_tokens:
+                s, e = starts[0], ends[max_tokens - 1]
+                yield TextChunk(text_between(s, e), max_tokens, s, e)
+                del starts[:step]
+                del ends[:step]
+                carried = overlap
+                release(starts[0])
+        offset += len(part) + len(PART_SEPARATOR)
+
+    if len(starts) > carried:
+        s, e = starts[0], ends[-1]
+        yield TextChunk(text_between(s, e), len(starts), s, e)
+
+
+def chunk_text(text: str, max_tokens: int = 800, overlap: int = 100) -> List[str]:
+    return [c.content for c in iter_chunks(text, max_tokens=max_tokens, overlap=overlap)]
@@ -0,0 +1,80 @@
+# app/workers/pdf.py
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+from pypdf import PdfReader
+
+# Kept free of app imports: extraction processes are spawned and import only this module.
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_pid: Optional[int] = None
+
+
+def _workers() -> int:
+    return max(1, int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1)))))
+
+
+def _pages_per_task() -> int:
+    return max(1, int(os.getenv("PDF_PAGES_PER_TASK", "8")))
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    # One pool per worker process, reused across jobs. "spawn" because the
+    # Celery child may hold DB connections and threads that must not be forked.
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = ProcessPoolExecutor(
+            max_workers=_workers(), mp_context=multiprocessing.get_context("spawn")
+        )
+        _pool_pid = os.getpid()
+    return _pool
+
+
+def _extract_range(path: str, start: int, stop: int) -> List[str]:
+    # Each task re-opens the file; pypdf only parses the pages it is asked for.
+    reader = PdfReader(path)
+    return [(reader.pages[i].extract_text() or "") for i in range(start, stop)]
+
+
+def iter_pdf_pages(path: str) -> Iterator[Tuple[int, str]]:
+    """
+    Yields (page number, text) in page order, 1-based, skipping pages without
+    text. Page ranges of PDF_PAGES_PER_TASK are extracted in parallel on a
+    process pool of PDF_EXTRACT_WORKERS; pages are yielded as soon as their
+    range and all earlier ones are done, so callers can chunk and embed while
+    later pages are still being extracted.
+    """
+    n_pages = len(PdfReader(path).pages)
+    per_task = _pages_per_task()
+    ranges = [(s, min(s + per_task, n_pages)) for s in range(0, n_pages, per_task)]
+
+    if len(ranges) <= 1 or _workers() == 1:
+        results = (_extract_range(path, s, e) for s, e in ranges)
+    else:
+        pool = _get_pool()
+        # bounded lookahead keeps at most a few ranges of text in memory
+        window = _workers() * 2
+        futures = [pool.submit(_extract_range, path, s, e) for s, e in ranges[:window]]
+        pending = ranges[window:]
+
+        def ordered():
+            try:
+                while futures:
+                    texts = futures.pop(0).result()
+                    if pending:
+                        s, e = pending.pop(0)
+                        futures.append(pool.submit(_extract_range, path, s, e))
+                    yield texts
+            finally:
+                # caller stopped early (error downstream): drop queued ranges
+                for f in futures:
+                    f.cancel()
+
+        results = ordered()
+
+    for (start, _), texts in zip(ranges, results):
+        for i, t in enumerate(texts):
+            if t.strip():
+                yield start + i + 1, t
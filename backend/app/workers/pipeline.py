@@ -0,0 +1,807 @@
+# app/workers/pipeline.py
+"""
+Ingestion pipeline shared by every modality: extract -> chunk -> embed -> persist.
+
+The stages are plain functions over an Extraction. run_inline() runs them in
+one task, streaming (PDF pages are chunked and embedded while later pages are
+still being extracted); the stage tasks in app.workers.tasks run them on
+separate queues, passing payloads through the blob store by key.
+"""
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+import numpy as np
+from bs4 import BeautifulSoup
+from readability import Document as ReadabilityDocument
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from app.models.memory import Artifact, Chunk, Document, Embedding, IngestionJob
+from app.services import metrics
+from app.services.ai_provider import get_openai_client
+from app.services.blob_store import LocalBlobStore, get_blob_store
+from app.services.chunk_store import ChunkDiff, bulk_insert_chunks, delete_documents
+from app.services.embedding_cache import embedding_space, get_cached_embedder
+from app.services.hot_tier import publish_invalidation
+from app.services.web_fetch import fetch_url
+from app.workers.audio import openai_transcriber, transcribe_audio
+from app.workers.chunking import PART_SEPARATOR, iter_chunks
+from app.workers.pdf import iter_pdf_pages
+
+STAGES = ("extract", "chunk", "embed", "persist")
+# what StageTimer reports: fetching the page or the uploaded file is split out of extract
+TIMED_STAGES = ("fetch",) + STAGES
+
+T = TypeVar("T")
+
+
+class StageTimer:
+    """
+    Seconds one job spends in each stage, plus counts (bytes, chunks,
+    tokens). A stage entered inside another pauses it (chunking excludes the
+    PDF pages it pulls from extraction); stages on other threads (background
+    embedding) count in parallel, so the total can exceed the job's wall time.
+    """
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = dict.fromkeys(TIMED_STAGES, 0.0)
+        self.counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def count(self, name: str, n: int) -> None:
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        stack = self._local.__dict__.setdefault("stack", [])
+        now = time.perf_counter()
+        if stack:
+            self._add(stack[-1][0], now - stack[-1][1])
+        stack.append([name, now])
+        try:
+            yield
+        finally:
+            _, since = stack.pop()
+            now = time.perf_counter()
+            self._add(name, now - since)
+            if stack:
+                stack[-1][1] = now
+
+    def iterate(self, name: str, items: Iterable[T]) -> Iterator[T]:
+        """`items`, with the time spent producing each one counted as `name`."""
+        it = iter(items)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+            yield item
+
+    def wrap(self, name: str, fn: Callable[..., T]) -> Callable[..., T]:
+        def timed(*args, **kwargs) -> T:
+            with self.stage(name):
+                return fn(*args, **kwargs)
+        return timed
+
+    def summary(self) -> Dict[str, float]:
+        """Seconds per stage so far, including the stage open on this thread."""
+        with self._lock:
+            seconds = dict(self.seconds)
+        stack = self._local.__dict__.get("stack")
+        if stack:
+            name, since = stack[-1]
+            seconds[name] = seconds.get(name, 0.0) + time.perf_counter() - since
+        return {k: round(v, 4) for k, v in seconds.items()}
+
+
+def _now_utc():
+    return datetime.now(timezone.utc)
+
+
+def _incremental() -> bool:
+    return os.getenv("INCREMENTAL_REINGEST", "1") == "1"
+
+
+def _same_source(artifact: Artifact) -> Optional[list]:
+    """
+    WHERE clauses (over Document joined to its Artifact) matching earlier
+    ingests of this artifact's source, or None when it has no identity and
+    always gets a new document. A URL is its own identity. An upload's
+    filename is not: a PDF matches the upload with the same client-supplied
+    source_id, else only byte-identical uploads (sha256). Audio never matches.
+    """
+    if not _incremental():
+        return None
+    if artifact.type == "web" and artifact.source_uri:
+        return [Document.source_uri == artifact.source_uri]
+    meta = artifact.meta or {}
+    if artifact.type == "pdf" and meta.get("source_id"):
+        return [Artifact.meta["source_id"].as_string() == meta["source_id"]]
+    if artifact.type == "pdf" and meta.get("sha256"):
+        return [Artifact.meta["source_id"].as_string().is_(None), Artifact.meta["sha256"].as_string() == meta["sha256"]]
+    return None
+
+
+# ---------------------------------------------------------------- artifacts
+
+@contextmanager
+def open_artifact_blob(artifact: Artifact) -> Iterator[BinaryIO]:
+    """
+    File handle for an uploaded artifact's bytes. Reads from the blob store;
+    artifacts created before the blob store still carry hex in meta['bytes'].
+    """
+    if artifact.object_key:
+        with get_blob_store().open(artifact.object_key) as fh:
+            yield fh
+        return
+    hex_bytes = (artifact.meta or {}).get("bytes")
+    if not hex_bytes:
+        raise RuntimeError(f"No stored bytes for artifact {artifact.id}")
+    yield io.BytesIO(bytes.fromhex(hex_bytes))
+
+
+@contextmanager
+def artifact_blob_path(artifact: Artifact) -> Iterator[str]:
+    """
+    Filesystem path of an artifact's bytes, for tools that take a path
+    (extraction subprocesses, ffmpeg). Local blobs are used in place; other
+    stores and legacy hex artifacts are spilled to a temp file.
+    """
+    store = get_blob_store()
+    if artifact.object_key and isinstance(store, LocalBlobStore):
+        yield str(store.path(artifact.object_key))
+        return
+    with open_artifact_blob(artifact) as src, tempfile.NamedTemporaryFile(suffix=".blob") as tmp:
+        shutil.copyfileobj(src, tmp)
+        tmp.flush()
+        yield tmp.name
+
+
+def extract_readable_text(html: str) -> Tuple[str, str]:
+    """
+    Returns (title, text).
+    Uses readability-lxml, falls back to soup.get_text.
+    """
+    try:
+        doc = ReadabilityDocument(html)
+        title = (doc.short_title() or "").strip()
+        summary_html = doc.summary(html_partial=True)
+        soup = BeautifulSoup(summary_html, "lxml")
+        text = soup.get_text(separator="\n").strip()
+        if text:
+            return title, text
+    except Exception:
+        pass
+
+    soup = BeautifulSoup(html, "lxml")
+    title = (soup.title.string if soup.title and soup.title.string else "").strip()
+    text = soup.get_text(separator="\n").strip()
+    return title, text
+
+
+# ---------------------------------------------------------------- extract
+
+class Extraction:
+    """
+    Extracted text of one artifact plus what the later stages need. `parts`
+    are chunked as if joined with PART_SEPARATOR and may be a lazy iterator;
+    `spans` ({"offset": char offset, "page": n} or {"offset", "start_ms",
+    "end_ms"}) locate pages / transcript pieces in that joined text and can
+    be appended to while `parts` is consumed.
+    """
+
+    def __init__(
+        self,
+        source_type: str,
+        title: str,
+        doc_meta: Dict[str, Any],
+        parts: Iterable[str],
+        spans: Optional[List[Dict[str, Any]]] = None,
+        max_tokens: int = 800,
+        overlap: int = 100,
+        min_chars: int = 0,
+        too_little: str = "Extraction produced too little text",
+        artifact_meta: Optional[Dict[str, Any]] = None,
+    ):
+        self.source_type = source_type
+        self.title = title
+        self.doc_meta = doc_meta
+        self.parts = parts
+        self.spans = spans if spans is not None else []
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+        self.min_chars = min_chars
+        self.too_little = too_little
+        self.artifact_meta = artifact_meta or {}  # merged into artifact.meta on success
+
+    def header(self) -> Dict[str, Any]:
+        """Everything but the text, for the stages after chunking."""
+        return {
+            "source_type": self.source_type,
+            "title": self.title,
+            "doc_meta": self.doc_meta,
+            "artifact_meta": self.artifact_meta,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        parts = list(self.parts)  # consuming lazy parts fills in spans
+        return {
+            **self.header(),
+            "parts": parts,
+            "spans": self.spans,
+            "max_tokens": self.max_tokens,
+            "overlap": self.overlap,
+            "min_chars": self.min_chars,
+            "too_little": self.too_little,
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Extraction":
+        return cls(
+            d["source_type"], d["title"], d["doc_meta"], d["parts"], d["spans"],
+            d["max_tokens"], d["overlap"], d["min_chars"], d["too_little"], d["artifact_meta"],
+        )
+
+
+def previous_fetch(db: Session, artifact: Artifact) -> Optional[Artifact]:
+    """Latest earlier artifact of this user's URL that stored HTTP validators."""
+    rows = db.scalars(
+        select(Artifact)
+        .where(
+            Artifact.user_id == artifact.user_id,
+            Artifact.type == "web",
+            Artifact.source_uri == artifact.source_uri,
+            Artifact.id != artifact.id,
+        )
+        .order_by(Artifact.ingested_at.desc())
+        .limit(5)
+    )
+    for row in rows:
+        if (row.meta or {}).get("http"):
+            return row
+    return None
+
+
+def _extract_web(db: Session, artifact: Artifact, timer: StageTimer) -> Optional[Extraction]:
+    if not artifact.source_uri:
+        raise RuntimeError("Artifact missing source_uri")
+    url = artifact.source_uri
+    previous = previous_fetch(db, artifact)
+    validators = (previous.meta or {}).get("http", {}) if previous else {}
+    with timer.stage("fetch"):
+        fetched = fetch_url(url, etag=validators.get("etag"), last_modified=validators.get("last_modified"))
+    timer.count("bytes", len(fetched.text.encode("utf-8")))
+    http_meta = {"etag": fetched.etag, "last_modified": fetched.last_modified}
+
+    if fetched.not_modified:
+        # page unchanged since `previous` was ingested: nothing to extract, embed or store
+        source = (previous.meta or {}).get("not_modified_since") or str(previous.id)
+        artifact.meta = {**(artifact.meta or {}), "http": http_meta, "not_modified_since": source}
+        return None
+
+    title, text = extract_readable_text(fetched.text)
+    if not text or len(text.strip()) < 50:
+        raise RuntimeError("Failed to extract meaningful text from URL")
+    return Extraction(
+        "web", title or url, {"url": url}, [text],
+        max_tokens=800, overlap=100,
+        artifact_meta={"http": http_meta} if fetched.etag or fetched.last_modified else None,
+    )
+
+
+@contextmanager
+def _blob_path(artifact: Artifact, timer: StageTimer) -> Iterator[str]:
+    # getting the upload to a local path is the "fetch" of file artifacts
+    with ExitStack() as stack:
+        with timer.stage("fetch"):
+            path = stack.enter_context(artifact_blob_path(artifact))
+        timer.count("bytes", os.path.getsize(path))
+        yield path
+
+
+@contextmanager
+def _extract_pdf(artifact: Artifact, timer: StageTimer) -> Iterator[Extraction]:
+    with _blob_path(artifact, timer) as path:
+        spans: List[Dict[str, Any]] = []
+
+        def pages() -> Iterator[str]:
+            offset = 0
+            for page_no, t in iter_pdf_pages(path):
+                spans.append({"offset": offset, "page": page_no})
+                yield t
+                offset += len(t) + len(PART_SEPARATOR)
+
+        # pages are extracted as the chunker pulls them, so `path` must stay open
+        yield Extraction(
+            "pdf", artifact.source_uri or "PDF", {"filename": artifact.source_uri}, pages(), spans,
+            max_tokens=700, overlap=120,
+            min_chars=50, too_little="PDF text extraction produced too little text",
+        )
+
+
+def _audio_ext(artifact: Artifact) -> str:
+    meta = artifact.meta or {}
+    filename = meta.get("filename") or "audio"
+    content_type = meta.get("content_type") or ""
+    if "." in filename:
+        return filename.rsplit(".", 1)[1].lower()[:6] or "wav"
+    if "mpeg" in content_type:
+        return "mp3"
+    if "m4a" in content_type:
+        return "m4a"
+    return "wav"
+
+
+def _extract_audio(artifact: Artifact, timer: StageTimer) -> Extraction:
+    if not os.getenv("OPENAI_API_KEY"):
+        raise RuntimeError("OPENAI_API_KEY missing for transcription")
+
+    transcribe = openai_transcriber(get_openai_client(), os.getenv("OPENAI_TRANSCRIBE_MODEL", "gpt-4o-mini-transcribe"))
+    with _blob_path(artifact, timer) as path:
+        if os.path.getsize(path) < 200:
+            raise RuntimeError("Audio bytes too small or corrupt")
+        pieces = transcribe_audio(path, f"upload.{_audio_ext(artifact)}", transcribe)
+
+    # one transcript string; spans map chunk offsets back to time
+    spans: List[Dict[str, Any]] = []
+    texts: List[str] = []
+    offset = 0
+    for p in pieces:
+        spans.append({"offset": offset, "start_ms": p.start_ms, "end_ms": p.end_ms})
+        texts.append(p.text.strip())
+        offset += len(texts[-1]) + 1
+    transcript = " ".join(texts)
+
+    if not transcript or len(transcript.strip()) < 5:
+        raise RuntimeError("Empty transcript")
+    return Extraction(
+        "audio", artifact.source_uri or "Audio", {"filename": artifact.source_uri}, [transcript], spans,
+        max_tokens=500, overlap=80,
+    )
+
+
+@contextmanager
+def extract(db: Session, artifact: Artifact, timer: Optional[StageTimer] = None) -> Iterator[Optional[Extraction]]:
+    """
+    Extraction for the artifact's type, valid inside the block (PDF parts are
+    read lazily). None means there is nothing to do (unchanged URL). Fetch
+    time and source bytes go to `timer`.
+    """
+    timer = timer or StageTimer()
+    if artifact.type == "web":
+        yield _extract_web(db, artifact, timer)
+    elif artifact.type == "pdf":
+        with _extract_pdf(artifact, timer) as extraction:
+            yield extraction
+    elif artifact.type == "audio":
+        yield _extract_audio(artifact, timer)
+    else:
+        raise RuntimeError(f"Unsupported artifact type {artifact.type!r}")
+
+
+# ---------------------------------------------------------------- chunk
+
+def iter_chunk_rows(extraction: Extraction) -> Iterator[Dict[str, Any]]:
+    """
+    Chunk rows (bulk_insert_chunks dicts) for an extraction, with page ranges
+    in meta or time ranges from its spans. Raises extraction.too_little at the
+    end if fewer than min_chars of text came through.
+    """
+    spans = extraction.spans
+    offsets: List[int] = []
+    text_chars = 0
+
+    def parts() -> Iterator[str]:
+        nonlocal text_chars
+        for part in extraction.parts:
+            text_chars += len(part.strip())
+            yield part
+
+    for c in iter_chunks(parts(), max_tokens=extraction.max_tokens, overlap=extraction.overlap):
+        row = c._asdict()
+        if spans:
+            offsets.extend(s["offset"] for s in spans[len(offsets):])
+            first = spans[bisect_right(offsets, c.char_start) - 1]
+            last = spans[bisect_right(offsets, max(c.char_start, c.char_end - 1)) - 1]
+            if "page" in first:
+                row["meta"] = {"page_start": first["page"], "page_end": last["page"]}
+            if "start_ms" in first:
+                row["time_start_ms"] = first["start_ms"]
+                row["time_end_ms"] = last["end_ms"]
+        yield row
+
+    if text_chars < extraction.min_chars:
+        raise RuntimeError(extraction.too_little)
+
+
+# ---------------------------------------------------------------- embed
+
+def embed_and_persist(
+    db: Session,
+    document_id: uuid.UUID,
+    user_id: uuid.UUID,
+    captured_at: datetime,
+    chunks: Iterable[Dict[str, Any]],
+    source_type: Optional[str] = None,
+    timer: Optional[StageTimer] = None,
+) -> int:
+    """
+    Embeds and writes chunks as they are produced: batches of EMBED_BATCH_CHUNKS
+    are embedded on a background thread while `chunks` keeps yielding (i.e.
+    while extraction/chunking continue); finished batches are written in order
+    on this thread, inside the caller's transaction. Returns the chunk count.
+    """
+    batch_size = max(1, int(os.getenv("EMBED_BATCH_CHUNKS", "64")))
+    timer = timer or StageTimer()
+    embed = timer.wrap("embed", get_cached_embedder().embed_texts)
+    written = 0
+    inflight = []  # (batch, future) in submission order
+
+    def write(batch, future) -> None:
+        nonlocal written
+        vectors, dims, model_name = future.result()
+        with timer.stage("persist"):
+            bulk_insert_chunks(
+                db, document_id, user_id, captured_at, batch, vectors, dims, model_name,
+                start_index=written, source_type=source_type,
+            )
+        _count_chunks(timer, batch)
+        written += len(batch)
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        try:
+            batch: List[Dict[str, Any]] = []
+            for chunk in chunks:
+                batch.append(chunk)
+                if len(batch) >= batch_size:
+                    inflight.append((batch, pool.submit(embed, [c["content"] for c in batch])))
+                    batch = []
+                # write whatever finished; the session is only touched from this thread
+                while inflight and inflight[0][1].done():
+                    write(*inflight.pop(0))
+            if batch:
+                inflight.append((batch, pool.submit(embed, [c["content"] for c in batch])))
+            while inflight:
+                write(*inflight.pop(0))
+        finally:
+            for _, future in inflight:
+                future.cancel()
+    return written
+
+
+def _count_chunks(timer: StageTimer, rows: List[Dict[str, Any]]) -> None:
+    timer.count("chunks", len(rows))
+    timer.count("tokens", sum(r.get("token_count") or 0 for r in rows))
+
+
+def existing_hashes(db: Session, artifact: Artifact, source_type: str) -> set:
+    """
+    Content hashes already stored for this source with an embedding from the
+    current model, i.e. chunks re-ingest will keep (ChunkDiff's rule).
+    """
+    same_source = _same_source(artifact)
+    if same_source is None:
+        return set()
+    model, dims = embedding_space()
+    rows = db.execute(
+        select(Chunk.content_hash)
+        .join(Document, Document.id == Chunk.document_id)
+        .join(Artifact, Artifact.id == Document.artifact_id)
+        .join(Embedding, Embedding.chunk_id == Chunk.id)
+        .where(
+            Document.user_id == artifact.user_id,
+            Document.source_type == source_type,
+            Embedding.model == model,
+            Embedding.dims == dims,
+            *same_source,
+        )
+    )
+    return {h for (h,) in rows if h}
+
+
+def embed_rows(rows: List[Dict[str, Any]], skip: set) -> Tuple[Dict[str, np.ndarray], int, str]:
+    """Vectors by content hash for rows not in `skip`, each distinct text embedded once."""
+    texts: Dict[str, str] = {}
+    for row in rows:
+        h = row["content_hash"]
+        if h not in skip:
+            texts.setdefault(h, row["content"])
+    if not texts:
+        return {}, 0, ""
+    batch_size = max(1, int(os.getenv("EMBED_BATCH_CHUNKS", "64")))
+    embedder = get_cached_embedder()
+    hashes = list(texts)
+    vectors: Dict[str, np.ndarray] = {}
+    dims, model_name = 0, ""
+    for i in range(0, len(hashes), batch_size):
+        batch = hashes[i:i + batch_size]
+        vecs, dims, model_name = embedder.embed_texts([texts[h] for h in batch])
+        vectors.update(zip(batch, np.asarray(vecs, dtype=np.float32)))
+    return vectors, dims, model_name
+
+
+# ---------------------------------------------------------------- persist
+
+def upsert_document(
+    db: Session,
+    artifact: Artifact,
+    source_type: str,
+    title: str,
+    captured_at: datetime,
+    meta: Dict[str, Any],
+    space: Optional[Tuple[str, int]] = None,
+) -> Tuple[Document, Optional[ChunkDiff]]:
+    """
+    Document to write this artifact's chunks into. With INCREMENTAL_REINGEST
+    (default on) the latest earlier document of the same user, type and
+    source (see _same_source) is reused and re-pointed at this artifact,
+    older duplicates are deleted, and a ChunkDiff is returned so only changed
+    chunks (and chunks embedded with another model than `space`, the
+    (model, dims) being written; default the current embedder's) are
+    embedded. The documents stay locked until the job commits, so
+    concurrent jobs for one source take turns instead of diffing against the
+    same old chunks.
+    """
+    previous: List[Document] = []
+    same_source = _same_source(artifact)
+    if same_source is not None:
+        previous = list(db.scalars(
+            select(Document)
+            .join(Artifact, Artifact.id == Document.artifact_id)
+            .where(
+                Document.user_id == artifact.user_id,
+                Document.source_type == source_type,
+                *same_source,
+            )
+            .order_by(Artifact.ingested_at.desc())
+            .with_for_update(of=Document)
+        ))
+
+    if previous:
+        doc = previous[0]
+        delete_documents(db, [d.id for d in previous[1:]])
+        doc.artifact_id = artifact.id
+        doc.title = title
+        doc.captured_at = captured_at
+        doc.meta = meta
+        db.flush()
+        # kept chunks (and their embedding copies) take the new capture time
+        params = {"doc_id": doc.id, "captured_at": captured_at}
+        db.execute(text(
+            "UPDATE chunks SET captured_at = :captured_at WHERE document_id = :doc_id"
+            " AND captured_at IS DISTINCT FROM :captured_at"
+        ), params)
+        db.execute(text(
+            "UPDATE embeddings e SET captured_at = :captured_at FROM chunks c"
+            " WHERE c.id = e.chunk_id AND c.document_id = :doc_id AND e.captured_at IS DISTINCT FROM :captured_at"
+        ), params)
+        # only chunks embedded in the (model, dims) being written now are kept
+        model, dims = space or embedding_space()
+        return doc, ChunkDiff(db, doc.id, model, dims)
+
+    doc = Document(
+        artifact_id=artifact.id,
+        user_id=artifact.user_id,
+        title=title,
+        source_type=source_type,
+        source_uri=artifact.source_uri,
+        captured_at=captured_at,
+        meta=meta,
+    )
+    db.add(doc)
+    db.flush()
+    return doc, None
+
+
+def complete_job(
+    db: Session,
+    job: IngestionJob,
+    artifact: Artifact,
+    header: Dict[str, Any],
+    diff: Optional[ChunkDiff],
+    n_written: int,
+    timer: Optional[StageTimer] = None,
+) -> None:
+    """
+    Applies the chunk diff, records artifact metadata and the timer's stats,
+    and commits the job as SUCCEEDED.
+    """
+    n_chunks = n_written
+    meta = dict(header.get("artifact_meta") or {})
+    if diff:
+        n_chunks += diff.kept
+        diff.apply()
+        meta["reingest"] = {"kept": diff.kept, "added": diff.added, "deleted": diff.deleted}
+    if not n_chunks:
+        raise RuntimeError("Chunking produced 0 chunks")
+    if meta:
+        artifact.meta = {**(artifact.meta or {}), **meta}
+    if timer:
+        record_stats(job, artifact, timer)
+    job.status = "SUCCEEDED"
+    db.commit()
+    metrics.observe_job(artifact.type, True, job.byte_count, job.chunk_count, job.token_count)
+    publish_invalidation(artifact.user_id)
+
+
+def record_stats(job: IngestionJob, artifact: Artifact, timer: StageTimer) -> None:
+    """
+    Adds the timer's stage seconds to the job (stages may run in separate
+    tasks, and a retried stage counts every attempt) and sets the counts it
+    has; the stage seconds also go to Prometheus. Committed by the caller.
+    """
+    seconds = timer.summary()
+    totals = dict(job.stage_seconds or {})
+    for stage, s in seconds.items():
+        if s:
+            totals[stage] = round(totals.get(stage, 0.0) + s, 4)
+    job.stage_seconds = totals
+    counts = timer.counts
+    if "bytes" in counts:
+        job.byte_count = counts["bytes"]
+    if "chunks" in counts:
+        job.chunk_count = counts["chunks"]
+        job.token_count = counts.get("tokens", 0)
+    metrics.observe_stages(artifact.type, seconds)
+
+
+# ---------------------------------------------------------------- jobs
+
+def start_job(db: Session, job_id: str, first_stage: bool = True) -> Optional[Tuple[IngestionJob, Artifact]]:
+    job = db.get(IngestionJob, uuid.UUID(job_id))
+    if not job:
+        return None
+    job.status = "RUNNING"
+    if first_stage:
+        job.attempts = (job.attempts or 0) + 1
+    job.error_message = None
+    db.commit()
+
+    artifact = db.get(Artifact, job.artifact_id)
+    if not artifact:
+        raise RuntimeError("Artifact not found")
+    return job, artifact
+
+
+def fail_job(db: Session, job_id: str, error: Exception, timer: Optional[StageTimer] = None) -> None:
+    db.rollback()
+    try:
+        job = db.get(IngestionJob, uuid.UUID(job_id))
+        if job:
+            artifact = db.get(Artifact, job.artifact_id)
+            if timer and artifact:
+                # time spent before the failure still counts
+                timer.counts.clear()
+                record_stats(job, artifact, timer)
+            job.status = "FAILED"
+            job.error_message = str(error)
+            db.commit()
+            metrics.observe_job(artifact.type if artifact else "unknown", False)
+    except Exception:
+        pass
+
+
+def run_inline(db: Session, job_id: str, timer: Optional[StageTimer] = None) -> None:
+    """
+    All stages in this process, streaming from extraction through to the COPY
+    writes; per-stage seconds go to `timer`.
+    """
+    timer = timer or StageTimer()
+    started = start_job(db, job_id)
+    if not started:
+        return
+    job, artifact = started
+
+    with ExitStack() as stack:
+        with timer.stage("extract"):
+            extraction = stack.enter_context(extract(db, artifact, timer))
+        if extraction is None:
+            record_stats(job, artifact, timer)
+            job.status = "SUCCEEDED"
+            db.commit()
+            return
+        # lazily read parts (PDF pages) are extraction time, not chunking time
+        extraction.parts = timer.iterate("extract", extraction.parts)
+        captured_at = artifact.captured_at or _now_utc()
+        with timer.stage("persist"):
+            doc, diff = upsert_document(
+                db, artifact, extraction.source_type, extraction.title, captured_at, extraction.doc_meta
+            )
+        rows = iter_chunk_rows(extraction)
+        if diff:
+            # on re-ingest only chunks without an identical existing row are embedded
+            rows = diff.route(rows)
+        n_written = embed_and_persist(
+            db, doc.id, artifact.user_id, captured_at, timer.iterate("chunk", rows), extraction.source_type, timer
+        )
+
+    with timer.stage("persist"):
+        complete_job(db, job, artifact, extraction.header(), diff, n_written, timer)
+
+
+# ---------------------------------------------------------------- staged payloads
+
+def payload_key(job_id: str, name: str) -> str:
+    return f"pipeline/{job_id}/{name}"
+
+
+def put_json(key: str, obj: Any) -> str:
+    get_blob_store().put(key, io.BytesIO(json.dumps(obj).encode("utf-8")))
+    return key
+
+
+def get_json(key: str) -> Any:
+    with get_blob_store().open(key) as fh:
+        return json.load(fh)
+
+
+def put_vectors(key: str, vectors: Dict[str, np.ndarray], dims: int, model_name: str) -> str:
+    buf = io.BytesIO()
+    hashes = list(vectors)
+    matrix = np.stack([vectors[h] for h in hashes]) if hashes else np.zeros((0, dims), dtype=np.float32)
+    np.savez(buf, hashes=np.array(hashes, dtype="U64"), vectors=matrix, info=np.array([model_name, str(dims)]))
+    buf.seek(0)
+    get_blob_store().put(key, buf)
+    return key
+
+
+def get_vectors(key: str) -> Tuple[Dict[str, np.ndarray], int, str]:
+    with get_blob_store().open(key) as fh:
+        data = np.load(io.BytesIO(fh.read()), allow_pickle=False)
+        model_name, dims = (str(x) for x in data["info"])
+        return dict(zip(data["hashes"].tolist(), data["vectors"])), int(dims), model_name
+
+
+def delete_payloads(*keys: Optional[str]) -> None:
+    store = get_blob_store()
+    for key in keys:
+        if key:
+            store.delete(key)
+
+
+def persist_staged(
+    db: Session, job: IngestionJob, artifact: Artifact, chunks: Dict[str, Any], vectors_key: str, timer: StageTimer,
+) -> None:
+    """Persist stage: rows from the chunk payload, vectors (by content hash) from the embed payload."""
+    header, rows = chunks["header"], chunks["rows"]
+    vectors, dims, model_name = get_vectors(vectors_key)
+
+    captured_at = artifact.captured_at or _now_utc()
+    # the embed stage skipped hashes kept under the model it embedded with; diff against the same one
+    doc, diff = upsert_document(
+        db, artifact, header["source_type"], header["title"], captured_at, header["doc_meta"],
+        (model_name, dims) if model_name else None,
+    )
+    new_rows = list(diff.route(rows)) if diff else rows
+
+    missing = [r for r in new_rows if r["content_hash"] not in vectors]
+    if missing:
+        # rows the embed stage expected to keep but which changed since
+        extra, dims, model_name = embed_rows(missing, set())
+        vectors.update(extra)
+    if new_rows:
+        bulk_insert_chunks(
+            db, doc.id, artifact.user_id, captured_at, new_rows,
+            [vectors[r["content_hash"]] for r in new_rows], dims, model_name,
+            source_type=header["source_type"],
+        )
+    _count_chunks(timer, new_rows)
+    complete_job(db, job, artifact, header, diff, len(new_rows), timer)
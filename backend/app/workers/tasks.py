@@ -1,69 +1,20 @@
-import uuid
-from datetime import datetime, timezone
-from typing import List, Tuple
-from app.services.ai_provider import get_embedder
-
 import os
-import httpx
-from readability import Document as ReadabilityDocument
-from bs4 import BeautifulSoup
-import tiktoken
+import random
+from typing import Any, Dict, List, Optional, Tuple
+
+from celery import chain
 from openai import OpenAI
 from sqlalchemy.orm import Session
 
-from app.workers.celery_app import celery
 from app.db.session import SessionLocal
-from app.models.memory import Artifact, IngestionJob, Document, Chunk, Embedding
-import hashlib
-import random
-
-from pypdf import PdfReader
-import io
-
-
-
-def _now_utc():
-    return datetime.now(timezone.utc)
-
-
-def extract_readable_text(html: str) -> Tuple[str, str]:
-    """
-    Returns (title, text).
-    Uses readability-lxml, falls back to soup.get_text.
-    """
-    try:
-        doc = ReadabilityDocument(html)
-        title = (doc.short_title() or "").strip()
-        summary_html = doc.summary(html_partial=True)
-        soup = BeautifulSoup(summary_html, "lxml")
-        text = soup.get_text(separator="\n").strip()
-        if text:
-            return title, text
-    except Exception:
-        pass
-
-    soup = BeautifulSoup(html, "lxml")
-    title = (soup.title.string if soup.title and soup.title.string else "").strip()
-    text = soup.get_text(separator="\n").strip()
-    return title, text
-
-
-def chunk_text(text: str, max_tokens: int = 800, overlap: int = 100) -> List[str]:
-    enc = tiktoken.get_encoding("cl100k_base")
-    tokens = enc.encode(text)
-    if not tokens:
-        return []
-
-    chunks = []
-    start = 0
-    while start < len(tokens):
-        end = min(start + max_tokens, len(tokens))
-        chunk_tokens = tokens[start:end]
-        chunks.append(enc.decode(chunk_tokens))
-        if end == len(tokens):
-            break
-        start = max(0, end - overlap)
-    return chunks
+from app.services.chunk_store import chunk_hash
+from app.services.rate_limit import is_transient, retry_after
+from app.workers.celery_app import celery
+from app.workers.pipeline import (
+    Extraction, delete_payloads, embed_rows, existing_hashes, extract, fail_job, get_json,
+    StageTimer, iter_chunk_rows, payload_key, persist_staged, put_json, put_vectors,
+    record_stats, run_inline, start_job,
+)
 
 
 def embed_texts(client: OpenAI, texts: List[str], model: str) -> Tuple[List[List[float]], int]:
@@ -73,318 +24,176 @@ def embed_texts(client: OpenAI, texts: List[str], model: str) -> Tuple[List[List
     return vectors, dims
 
 
-@celery.task(name="app.workers.tasks.process_url_job", bind=True, max_retries=3)
-def process_url_job(self, job_id: str) -> None:
-    db: Session = SessionLocal()
-    try:
-        job_uuid = uuid.UUID(job_id)
-        job = db.get(IngestionJob, job_uuid)
-        if not job:
-            return
-
-        job.status = "RUNNING"
-        job.attempts = (job.attempts or 0) + 1
-        job.error_message = None
-        db.commit()
-
-        artifact = db.get(Artifact, job.artifact_id)
-        if not artifact or not artifact.source_uri:
-            raise RuntimeError("Artifact missing source_uri")
-
-        url = artifact.source_uri
-        with httpx.Client(follow_redirects=True, timeout=15.0, headers={"User-Agent": "TwinMind/1.0"}) as client_http:
-            r = client_http.get(url)
-            r.raise_for_status()
-            html = r.text
+def _will_retry(task, error: Exception) -> bool:
+    return is_transient(error) and task.request.retries < 3
 
-        title, text = extract_readable_text(html)
-        if not text or len(text.strip()) < 50:
-            raise RuntimeError("Failed to extract meaningful text from URL")
 
-        captured_at = artifact.captured_at or _now_utc()
+def _retry_or_raise(task, error: Exception):
+    # Provider calls already retried in place (rate_limit.py), so this is the
+    # slow path; jitter keeps failed jobs from coming back in lockstep.
+    if _will_retry(task, error):
+        countdown = max(min(60, 2 ** task.request.retries) * random.uniform(0.5, 1.5), retry_after(error) or 0)
+        raise task.retry(exc=error, countdown=countdown)
+    raise error
 
-        doc = Document(
-            artifact_id=artifact.id,
-            user_id=artifact.user_id,
-            title=title or url,
-            source_type="web",
-            source_uri=url,
-            captured_at=captured_at,
-            meta={"url": url},
-        )
-        db.add(doc)
-        db.flush()
 
-        # chunk
-        chunks = chunk_text(text, max_tokens=800, overlap=100)
-        if not chunks:
-            raise RuntimeError("Chunking produced 0 chunks")
+def _run_job(task, job_id: str) -> Dict[str, float]:
+    db: Session = SessionLocal()
+    timer = StageTimer()
+    try:
+        run_inline(db, job_id, timer)
+        return timer.summary()
+    except Exception as e:
+        fail_job(db, job_id, e, timer)
+        _retry_or_raise(task, e)
+    finally:
+        db.close()
 
-        # embed
-        # use_fake = os.getenv("USE_FAKE_EMBEDDINGS") == "1" or not os.getenv("OPENAI_API_KEY")
 
-        # if use_fake:
-        #     embed_model = "mock-embedding-v1"
-        #     vectors = [fake_embedding(c) for c in chunks]
-        #     dims = len(vectors[0])
-        # else:
-        #     oai = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
-        #     embed_model = os.environ.get("OPENAI_EMBED_MODEL", "text-embedding-3-large")
-        #     vectors, dims = embed_texts(oai, chunks, embed_model)
-        embedder = get_embedder()
+# One task per modality, each running every stage in-process (INGEST_PIPELINE=inline).
+# The result is the job's seconds per stage (also in the task-succeeded event).
 
-        vectors, dims, model_name = embedder.embed_texts(chunks)
+@celery.task(name="app.workers.tasks.process_url_job", bind=True, max_retries=3)
+def process_url_job(self, job_id: str) -> Dict[str, float]:
+    return _run_job(self, job_id)
 
+@celery.task(name="app.workers.tasks.process_audio_job", bind=True, max_retries=3)
+def process_audio_job(self, job_id: str) -> Dict[str, float]:
+    return _run_job(self, job_id)
 
-        # store chunks + embeddings
-        for i, (chunk_text_i, vec) in enumerate(zip(chunks, vectors)):
-            ch = Chunk(
-                document_id=doc.id,
-                user_id=artifact.user_id,
-                chunk_index=i,
-                content=chunk_text_i,
-                token_count=None,
-                char_start=None,
-                char_end=None,
-                captured_at=captured_at,
-                time_start_ms=None,
-                time_end_ms=None,
-                meta=None,
-            )
-            db.add(ch)
-            db.flush()
+@celery.task(name="app.workers.tasks.process_pdf_job", bind=True, max_retries=3)
+def process_pdf_job(self, job_id: str) -> Dict[str, float]:
+    return _run_job(self, job_id)
 
-            emb = Embedding(
-                chunk_id=ch.id,
-                user_id=artifact.user_id,
-                model=model_name,
-                dims=dims,
-                embedding=vec,
-            )
-            db.add(emb)
 
-        job.status = "SUCCEEDED"
-        db.commit()
+# Staged pipeline (INGEST_PIPELINE=staged): one task per stage, each routed to
+# its own queue (see celery_app). A stage returns the blob key(s) of its
+# output; None short-circuits the rest of the chain. Inputs are deleted once
+# the next payload is written, or when the job fails for good. Each stage adds
+# its own seconds to the job's stage_seconds.
 
+@celery.task(name="app.workers.tasks.extract_stage", bind=True, max_retries=3)
+def extract_stage(self, job_id: str) -> Optional[str]:
+    db: Session = SessionLocal()
+    timer = StageTimer()
+    try:
+        started = start_job(db, job_id)
+        if not started:
+            return None
+        job, artifact = started
+        with timer.stage("extract"), extract(db, artifact, timer) as extraction:
+            if extraction is not None:
+                key = put_json(payload_key(job_id, "extract.json"), extraction.to_dict())
+        record_stats(job, artifact, timer)
+        if extraction is None:
+            job.status = "SUCCEEDED"
+            db.commit()
+            return None
+        db.commit()  # extractors may have updated artifact metadata
+        return key
     except Exception as e:
-        db.rollback()
-        try:
-            job_uuid = uuid.UUID(job_id)
-            job = db.get(IngestionJob, job_uuid)
-            if job:
-                job.status = "FAILED"
-                job.error_message = str(e)
-                db.commit()
-        except Exception:
-            pass
-
-        msg = str(e).lower()
-        transient = any(s in msg for s in ["timeout", "connection", "temporarily unavailable", "rate limit"])
-
-        if transient and self.request.retries < 3:
-            raise self.retry(exc=e, countdown=min(60, 2 ** self.request.retries))
-
-        raise
+        fail_job(db, job_id, e, timer)
+        _retry_or_raise(self, e)
     finally:
         db.close()
 
-@celery.task(name="app.workers.tasks.process_audio_job", bind=True, max_retries=3)
-def process_audio_job(self, job_id: str) -> None:
+
+@celery.task(name="app.workers.tasks.chunk_stage", bind=True, max_retries=3)
+def chunk_stage(self, extract_key: Optional[str], job_id: str) -> Optional[str]:
+    if extract_key is None:
+        return None
     db: Session = SessionLocal()
+    timer = StageTimer()
     try:
-        job_uuid = uuid.UUID(job_id)
-        job = db.get(IngestionJob, job_uuid)
-        if not job:
-            return
-
-        job.status = "RUNNING"
-        job.attempts = (job.attempts or 0) + 1
-        job.error_message = None
+        started = start_job(db, job_id, first_stage=False)
+        if not started:
+            return None
+        job, artifact = started
+        with timer.stage("chunk"):
+            extraction = Extraction.from_dict(get_json(extract_key))
+            rows = list(iter_chunk_rows(extraction))
+            for row in rows:
+                row["content_hash"] = chunk_hash(row["content"])
+            key = put_json(payload_key(job_id, "chunks.json"), {"header": extraction.header(), "rows": rows})
+        delete_payloads(extract_key)
+        record_stats(job, artifact, timer)
         db.commit()
+        return key
+    except Exception as e:
+        fail_job(db, job_id, e, timer)
+        if not _will_retry(self, e):
+            delete_payloads(extract_key)
+        _retry_or_raise(self, e)
+    finally:
+        db.close()
 
-        artifact = db.get(Artifact, job.artifact_id)
-        if not artifact:
-            raise RuntimeError("Artifact not found")
-
-        hex_bytes = (artifact.meta or {}).get("bytes")
-        if not hex_bytes:
-            raise RuntimeError("No audio bytes found on artifact.meta['bytes']")
-        audio_bytes = bytes.fromhex(hex_bytes)
-        if len(audio_bytes) < 200:
-            raise RuntimeError("Audio bytes too small or corrupt")
-
-        if not os.getenv("OPENAI_API_KEY"):
-            raise RuntimeError("OPENAI_API_KEY missing for transcription")
-
-        meta = artifact.meta or {}
-        filename = meta.get("filename") or "audio"
-        content_type = meta.get("content_type") or ""
-        ext = "wav"
-        if "." in filename:
-            ext = filename.rsplit(".", 1)[1].lower()[:6] or ext
-        elif "mpeg" in content_type:
-            ext = "mp3"
-        elif "m4a" in content_type:
-            ext = "m4a"
-
-        client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
-        buf = io.BytesIO(audio_bytes)
-        buf.name = f"upload.{ext}"
-        transcript = client.audio.transcriptions.create(
-            model=os.getenv("OPENAI_TRANSCRIBE_MODEL", "gpt-4o-mini-transcribe"),
-            file=buf,
-        ).text
-
-        if not transcript or len(transcript.strip()) < 5:
-            raise RuntimeError("Empty transcript")
-
-        captured_at = artifact.captured_at or _now_utc()
-
-        doc = Document(
-            artifact_id=artifact.id,
-            user_id=artifact.user_id,
-            title=artifact.source_uri or "Audio",
-            source_type="audio",
-            source_uri=artifact.source_uri,
-            captured_at=captured_at,
-            meta={"filename": artifact.source_uri},
-        )
-        db.add(doc)
-        db.flush()
-
-        chunks = chunk_text(transcript, max_tokens=500, overlap=80)
-        if not chunks:
-            raise RuntimeError("Chunking produced 0 chunks")
-
-        embedder = get_embedder()
-        vectors, dims, model_name = embedder.embed_texts(chunks)
-
-        for i, (chunk_text_i, vec) in enumerate(zip(chunks, vectors)):
-            ch = Chunk(
-                document_id=doc.id,
-                user_id=artifact.user_id,
-                chunk_index=i,
-                content=chunk_text_i,
-                captured_at=captured_at,
-            )
-            db.add(ch)
-            db.flush()
-
-            db.add(Embedding(
-                chunk_id=ch.id,
-                user_id=artifact.user_id,
-                model=model_name,
-                dims=dims,
-                embedding=vec,
-            ))
 
-        job.status = "SUCCEEDED"
+@celery.task(name="app.workers.tasks.embed_stage", bind=True, max_retries=3)
+def embed_stage(self, chunks_key: Optional[str], job_id: str) -> Optional[Dict[str, Any]]:
+    if chunks_key is None:
+        return None
+    db: Session = SessionLocal()
+    timer = StageTimer()
+    try:
+        started = start_job(db, job_id, first_stage=False)
+        if not started:
+            return None
+        job, artifact = started
+        with timer.stage("embed"):
+            chunks = get_json(chunks_key)
+            # chunks already stored for this source keep their embeddings (incremental re-ingest)
+            skip = existing_hashes(db, artifact, chunks["header"]["source_type"])
+            vectors, dims, model_name = embed_rows(chunks["rows"], skip)
+            key = put_vectors(payload_key(job_id, "vectors.npz"), vectors, dims, model_name)
+        record_stats(job, artifact, timer)
         db.commit()
-
+        return {"chunks": chunks_key, "vectors": key}
     except Exception as e:
-        db.rollback()
-        try:
-            job_uuid = uuid.UUID(job_id)
-            job = db.get(IngestionJob, job_uuid)
-            if job:
-                job.status = "FAILED"
-                job.error_message = str(e)
-                db.commit()
-        except Exception:
-            pass
-        raise
+        fail_job(db, job_id, e, timer)
+        if not _will_retry(self, e):
+            delete_payloads(chunks_key)
+        _retry_or_raise(self, e)
     finally:
         db.close()
 
-@celery.task(name="app.workers.tasks.process_pdf_job", bind=True, max_retries=3)
-def process_pdf_job(self, job_id: str) -> None:
+
+@celery.task(name="app.workers.tasks.persist_stage", bind=True, max_retries=3)
+def persist_stage(self, keys: Optional[Dict[str, Any]], job_id: str) -> None:
+    if keys is None:
+        return
     db: Session = SessionLocal()
+    timer = StageTimer()
     try:
-        job_uuid = uuid.UUID(job_id)
-        job = db.get(IngestionJob, job_uuid)
-        if not job:
+        started = start_job(db, job_id, first_stage=False)
+        if not started:
             return
+        job, artifact = started
+        with timer.stage("persist"):
+            persist_staged(db, job, artifact, get_json(keys["chunks"]), keys["vectors"], timer)
+        delete_payloads(keys["chunks"], keys["vectors"])
+    except Exception as e:
+        fail_job(db, job_id, e, timer)
+        if not _will_retry(self, e):
+            delete_payloads(keys["chunks"], keys["vectors"])
+        _retry_or_raise(self, e)
+    finally:
+        db.close()
 
-        job.status = "RUNNING"
-        job.attempts = (job.attempts or 0) + 1
-        job.error_message = None
-        db.commit()
-
-        artifact = db.get(Artifact, job.artifact_id)
-        if not artifact:
-            raise RuntimeError("Artifact not found")
-
-        hex_bytes = (artifact.meta or {}).get("bytes")
-        if not hex_bytes:
-            raise RuntimeError("No pdf bytes found on artifact.meta['bytes']")
-        pdf_bytes = bytes.fromhex(hex_bytes)
-
-        reader = PdfReader(io.BytesIO(pdf_bytes))
-        pages_text = []
-        for p in reader.pages:
-            t = p.extract_text() or ""
-            if t.strip():
-                pages_text.append(t)
-
-        full_text = "\n\n".join(pages_text).strip()
-        if len(full_text) < 50:
-            raise RuntimeError("PDF text extraction produced too little text")
-
-        captured_at = artifact.captured_at or _now_utc()
-        title = (artifact.source_uri or "PDF")
-
-        doc = Document(
-            artifact_id=artifact.id,
-            user_id=artifact.user_id,
-            title=title,
-            source_type="pdf",
-            source_uri=artifact.source_uri,
-            captured_at=captured_at,
-            meta={"filename": artifact.source_uri},
-        )
-        db.add(doc)
-        db.flush()
-
-        chunks = chunk_text(full_text, max_tokens=700, overlap=120)
-        if not chunks:
-            raise RuntimeError("Chunking produced 0 chunks")
-
-        embedder = get_embedder()
-        vectors, dims, model_name = embedder.embed_texts(chunks)
-
-        for i, (chunk_text_i, vec) in enumerate(zip(chunks, vectors)):
-            ch = Chunk(
-                document_id=doc.id,
-                user_id=artifact.user_id,
-                chunk_index=i,
-                content=chunk_text_i,
-                captured_at=captured_at,
-            )
-            db.add(ch)
-            db.flush()
 
-            db.add(Embedding(
-                chunk_id=ch.id,
-                user_id=artifact.user_id,
-                model=model_name,
-                dims=dims,
-                embedding=vec,
-            ))
+INLINE_TASKS = {"web": process_url_job, "pdf": process_pdf_job, "audio": process_audio_job}
 
-        job.status = "SUCCEEDED"
-        db.commit()
 
-    except Exception as e:
-        db.rollback()
-        try:
-            job_uuid = uuid.UUID(job_id)
-            job = db.get(IngestionJob, job_uuid)
-            if job:
-                job.status = "FAILED"
-                job.error_message = str(e)
-                db.commit()
-        except Exception:
-            pass
-        raise
-    finally:
-        db.close()
+def ingestion_signature(job_id: str, artifact_type: str):
+    """
+    Celery signature that ingests a job, per INGEST_PIPELINE: inline (the
+    default, one task on the "ingest" queue) or staged (opt-in; needs workers
+    on the ingest.* stage queues).
+    """
+    if os.getenv("INGEST_PIPELINE", "inline") != "staged":
+        return INLINE_TASKS[artifact_type].si(job_id)
+    return chain(
+        extract_stage.si(job_id),
+        chunk_stage.s(job_id),
+        embed_stage.s(job_id),
+        persist_stage.s(job_id),
+    )
@@ -0,0 +1,76 @@
+"""
+Benchmarks segmented transcription against a local stand-in transcription
+server (needs ffmpeg on PATH or FFMPEG_BINARY).
+
+    cd backend && python -m benchmarks.bench_audio_transcription --minutes 60
+
+Compares one whole-file transcription call with overlapping segments
+transcribed concurrently, and checks the stitched transcript matches the
+whole-file one word for word.
+"""
+import argparse
+import os
+import tempfile
+import time
+import wave
+
+import numpy as np
+from openai import OpenAI
+
+from app.workers.audio import openai_transcriber, transcribe_audio
+from benchmarks.standins import StandinConfig, StandinServer
+
+
+def write_wav(path: str, seconds: int, rate: int = 16000) -> None:
+    # noise, so every second of audio maps to a distinct stand-in word
+    samples = np.random.default_rng(0).integers(-3000, 3000, size=seconds * rate, dtype=np.int16)
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(samples.tobytes())
+
+
+def _words(pieces):
+    return " ".join(p.text.strip() for p in pieces).split()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--minutes", type=float, default=60)
+    ap.add_argument("--segment-seconds", type=int, default=600)
+    ap.add_argument("--overlap-seconds", type=int, default=5)
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--audio-latency", type=float, default=0.005, help="stand-in seconds per audio second")
+    ap.add_argument("--model", default="gpt-4o-mini-transcribe", help="whisper-1 exercises timestamped stitching")
+    args = ap.parse_args()
+
+    cfg = StandinConfig(base_latency=0.05, audio_latency=args.audio_latency)
+    with tempfile.TemporaryDirectory() as tmp, StandinServer(cfg) as server:
+        path = os.path.join(tmp, "recording.wav")
+        write_wav(path, int(args.minutes * 60))
+        transcribe = openai_transcriber(OpenAI(base_url=f"{server.base_url}/v1", api_key="standin"), args.model)
+
+        t0 = time.perf_counter()
+        whole = transcribe_audio(path, "recording.wav", transcribe, segment_ms=10**9)
+        whole_secs = time.perf_counter() - t0
+        print(f"{'whole file, 1 call':<36} {whole_secs:8.3f}s")
+
+        t0 = time.perf_counter()
+        pieces = transcribe_audio(
+            path, "recording.wav", transcribe,
+            segment_ms=args.segment_seconds * 1000,
+            overlap_ms=args.overlap_seconds * 1000,
+            concurrency=args.concurrency,
+        )
+        secs = time.perf_counter() - t0
+        label = f"segments={args.segment_seconds}s conc={args.concurrency}"
+        print(f"{label:<36} {secs:8.3f}s  ({whole_secs / secs:.1f}x, {len(pieces)} pieces)")
+
+        assert _words(pieces) == _words(whole), "stitched transcript differs from whole-file transcript"
+        timed = [p for p in pieces if p.start_ms is not None and p.end_ms is not None]
+        print(f"stitched transcript matches; {len(timed)}/{len(pieces)} pieces carry time ranges")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Benchmarks the cross-job embedding micro-batcher against a local stand-in
+Ollama server, with many concurrent callers each embedding a few texts
+(short notes, short transcripts).
+
+    cd backend && python -m benchmarks.bench_embed_microbatch --callers 200 --threads 16
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.standins import StandinConfig, StandinServer
+
+
+def run(embedder, jobs, threads: int):
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(lambda texts: embedder.embed_texts(texts)[0], jobs))
+    return results, time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--callers", type=int, default=200, help="embed_texts calls (jobs)")
+    ap.add_argument("--texts-per-call", type=int, default=3)
+    ap.add_argument("--threads", type=int, default=16, help="concurrent jobs, e.g. a threads-pool worker")
+    ap.add_argument("--base-latency", type=float, default=0.03, help="seconds per request")
+    ap.add_argument("--item-latency", type=float, default=0.001, help="seconds per input text")
+    ap.add_argument("--server-concurrency", type=int, default=2, help="requests the stand-in serves at once")
+    args = ap.parse_args()
+
+    jobs = [[f"note {i}.{j} " + "lorem ipsum " * 20 for j in range(args.texts_per_call)] for i in range(args.callers)]
+    cfg = StandinConfig(
+        dims=768, base_latency=args.base_latency, per_item_latency=args.item_latency,
+        concurrency=args.server_concurrency,
+    )
+
+    with StandinServer(cfg) as server:
+        os.environ["OLLAMA_BASE_URL"] = server.base_url
+        from app.services.ai_provider import OllamaEmbedder
+        from app.services.embed_batcher import MicroBatchingEmbedder
+
+        ref, secs = run(OllamaEmbedder(), jobs, args.threads)
+        print(f"{'direct':<32} {secs:8.3f}s  {cfg.requests:5d} requests")
+
+        for max_items, max_wait_ms in [(32, 10), (128, 20), (256, 50)]:
+            before = cfg.requests
+            batcher = MicroBatchingEmbedder(OllamaEmbedder(), max_items=max_items, max_wait=max_wait_ms / 1000)
+            vecs, secs = run(batcher, jobs, args.threads)
+            assert vecs == ref, "micro-batched vectors differ from direct calls"
+            label = f"batched items={max_items} wait={max_wait_ms}ms"
+            print(f"{label:<32} {secs:8.3f}s  {cfg.requests - before:5d} requests")
+
+
+if __name__ == "__main__":
+    main()
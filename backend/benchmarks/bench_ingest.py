@@ -0,0 +1,408 @@
+"""
+End-to-end ingestion throughput: the API (uvicorn) and real Celery workers
+against the docker-compose Postgres/Redis, with local stand-ins for every
+outside service (web pages, Ollama or OpenAI embeddings, OpenAI
+transcription), each with injectable latency and 429 rate.
+
+    docker compose up -d && cd backend && alembic upgrade head
+    python -m benchmarks.bench_ingest --urls 200 --pdfs 50 --audio 20 --concurrency 16
+    python -m benchmarks.bench_ingest --pipeline inline --pool threads --worker-concurrency 32
+    python -m benchmarks.bench_ingest --embedding-provider openai --rate-limit-ratio 0.05
+
+Documents are POSTed to /ingest/url, /ingest/pdf and /ingest/audio from
+`--concurrency` client threads; completion is read from ingestion_jobs.
+Workers run with task events on, and the harness listens to them for the
+per-stage breakdown: inline `process_*_job` tasks report their seconds per
+stage in the task result, staged pipeline stages are tasks of their own.
+Everything the run wrote is deleted afterwards unless --keep.
+"""
+import argparse
+import ast
+import io
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+import uuid
+import wave
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+from dotenv import load_dotenv
+
+from benchmarks.standins import StandinConfig, StandinServer
+
+load_dotenv()
+
+QUEUES = "ingest,ingest.extract,ingest.chunk,ingest.embed,ingest.persist"
+_UUID_RE = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+
+# ---------------------------------------------------------------- inputs
+
+def make_pdf(pages: List[str]) -> bytes:
+    """A minimal text PDF (Helvetica, one content stream per page) pypdf can extract."""
+    objects: List[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    contents = []
+    for text in pages:
+        lines = [
+            "(" + line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ") Tj T*"
+            for line in textwrap.wrap(text, 90)[:60]
+        ]
+        stream = "\n".join(["BT", "/F1 10 Tf", "12 TL", "50 780 Td", *lines, "ET"]).encode("latin-1")
+        contents.append(add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"))
+    parent = len(objects) + len(pages) + 1
+    kids = [
+        add(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Contents %d 0 R"
+            b" /Resources << /Font << /F1 %d 0 R >> >> >>" % (parent, c, font))
+        for c in contents
+    ]
+    add(b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % k for k in kids) + b"] /Count %d >>" % len(kids))
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % parent)
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % i + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    out.write(b"".join(b"%010d 00000 n \n" % o for o in offsets))
+    out.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref))
+    return out.getvalue()
+
+
+def make_wav(seconds: float, seed: int, rate: int = 16000) -> bytes:
+    # noise: the stand-in transcribes every second of audio to a distinct word
+    samples = np.random.default_rng(seed).integers(-3000, 3000, size=int(seconds * rate), dtype=np.int16)
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(samples.tobytes())
+    return buf.getvalue()
+
+
+def _pdf_text(rng: np.random.Generator, words: int) -> str:
+    vocab = [f"{a}{b}" for a in ("ba", "de", "fi", "go", "hu", "ja", "ke", "li") for b in ("rak", "mon", "tel", "vis", "po")]
+    return " ".join(rng.choice(vocab, size=words))
+
+
+# ---------------------------------------------------------------- processes
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_api(env: Dict[str, str]) -> Tuple[subprocess.Popen, str]:
+    port = _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"], env=env,
+    )
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base}/health", timeout=1).status_code == 200:
+                return proc, base
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("API did not come up")
+
+
+def start_workers(env: Dict[str, str], n: int, pool: str, concurrency: int, run_id: str) -> List[subprocess.Popen]:
+    return [
+        subprocess.Popen([
+            sys.executable, "-m", "celery", "-A", "app.workers.celery_app.celery", "worker",
+            "-E", "-Q", QUEUES, "-P", pool, "-c", str(concurrency), "-n", f"bench{i}-{run_id}@%h",
+            "--loglevel", "WARNING", "--without-gossip", "--without-mingle",
+        ], env=env)
+        for i in range(n)
+    ]
+
+
+class TaskEvents:
+    """Listens to worker task events; keeps runtimes per task name, stage seconds and terminal failures."""
+
+    def __init__(self, app, job_ids: set):
+        self.app = app
+        self.job_ids = job_ids
+        self.names: Dict[str, str] = {}
+        self.jobs: Dict[str, str] = {}  # task uuid -> job id
+        self.runtimes: Dict[str, List[float]] = defaultdict(list)
+        self.stages: Dict[str, List[Dict[str, float]]] = defaultdict(list)  # task name -> per-job stage seconds
+        self.failed: Dict[str, str] = {}  # job id -> exception
+        self.retries = 0
+        self.lock = threading.Lock()
+        self.receiver = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _on_event(self, event: dict) -> None:
+        kind, task = event["type"], event.get("uuid")
+        with self.lock:
+            if kind == "task-received":
+                self.names[task] = event.get("name", "?")
+                ids = [i for i in _UUID_RE.findall(event.get("args") or "") if i in self.job_ids]
+                if ids:
+                    self.jobs[task] = ids[-1]
+            elif kind == "task-succeeded":
+                name = self.names.get(task, "?")
+                self.runtimes[name].append(float(event.get("runtime") or 0))
+                try:
+                    result = ast.literal_eval(event.get("result") or "None")
+                except (ValueError, SyntaxError):
+                    result = None
+                if isinstance(result, dict) and "extract" in result:
+                    self.stages[name].append(result)
+            elif kind == "task-retried":
+                self.retries += 1
+            elif kind == "task-failed" and task in self.jobs:
+                self.failed[self.jobs[task]] = event.get("exception", "")
+
+    def _run(self) -> None:
+        with self.app.connection_for_read() as conn:
+            self.receiver = self.app.events.Receiver(conn, handlers={"*": self._on_event})
+            self.receiver.capture(limit=None, timeout=None, wakeup=False)
+
+    def start(self) -> None:
+        self.thread.start()
+        time.sleep(0.5)  # bind the event queue before the first task
+
+    def stop(self) -> None:
+        if self.receiver:
+            self.receiver.should_stop = True
+
+
+# ---------------------------------------------------------------- run
+
+def _pct(values, q) -> float:
+    return float(np.percentile(values, q)) if len(values) else 0.0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--urls", type=int, default=100)
+    ap.add_argument("--pdfs", type=int, default=30)
+    ap.add_argument("--audio", type=int, default=10)
+    ap.add_argument("--concurrency", type=int, default=8, help="client threads POSTing documents")
+    ap.add_argument("--pipeline", choices=["staged", "inline"], default=os.getenv("INGEST_PIPELINE", "inline"))
+    ap.add_argument("--workers", type=int, default=1, help="celery worker processes (all queues)")
+    ap.add_argument("--pool", choices=["prefork", "threads"], default="prefork")
+    ap.add_argument("--worker-concurrency", type=int, default=4)
+    ap.add_argument("--embedding-provider", choices=["ollama", "openai"], default="ollama")
+    ap.add_argument("--pdf-pages", type=int, default=10)
+    ap.add_argument("--audio-seconds", type=float, default=60)
+    ap.add_argument("--page-words", type=int, default=1500)
+    ap.add_argument("--page-latency", type=float, default=0.05, help="web stand-in seconds per page")
+    ap.add_argument("--embed-latency", type=float, default=0.03, help="embeddings stand-in seconds per request")
+    ap.add_argument("--item-latency", type=float, default=0.002, help="embeddings stand-in seconds per input")
+    ap.add_argument("--audio-latency", type=float, default=0.005, help="transcription seconds per audio second")
+    ap.add_argument("--provider-concurrency", type=int, help="requests the provider stand-in serves at once")
+    ap.add_argument("--rate-limit-ratio", type=float, default=0.0, help="share of provider requests answered 429")
+    ap.add_argument("--page-rate-limit-ratio", type=float, default=0.0, help="share of page requests answered 429")
+    ap.add_argument("--retry-after", type=float, default=0.5, help="Retry-After on stand-in 429s, seconds")
+    ap.add_argument("--timeout", type=float, default=900)
+    ap.add_argument("--keep", action="store_true", help="keep the documents this run wrote")
+    args = ap.parse_args()
+
+    run_id = uuid.uuid4().hex[:8]
+    user_id = str(uuid.uuid4())
+    web_cfg = StandinConfig(
+        base_latency=args.page_latency, rate_limit_ratio=args.page_rate_limit_ratio,
+        retry_after=args.retry_after, page_words=args.page_words,
+    )
+    provider_cfg = StandinConfig(
+        base_latency=args.embed_latency, per_item_latency=args.item_latency, audio_latency=args.audio_latency,
+        concurrency=args.provider_concurrency, rate_limit_ratio=args.rate_limit_ratio, retry_after=args.retry_after,
+    )
+
+    with tempfile.TemporaryDirectory() as blobs, StandinServer(web_cfg) as web, StandinServer(provider_cfg) as provider:
+        env = {
+            **os.environ,
+            "INGEST_PIPELINE": args.pipeline,
+            "EMBEDDING_PROVIDER": args.embedding_provider,
+            "OLLAMA_BASE_URL": provider.base_url,
+            "OPENAI_BASE_URL": f"{provider.base_url}/v1",
+            "OPENAI_API_KEY": "standin",
+            "OBJECT_STORE_MODE": "local",
+            "LOCAL_BLOB_DIR": blobs,  # API and workers must see the same uploads
+        }
+        # the harness reads events and job rows from the same Redis/Postgres
+        from app.workers.celery_app import celery
+
+        api, base = start_api(env)
+        workers = start_workers(env, args.workers, args.pool, args.worker_concurrency, run_id)
+        events: Optional[TaskEvents] = None
+        try:
+            rng = np.random.default_rng(0)
+            docs: List[Tuple[str, dict]] = (
+                [("url", {"url": f"{web.base_url}/page/{run_id}/{i}"}) for i in range(args.urls)]
+                + [("pdf", {"data": make_pdf([_pdf_text(rng, 400) for _ in range(args.pdf_pages)])}) for _ in range(args.pdfs)]
+                + [("audio", {"data": make_wav(args.audio_seconds, seed=i)}) for i in range(args.audio)]
+            )
+            order = rng.permutation(len(docs))
+            job_ids: set = set()
+            events = TaskEvents(celery, job_ids)
+            events.start()
+            time.sleep(2)  # workers connecting
+
+            submitted: Dict[str, Tuple[str, float]] = {}  # job id -> (kind, submit time)
+            post_ms: List[float] = []
+            lock = threading.Lock()
+            client = httpx.Client(base_url=base, timeout=120)
+
+            def submit(i: int) -> None:
+                kind, doc = docs[i]
+                t0 = time.perf_counter()
+                if kind == "url":
+                    r = client.post("/ingest/url", json={"user_id": user_id, "url": doc["url"]})
+                else:
+                    ext, mime = ("pdf", "application/pdf") if kind == "pdf" else ("wav", "audio/wav")
+                    r = client.post(
+                        f"/ingest/{kind}", data={"user_id": user_id},
+                        files={"file": (f"{run_id}-{i}.{ext}", doc["data"], mime)},
+                    )
+                r.raise_for_status()
+                job_id = r.json()["job_id"]
+                with lock:
+                    post_ms.append((time.perf_counter() - t0) * 1000)
+                    job_ids.add(job_id)
+                    submitted[job_id] = (kind, t0)
+
+            t_start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                list(pool.map(submit, order))
+            t_submitted = time.perf_counter()
+
+            done = wait_for_jobs(submitted, events, args.timeout)
+            t_end = max((t for _, t in done.values()), default=time.perf_counter())
+            events.stop()
+            report(args, submitted, done, events, post_ms, t_start, t_submitted, t_end,
+                   user_id, web_cfg, provider_cfg)
+        finally:
+            if events:
+                events.stop()
+            for p in [api, *workers]:
+                p.terminate()
+            for p in [api, *workers]:
+                try:
+                    p.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    p.kill()
+            if not args.keep:
+                cleanup(user_id)
+
+
+def wait_for_jobs(submitted: Dict[str, Tuple[str, float]], events: TaskEvents, timeout: float) -> Dict[str, Tuple[str, float]]:
+    """job id -> (final status, time observed); FAILED only once Celery gave up on the job."""
+    from sqlalchemy import text
+
+    from app.db.session import engine
+
+    done: Dict[str, Tuple[str, float]] = {}
+    deadline = time.monotonic() + timeout
+    while len(done) < len(submitted) and time.monotonic() < deadline:
+        pending = [uuid.UUID(j) for j in submitted if j not in done]
+        with engine.connect() as conn:
+            rows = conn.execute(
+                text("SELECT id::text, status FROM ingestion_jobs WHERE id = ANY(:ids)"), {"ids": pending}
+            ).all()
+        now = time.perf_counter()
+        with events.lock:
+            failed = dict(events.failed)
+        for job_id, status in rows:
+            if status == "SUCCEEDED":
+                done[job_id] = ("SUCCEEDED", now)
+            elif status == "FAILED" and job_id in failed:
+                done[job_id] = ("FAILED", now)
+        time.sleep(0.25)
+    if len(done) < len(submitted):
+        print(f"timed out with {len(submitted) - len(done)} jobs unfinished")
+    return done
+
+
+def report(args, submitted, done, events: TaskEvents, post_ms, t_start, t_submitted, t_end,
+           user_id: str, web_cfg: StandinConfig, provider_cfg: StandinConfig) -> None:
+    from sqlalchemy import text
+
+    from app.db.session import engine
+
+    with engine.connect() as conn:
+        chunks = conn.execute(text("SELECT count(*) FROM chunks WHERE user_id = :u"), {"u": user_id}).scalar()
+        tokens = conn.execute(
+            text("SELECT coalesce(sum(token_count), 0) FROM chunks WHERE user_id = :u"), {"u": user_id}
+        ).scalar()
+
+    wall = max(t_end - t_start, 1e-9)
+    ok = sum(1 for s, _ in done.values() if s == "SUCCEEDED")
+    print(f"\npipeline={args.pipeline} workers={args.workers}x{args.pool}:{args.worker_concurrency} "
+          f"clients={args.concurrency} embeddings={args.embedding_provider}")
+    print(f"{len(submitted)} documents submitted in {t_submitted - t_start:.2f}s "
+          f"(POST p50 {_pct(post_ms, 50):.0f} ms, p95 {_pct(post_ms, 95):.0f} ms)")
+    print(f"{ok} succeeded, {len(done) - ok} failed, {len(submitted) - len(done)} unfinished in {wall:.2f}s")
+    print(f"throughput: {ok / wall:.2f} docs/s, {chunks / wall:.1f} chunks/s, {tokens / wall:,.0f} tokens/s")
+
+    print(f"\n{'kind':<8} {'docs':>6} {'ok':>6} {'p50 s':>8} {'p95 s':>8} {'max s':>8}")
+    for kind in ("url", "pdf", "audio"):
+        latencies = [done[j][1] - t0 for j, (k, t0) in submitted.items() if k == kind and j in done]
+        n = sum(1 for k, _ in submitted.values() if k == kind)
+        if not n:
+            continue
+        n_ok = sum(1 for j, (k, _) in submitted.items() if k == kind and done.get(j, ("",))[0] == "SUCCEEDED")
+        print(f"{kind:<8} {n:6d} {n_ok:6d} {_pct(latencies, 50):8.2f} {_pct(latencies, 95):8.2f} "
+              f"{max(latencies, default=0):8.2f}")
+
+    print(f"\n{'task':<28} {'runs':>6} {'mean s':>8} {'p95 s':>8} {'total s':>9}")
+    for name, runtimes in sorted(events.runtimes.items()):
+        print(f"{name.rsplit('.', 1)[-1]:<28} {len(runtimes):6d} {np.mean(runtimes):8.3f} "
+              f"{_pct(runtimes, 95):8.3f} {sum(runtimes):9.1f}")
+    if events.stages:
+        # inline jobs: stages overlap (embedding runs while chunking continues)
+        print(f"\n{'stage seconds per job':<28} " + " ".join(f"{s:>9}" for s in ("extract", "chunk", "embed", "persist")))
+        for name, rows in sorted(events.stages.items()):
+            means = [np.mean([r.get(s, 0.0) for r in rows]) for s in ("extract", "chunk", "embed", "persist")]
+            print(f"{name.rsplit('.', 1)[-1]:<28} " + " ".join(f"{m:9.3f}" for m in means))
+    print(f"\ncelery retries: {events.retries}")
+    print(f"web stand-in: {web_cfg.requests} pages, {web_cfg.rate_limited} x 429")
+    print(f"provider stand-in: {provider_cfg.requests} requests, {provider_cfg.items} inputs, "
+          f"{provider_cfg.rate_limited} x 429")
+
+
+def cleanup(user_id: str) -> None:
+    from sqlalchemy import text
+
+    from app.db.session import engine
+
+    with engine.begin() as conn:
+        params = {"u": user_id}
+        conn.execute(text("DELETE FROM embeddings WHERE user_id = :u"), params)
+        conn.execute(text("DELETE FROM chunks WHERE user_id = :u"), params)
+        conn.execute(text("DELETE FROM documents WHERE user_id = :u"), params)
+        conn.execute(text(
+            "DELETE FROM ingestion_jobs WHERE artifact_id IN (SELECT id FROM artifacts WHERE user_id = :u)"
+        ), params)
+        conn.execute(text("DELETE FROM artifacts WHERE user_id = :u"), params)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmarks OllamaEmbedder against a local stand-in Ollama server.
+
+    cd backend && python -m benchmarks.bench_ollama_embedder --chunks 300
+
+Compares the old one-request-per-text /api/embeddings loop with the batched,
+pooled and concurrent /api/embed path across a few batch/concurrency settings.
+"""
+import argparse
+import os
+import time
+
+import httpx
+
+from benchmarks.standins import StandinConfig, StandinServer
+
+
+def legacy_embed(base: str, model: str, texts):
+    vecs = []
+    for t in texts:
+        r = httpx.post(f"{base}/api/embeddings", json={"model": model, "prompt": t}, timeout=60.0)
+        r.raise_for_status()
+        vecs.append(r.json()["embedding"])
+    return vecs
+
+
+def batched_embed(base: str, texts, batch_size: int, concurrency: int):
+    os.environ["OLLAMA_BASE_URL"] = base
+    os.environ["OLLAMA_EMBED_BATCH_SIZE"] = str(batch_size)
+    os.environ["OLLAMA_EMBED_CONCURRENCY"] = str(concurrency)
+    from app.services.ai_provider import OllamaEmbedder
+
+    vecs, _, _ = OllamaEmbedder().embed_texts(texts)
+    return vecs
+
+
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=300)
+    ap.add_argument("--dims", type=int, default=768)
+    ap.add_argument("--base-latency", type=float, default=0.02, help="seconds per request")
+    ap.add_argument("--item-latency", type=float, default=0.002, help="seconds per input text")
+    args = ap.parse_args()
+
+    texts = [f"chunk {i} " + "lorem ipsum " * 50 for i in range(args.chunks)]
+    cfg = StandinConfig(dims=args.dims, base_latency=args.base_latency, per_item_latency=args.item_latency)
+
+    with StandinServer(cfg) as server:
+        ref, secs = _timed(legacy_embed, server.base_url, "nomic-embed-text", texts)
+        print(f"{'legacy /api/embeddings':<36} {secs:8.3f}s  {len(texts) / secs:8.1f} texts/s")
+
+        for batch_size, concurrency in [(16, 1), (32, 1), (32, 4), (64, 4), (64, 8)]:
+            vecs, secs = _timed(batched_embed, server.base_url, texts, batch_size, concurrency)
+            assert vecs == ref, "batched embeddings differ from legacy path"
+            label = f"/api/embed batch={batch_size} conc={concurrency}"
+            print(f"{label:<36} {secs:8.3f}s  {len(texts) / secs:8.1f} texts/s")
+
+
+if __name__ == "__main__":
+    main()
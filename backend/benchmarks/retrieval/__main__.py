@@ -0,0 +1,111 @@
+"""
+Offline retrieval benchmark: synthetic corpus -> Postgres -> latency/recall.
+
+    docker compose up -d postgres && cd backend && alembic upgrade head
+    python -m benchmarks.retrieval load --embeddings 100000 --users 20 [--compact halfvec,bit]
+    python -m benchmarks.retrieval run --embeddings 100000 --users 20 --queries 500 --top-k 10
+    python -m benchmarks.retrieval run ... --modes vector,hybrid,hot --ef-search 40,100,200
+    python -m benchmarks.retrieval run ... --window-days 30          (time-filtered queries)
+    python -m benchmarks.retrieval sample --embeddings 100000 --users 20
+    python -m benchmarks.retrieval reset --embeddings 100000 --users 20
+
+No provider is involved: chunks are embedded with FakeEmbedder
+(EMBEDDING_PROVIDER=fake, model fake-embed-<dims>). `run` must be given the
+same corpus options as `load`; they determine the user ids and queries.
+"""
+import argparse
+import json
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _corpus(args):
+    from benchmarks.retrieval.corpus import Corpus, CorpusSpec
+
+    return Corpus(CorpusSpec(
+        embeddings=args.embeddings, users=args.users, chunks_per_doc=args.chunks_per_doc,
+        words_per_chunk=args.words_per_chunk, topics=args.topics, seed=args.seed,
+    ))
+
+
+def _csv(value: str):
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.retrieval")
+    ap.add_argument("command", choices=["load", "run", "sample", "reset"])
+    corpus = ap.add_argument_group("corpus (same values for load and run)")
+    corpus.add_argument("--embeddings", type=int, default=10_000, help="total chunks, 10k .. 10M")
+    corpus.add_argument("--users", type=int, default=10)
+    corpus.add_argument("--chunks-per-doc", type=int, default=8)
+    corpus.add_argument("--words-per-chunk", type=int, default=60)
+    corpus.add_argument("--topics", type=int, default=200)
+    corpus.add_argument("--seed", type=int, default=0)
+    corpus.add_argument("--dims", type=int, default=768)
+    load = ap.add_argument_group("load")
+    load.add_argument("--batch-docs", type=int, default=500, help="documents per COPY transaction")
+    load.add_argument("--index", choices=["hnsw", "ivfflat", "none"], default="hnsw")
+    load.add_argument("--compact", type=_csv, default=[], help="compact copies to write and index: halfvec,bit")
+    load.add_argument("--no-reset", action="store_true", help="keep rows from an earlier load of this corpus")
+    run = ap.add_argument_group("run")
+    run.add_argument("--modes", type=_csv, default=["vector", "hybrid", "halfvec", "bit", "hot", "mmr", "chat"])
+    run.add_argument("--queries", type=int, default=200)
+    run.add_argument("--warmup", type=int, default=20)
+    run.add_argument("--top-k", type=int, default=10)
+    run.add_argument("--concurrency", type=int, default=1)
+    run.add_argument("--ef-search", type=_csv, default=[], help="hnsw.ef_search values to sweep for vector/mmr")
+    run.add_argument("--window-days", type=float, help="give each query a random captured_at window this long")
+    run.add_argument("--json", help="also write the report here")
+    args = ap.parse_args()
+
+    # before any app import reads them
+    os.environ["EMBEDDING_PROVIDER"] = "fake"
+    os.environ["FAKE_EMBED_DIMS"] = str(args.dims)
+    if set(args.compact) - {"halfvec", "bit"}:
+        ap.error("--compact takes halfvec and/or bit")
+
+    c = _corpus(args)
+    if args.command == "sample":
+        for d in range(2):
+            doc = c.doc(0, d)
+            print(f"{doc.title!r} ({doc.source_type}, {doc.captured_at:%Y-%m-%d})\n  {c.text(doc.words[0])[:160]}...")
+        for user, query in c.queries(5):
+            print(f"query {user}: {query}")
+        return
+
+    from benchmarks.retrieval import load as loader
+
+    if args.command == "reset":
+        loader.reset(c)
+        return
+
+    from app.services.ai_provider import FakeEmbedder
+
+    embedder = FakeEmbedder()
+    if args.command == "load":
+        if not args.no_reset:
+            loader.reset(c)
+        loader.load(c, embedder.dims, embedder.model, args.batch_docs, args.index, args.compact)
+        return
+
+    from benchmarks.retrieval import run as runner
+
+    unknown = set(args.modes) - set(runner.MODES)
+    if unknown:
+        ap.error(f"unknown modes {sorted(unknown)}, expected some of {runner.MODES}")
+    reports = runner.run(
+        c, args.modes, args.queries, args.top_k, args.concurrency,
+        [int(ef) for ef in args.ef_search] or [None], args.window_days, args.warmup,
+    )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"corpus": c.spec._asdict(), "top_k": args.top_k, "concurrency": args.concurrency,
+                       "window_days": args.window_days, "reports": [r.summary() for r in reports]}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Deterministic synthetic corpus: users -> documents -> chunks of made-up words.
+
+Every document is generated from its own seeded RNG, so any (user, doc) can
+be rebuilt on its own: the loader streams the corpus and the runner rebuilds
+single chunks to derive queries from, without either storing anything.
+
+Words come from a fixed vocabulary split into topics (Zipf-distributed per
+user) plus a pool of common words, so chunks on the same topic share words
+and land near each other under FakeEmbedder, and full-text search has real
+terms to match. Vectors are the sum of word vectors, exactly what
+FakeEmbedder computes for the chunk text (up to float rounding), but done
+as one gather-and-sum over the vocabulary matrix.
+"""
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List, NamedTuple, Tuple
+
+import numpy as np
+
+NAMESPACE = uuid.UUID("5a4c2f0e-2d0b-4c53-9a55-0be9c4f1b7d1")
+SOURCE_TYPES = ("web", "pdf", "audio")
+SOURCE_WEIGHTS = (0.5, 0.3, 0.2)
+_CONSONANTS = "bdfgklmnprstvz"
+_VOWELS = "aeiou"
+_QUERY_STREAM = 1 << 30  # RNG stream id for queries, apart from any user index
+
+
+class CorpusSpec(NamedTuple):
+    embeddings: int = 10_000
+    users: int = 10
+    chunks_per_doc: int = 8
+    words_per_chunk: int = 60
+    topics: int = 200
+    words_per_topic: int = 50
+    common_words: int = 500
+    days: int = 365
+    seed: int = 0
+
+    @property
+    def docs_per_user(self) -> int:
+        return max(1, self.embeddings // (self.users * self.chunks_per_doc))
+
+    @property
+    def vocab_size(self) -> int:
+        return self.topics * self.words_per_topic + self.common_words
+
+
+class Doc(NamedTuple):
+    id: uuid.UUID
+    user_id: uuid.UUID
+    title: str
+    source_type: str
+    captured_at: datetime
+    words: np.ndarray  # (chunks_per_doc, words_per_chunk) vocabulary indices
+
+
+def word(i: int) -> str:
+    # 3+ consonant-vowel syllables, unique per index: "bafeki", "zutoma", ...
+    out = []
+    for _ in range(3):
+        i, r = divmod(i, len(_CONSONANTS) * len(_VOWELS))
+        out.append(_CONSONANTS[r // len(_VOWELS)] + _VOWELS[r % len(_VOWELS)])
+    while i:
+        i, r = divmod(i - 1, len(_CONSONANTS))
+        out.append(_CONSONANTS[r] + "o")
+    return "".join(out)
+
+
+def vocabulary(spec: CorpusSpec) -> List[str]:
+    return [word(i) for i in range(spec.vocab_size)]
+
+
+def user_id(spec: CorpusSpec, u: int) -> uuid.UUID:
+    return uuid.uuid5(NAMESPACE, f"{spec.seed}:user:{u}")
+
+
+def chunk_id(doc: Doc, c: int) -> uuid.UUID:
+    return uuid.uuid5(doc.id, str(c))
+
+
+def _zipf(n: int, s: float) -> np.ndarray:
+    p = 1.0 / np.arange(1, n + 1) ** s
+    return p / p.sum()
+
+
+class Corpus:
+    def __init__(self, spec: CorpusSpec):
+        self.spec = spec
+        self.now = datetime(2026, 1, 1, tzinfo=timezone.utc)  # fixed, so reruns match
+        self._topic_p = _zipf(spec.topics, 0.8)
+        self._word_p = _zipf(spec.words_per_topic, 1.0)
+        self._common_p = _zipf(spec.common_words, 1.0)
+
+    def text(self, words: np.ndarray) -> str:
+        return " ".join(word(int(i)) for i in words)
+
+    def doc(self, u: int, d: int) -> Doc:
+        spec = self.spec
+        rng = np.random.default_rng([spec.seed, u, d])
+        # each user favours a different slice of the topics
+        shift = int(np.random.default_rng([spec.seed, u]).integers(spec.topics))
+        main, second = (shift + rng.choice(spec.topics, size=2, p=self._topic_p)) % spec.topics
+        shape = (spec.chunks_per_doc, spec.words_per_chunk)
+        source = rng.random(shape)
+        in_topic = rng.choice(spec.words_per_topic, size=shape, p=self._word_p)
+        common = spec.topics * spec.words_per_topic + rng.choice(spec.common_words, size=shape, p=self._common_p)
+        words = np.where(
+            source < 0.6, main * spec.words_per_topic + in_topic,
+            np.where(source < 0.75, second * spec.words_per_topic + in_topic, common),
+        )
+        return Doc(
+            id=uuid.uuid5(NAMESPACE, f"{spec.seed}:doc:{u}:{d}"),
+            user_id=user_id(spec, u),
+            title=self.text(words[0, :4]),
+            source_type=SOURCE_TYPES[rng.choice(len(SOURCE_TYPES), p=SOURCE_WEIGHTS)],
+            captured_at=self.now - timedelta(days=float(rng.random() * spec.days)),
+            words=words,
+        )
+
+    def docs(self, u: int) -> Iterator[Doc]:
+        for d in range(self.spec.docs_per_user):
+            yield self.doc(u, d)
+
+    def queries(self, n: int, words: int = 6) -> List[Tuple[uuid.UUID, str]]:
+        """(user_id, query) pairs: a few words picked from one of that user's chunks."""
+        spec = self.spec
+        rng = np.random.default_rng([spec.seed, _QUERY_STREAM])
+        out = []
+        for _ in range(n):
+            u, d, c = (int(rng.integers(x)) for x in (spec.users, spec.docs_per_user, spec.chunks_per_doc))
+            chunk = self.doc(u, d).words[c]
+            out.append((user_id(spec, u), self.text(rng.choice(chunk, size=min(words, len(chunk)), replace=False))))
+        return out
+
+
+def vocab_matrix(spec: CorpusSpec, dims: int) -> np.ndarray:
+    """FakeEmbedder's vector for every vocabulary word, row i for word(i)."""
+    from app.services.ai_provider import _fake_word_vector
+
+    return np.stack([_fake_word_vector(w, dims) for w in vocabulary(spec)])
+
+
+def embed_words(matrix: np.ndarray, words: np.ndarray) -> np.ndarray:
+    # (chunks, words) indices -> unit vectors, as FakeEmbedder on the joined text
+    vecs = matrix[words].sum(axis=1)
+    return vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
@@ -0,0 +1,118 @@
+"""
+Loads a synthetic corpus (benchmarks.retrieval.corpus) into the database
+DATABASE_URL points at, e.g. the docker-compose Postgres after
+`alembic upgrade head`, with binary COPYs of a few hundred documents per
+transaction. The model's ANN indexes are dropped during the load and built
+afterwards (one pass is far cheaper than inserting into HNSW row by row).
+"""
+import time
+from typing import Sequence
+
+import numpy as np
+from sqlalchemy import text
+
+from app.db.session import SessionLocal, engine, raw_connection
+from app.services import ann_index, compact_vectors
+from app.services.chunk_store import CHUNK_COLUMNS, CHUNK_TYPES, EMBEDDING_COLUMNS, EMBEDDING_TYPES, chunk_hash
+from benchmarks.retrieval.corpus import Corpus, Doc, chunk_id, embed_words, user_id, vocab_matrix
+
+ARTIFACT_COLUMNS = ("id", "user_id", "type", "source_uri", "captured_at")
+ARTIFACT_TYPES = ["uuid", "uuid", "text", "text", "timestamptz"]
+DOCUMENT_COLUMNS = ("id", "artifact_id", "user_id", "title", "source_type", "source_uri", "captured_at")
+DOCUMENT_TYPES = ["uuid", "uuid", "uuid", "text", "text", "text", "timestamptz"]
+
+
+def reset(corpus: Corpus) -> None:
+    users = [user_id(corpus.spec, u) for u in range(corpus.spec.users)]
+    with engine.begin() as conn:
+        for table in ("embeddings", "chunks", "documents", "artifacts"):
+            conn.execute(text(f"DELETE FROM {table} WHERE user_id = ANY(:users)"), {"users": users})
+
+
+def _copy(cur, table: str, columns: Sequence[str], types: Sequence[str], rows) -> None:
+    with cur.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT BINARY)") as copy:
+        copy.set_types(list(types))
+        for row in rows:
+            copy.write_row(row)
+
+
+def write_batch(db, corpus: Corpus, docs: Sequence[Doc], matrix: np.ndarray, model: str, compact: Sequence[str]) -> int:
+    spec = corpus.spec
+    conn = raw_connection(db)
+    words = np.concatenate([d.words for d in docs])
+    vectors = embed_words(matrix, words)
+    extra = compact_vectors.copy_columns(compact)
+    with conn.cursor() as cur:
+        # the document id doubles as its artifact id: one artifact per document
+        _copy(cur, "artifacts", ARTIFACT_COLUMNS, ARTIFACT_TYPES, (
+            (d.id, d.user_id, d.source_type, f"bench://{d.id}", d.captured_at) for d in docs
+        ))
+        _copy(cur, "documents", DOCUMENT_COLUMNS, DOCUMENT_TYPES, (
+            (d.id, d.id, d.user_id, d.title, d.source_type, f"bench://{d.id}", d.captured_at) for d in docs
+        ))
+        chunk_ids, chunk_rows = [], []
+        for d in docs:
+            for c, chunk_words in enumerate(d.words):
+                cid = chunk_id(d, c)
+                content = corpus.text(chunk_words)
+                chunk_ids.append((cid, d))
+                chunk_rows.append((
+                    cid, d.id, d.user_id, c, content, spec.words_per_chunk,
+                    None, None, d.captured_at, None, None, None, chunk_hash(content),
+                ))
+        _copy(cur, "chunks", CHUNK_COLUMNS, CHUNK_TYPES, chunk_rows)
+        _copy(cur, "embeddings", EMBEDDING_COLUMNS + tuple(extra), EMBEDDING_TYPES + list(extra.values()), (
+            (cid, d.user_id, model, matrix.shape[1], vec, d.source_type, d.captured_at,
+             *(compact_vectors.encode(kind, vec) for kind in compact))
+            for (cid, d), vec in zip(chunk_ids, vectors)
+        ))
+    db.commit()
+    return len(chunk_ids)
+
+
+def build_indexes(model: str, dims: int, method: str, compact: Sequence[str]) -> None:
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for kind in ("embedding", *compact):
+            if not ann_index.indexable(dims, kind):
+                print(f"skipping {kind} index: {dims} dims is too wide")
+                continue
+            sql = ann_index.create_index_sql(model, dims, method, kind=kind)
+            print(sql)
+            t0 = time.perf_counter()
+            conn.execute(text(sql))
+            print(f"  built in {time.perf_counter() - t0:.1f}s")
+        conn.execute(text("ANALYZE embeddings"))
+        conn.execute(text("ANALYZE chunks"))
+
+
+def drop_indexes(model: str, dims: int, compact: Sequence[str]) -> None:
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for kind in ("embedding", *compact):
+            for method in ann_index.METHODS:
+                conn.execute(text(ann_index.drop_index_sql(model, dims, method, kind=kind)))
+
+
+def load(corpus: Corpus, dims: int, model: str, batch_docs: int, index: str, compact: Sequence[str]) -> None:
+    spec = corpus.spec
+    matrix = vocab_matrix(spec, dims)
+    drop_indexes(model, dims, compact)
+    total = spec.users * spec.docs_per_user * spec.chunks_per_doc
+    print(f"loading {spec.users} users x {spec.docs_per_user} docs x {spec.chunks_per_doc} chunks = {total} embeddings")
+    done, t0 = 0, time.perf_counter()
+    db = SessionLocal()
+    try:
+        for u in range(spec.users):
+            batch = []
+            for doc in corpus.docs(u):
+                batch.append(doc)
+                if len(batch) == batch_docs:
+                    done += write_batch(db, corpus, batch, matrix, model, compact)
+                    batch = []
+            if batch:
+                done += write_batch(db, corpus, batch, matrix, model, compact)
+            secs = time.perf_counter() - t0
+            print(f"  user {u + 1}/{spec.users}: {done}/{total} embeddings, {done / secs:,.0f}/s")
+    finally:
+        db.close()
+    if index != "none":
+        build_indexes(model, dims, index, compact)
@@ -0,0 +1,267 @@
+"""
+Times retrieval over a loaded synthetic corpus and scores it against exact
+search. Ground truth per query is an exact cosine top-k: the same user,
+model and filters, ordered by the uncast `embedding <=> query`, which no ANN
+index covers, so Postgres scans the user's rows. Every mode is then
+measured on the same queries:
+
+- vector: search_chunks as the API runs it (HNSW/IVFFlat when indexed)
+- hybrid: vector + full-text fused with RRF (recall drops by design where
+  lexical hits win)
+- halfvec / bit: COMPACT_SEARCH coarse pass + exact rescore
+- hot: the in-process NumPy tier (HOT_TIER), loaded before timing
+- mmr: vector with 4x candidates and local MMR reranking
+- chat: POST /chat end to end (fake embedder, USE_FAKE_LLM, no LLM rerank)
+
+Queries are embedded once up front with FakeEmbedder, so latencies other than
+"chat" are the SQL (or matmul) round trip only.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import text
+
+from app.db.session import SessionLocal
+from app.services import compact_vectors
+from app.services.ai_provider import FakeEmbedder, vector_to_pgvector_literal
+from app.services.ann_index import index_predicate
+from app.services.mmr import mmr_rerank
+from app.services.retrieval import RetrievalFilter, _filter_sql, search_chunks
+from benchmarks.retrieval.corpus import Corpus
+
+MODES = ("vector", "hybrid", "halfvec", "bit", "hot", "mmr", "chat")
+
+
+class Query(NamedTuple):
+    user_id: str
+    text: str
+    vector: List[float]
+    filters: Optional[RetrievalFilter]
+
+
+class Report(NamedTuple):
+    mode: str
+    latencies_ms: np.ndarray
+    recall: float
+    qps: float
+
+    def summary(self) -> dict:
+        p50, p95, p99 = np.percentile(self.latencies_ms, [50, 95, 99])
+        return {"mode": self.mode, "queries": len(self.latencies_ms), "p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "recall": self.recall, "qps": self.qps}
+
+    def row(self) -> str:
+        s = self.summary()
+        return f"{self.mode:<20} {s['p50_ms']:9.2f} {s['p95_ms']:9.2f} {s['p99_ms']:9.2f} {self.recall:9.3f} {self.qps:9.1f}"
+
+
+HEADER = f"{'mode':<20} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'recall@k':>9} {'qps':>9}"
+
+
+@contextmanager
+def _env(**values: Optional[str]) -> Iterator[None]:
+    saved = {k: os.environ.get(k) for k in values}
+    for k, v in values.items():
+        if v is None:
+            os.environ.pop(k, None)
+        else:
+            os.environ[k] = v
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def make_queries(corpus: Corpus, n: int, window_days: Optional[float]) -> List[Query]:
+    embedder = FakeEmbedder()
+    pairs = corpus.queries(n)
+    vectors = embedder.embed_array([q for _, q in pairs])
+    rng = np.random.default_rng([corpus.spec.seed, 7])
+    out = []
+    for (user, query), vec in zip(pairs, vectors):
+        filters = None
+        if window_days:
+            before = corpus.now - timedelta(days=float(rng.random() * max(0.0, corpus.spec.days - window_days)))
+            filters = RetrievalFilter(captured_after=before - timedelta(days=window_days), captured_before=before)
+        out.append(Query(str(user), query, vec.tolist(), filters))
+    return out
+
+
+def exact_ids(db, q: Query, model: str, dims: int, top_k: int) -> List[str]:
+    where, params = _filter_sql(q.filters, "e")
+    try:
+        rows = db.execute(text(f"""
+            SELECT e.chunk_id::text
+            FROM embeddings e
+            WHERE e.user_id = :user_id
+              AND {index_predicate(model, dims, alias="e")}{where}
+            ORDER BY e.embedding <=> CAST(:qvec AS vector)
+            LIMIT :top_k
+        """), {"user_id": q.user_id, "qvec": vector_to_pgvector_literal(q.vector), "top_k": top_k, **params}).all()
+    finally:
+        db.rollback()
+    return [r[0] for r in rows]
+
+
+def _timed(call: Callable[[Query], List[str]], queries: Sequence[Query], concurrency: int) -> Tuple[np.ndarray, List[List[str]], float]:
+    def one(q: Query) -> Tuple[float, List[str]]:
+        t0 = time.perf_counter()
+        ids = call(q)
+        return (time.perf_counter() - t0) * 1000, ids
+
+    t0 = time.perf_counter()
+    if concurrency == 1:
+        results = [one(q) for q in queries]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(one, queries))
+    wall = time.perf_counter() - t0
+    return np.array([r[0] for r in results]), [r[1] for r in results], len(queries) / wall
+
+
+def _sessions() -> Callable[[], object]:
+    # one Session per worker thread
+    local = threading.local()
+
+    def get():
+        if not hasattr(local, "db"):
+            local.db = SessionLocal()
+        return local.db
+
+    return get
+
+
+def _exact_call(model: str, dims: int, top_k: int) -> Callable[[Query], List[str]]:
+    session = _sessions()
+    return lambda q: exact_ids(session(), q, model, dims, top_k)
+
+
+def _search_call(mode: str, model: str, dims: int, top_k: int, ef_search: Optional[int]) -> Callable[[Query], List[str]]:
+    session = _sessions()
+
+    def call(q: Query) -> List[str]:
+        db = session()
+        try:
+            if mode == "mmr":
+                hits = search_chunks(db, q.user_id, q.text, q.vector, dims, model, top_k * 4, ef_search, None,
+                                     "vector", True, q.filters)
+                hits = mmr_rerank(q.vector, [dict(h) for h in hits], top_k=top_k)
+            else:
+                hits = search_chunks(db, q.user_id, q.text, q.vector, dims, model, top_k, ef_search, None,
+                                     mode, False, q.filters)
+            return [h["chunk_id"] for h in hits]
+        finally:
+            db.rollback()
+
+    return call
+
+
+def _chat_call(top_k: int) -> Callable[[Query], List[str]]:
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    client = TestClient(app)
+
+    def call(q: Query) -> List[str]:
+        body = {"user_id": q.user_id, "query": q.text, "top_k": top_k, "mode": "vector", "reranker": "none"}
+        if q.filters:
+            body["captured_after"] = q.filters.captured_after.isoformat()
+            body["captured_before"] = q.filters.captured_before.isoformat()
+        r = client.post("/chat", json=body)
+        r.raise_for_status()
+        return [s["chunk_id"] for s in r.json()["sources"]]
+
+    return call
+
+
+def warm_hot_tier(users: Sequence[str], model: str, dims: int, timeout: float = 600) -> bool:
+    from app.services.hot_tier import get_hot_tier
+
+    tier = get_hot_tier()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if all(tier.get(u, model, dims) is not None for u in users):
+            print(f"hot tier loaded: {tier.stats()}")
+            return True
+        time.sleep(0.2)
+    print(f"hot tier did not load every user within {timeout:.0f}s (HOT_TIER_MAX_ROWS?): {tier.stats()}")
+    return False
+
+
+def _compact_rows(kind: str, model: str, dims: int) -> int:
+    column = compact_vectors.COLUMNS[kind]
+    db = SessionLocal()
+    try:
+        return db.execute(text(
+            f"SELECT count(*) FROM embeddings WHERE {index_predicate(model, dims)} AND {column} IS NOT NULL"
+        )).scalar()
+    finally:
+        db.close()
+
+
+def run(corpus: Corpus, modes: Sequence[str], n_queries: int, top_k: int, concurrency: int,
+        ef_search: Sequence[Optional[int]], window_days: Optional[float], warmup: int) -> List[Report]:
+    embedder = FakeEmbedder()
+    model, dims = embedder.model, embedder.dims
+    queries = make_queries(corpus, n_queries + warmup, window_days)
+    warm, queries = queries[:warmup], queries[warmup:]
+
+    db = SessionLocal()
+    try:
+        t0 = time.perf_counter()
+        truth = [exact_ids(db, q, model, dims, top_k) for q in queries]
+        exact_ms = (time.perf_counter() - t0) * 1000
+    finally:
+        db.close()
+    print(f"ground truth: {len(queries)} exact queries, {exact_ms / max(1, len(queries)):.1f} ms each\n")
+
+    # off unless a mode turns them on
+    base_env = {"EMBEDDING_PROVIDER": "fake", "HOT_TIER": None, "COMPACT_SEARCH": None}
+    plan: List[Tuple[str, Dict[str, Optional[str]], Callable[[Query], List[str]]]] = []
+    plan.append(("exact", {}, _exact_call(model, dims, top_k)))
+    for mode in modes:
+        if mode in ("halfvec", "bit") and not _compact_rows(mode, model, dims):
+            print(f"skipping {mode}: no {mode} copies for {model} (load with --compact {mode})")
+            continue
+        if mode in ("vector", "mmr"):
+            for ef in ef_search:
+                label = mode if ef is None else f"{mode} ef={ef}"
+                plan.append((label, {}, _search_call(mode, model, dims, top_k, ef)))
+        elif mode in ("halfvec", "bit"):
+            plan.append((mode, {"COMPACT_SEARCH": mode}, _search_call("vector", model, dims, top_k, None)))
+        elif mode == "hot":
+            # every benchmark user has to fit, or queries fall through to pgvector
+            rows = str(max(corpus.spec.docs_per_user * corpus.spec.chunks_per_doc, 200000))
+            plan.append((mode, {"HOT_TIER": "1", "HOT_TIER_MAX_ROWS": os.getenv("HOT_TIER_MAX_ROWS", rows)},
+                         _search_call("vector", model, dims, top_k, None)))
+        elif mode == "chat":
+            plan.append((mode, {"USE_FAKE_LLM": "1", "QUERY_DATE_PARSING": "0"}, _chat_call(top_k)))
+        else:
+            plan.append((mode, {}, _search_call(mode, model, dims, top_k, None)))
+
+    reports = []
+    print(HEADER)
+    for label, env, call in plan:
+        with _env(**{**base_env, **env}):
+            if label == "hot" and not warm_hot_tier(sorted({q.user_id for q in queries}), model, dims):
+                continue
+            for q in warm:
+                call(q)
+            latencies, results, qps = _timed(call, queries, concurrency)
+        recall = float(np.mean([
+            len(set(got) & set(want)) / len(want) for got, want in zip(results, truth) if want
+        ] or [0.0]))
+        report = Report(label, latencies, recall, qps)
+        print(report.row())
+        reports.append(report)
+    return reports
@@ -0,0 +1,261 @@
+"""
+Local stand-in HTTP servers for provider APIs and web pages, used by the
+benchmarks so no real Ollama/OpenAI (or internet) is needed. Latency is
+simulated with sleeps: `base_latency` per request plus `per_item_latency`
+per embedded input, or `audio_latency` per second of transcribed audio.
+A `rate_limit_ratio` share of requests is answered 429 with Retry-After.
+
+    POST /api/embeddings, /api/embed         Ollama
+    POST /v1/embeddings                      OpenAI (float or base64)
+    POST /v1/audio/transcriptions            OpenAI, WAV only
+    GET  /page/<anything>                    HTML article, fixed per path
+"""
+import base64
+import hashlib
+import io
+import json
+import math
+import random
+import struct
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+
+
+def fake_vector(text: str, dims: int) -> List[float]:
+    # Deterministic unit vector derived from the text, so repeated runs agree.
+    out: List[float] = []
+    counter = 0
+    while len(out) < dims:
+        digest = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+        out.extend(v / 2**31 - 1.0 for v in struct.unpack("<8I", digest))
+        counter += 1
+    out = out[:dims]
+    norm = math.sqrt(sum(x * x for x in out)) or 1.0
+    return [x / norm for x in out]
+
+
+def fake_transcript(wav_bytes: bytes) -> List[Tuple[float, float, str]]:
+    """
+    One word per second of audio, derived from that second's samples, as
+    (start s, end s, word). Cutting a recording on whole seconds therefore
+    yields the same words for the same stretch of audio, like a real model.
+    """
+    with wave.open(io.BytesIO(wav_bytes)) as w:
+        rate, width = w.getframerate(), w.getsampwidth() * w.getnchannels()
+        frames = w.readframes(w.getnframes())
+    step = rate * width
+    words = []
+    for i in range(0, len(frames), step):
+        word = "w" + hashlib.sha256(frames[i:i + step]).hexdigest()[:6]
+        words.append((i / step, min(len(frames), i + step) / step, word))
+    return words
+
+
+def fake_page(path: str, words: int) -> str:
+    # an article readability will keep: title plus paragraphs of ~60 words
+    rng = random.Random(path)
+    vocab = [f"{a}{b}" for a in ("lo", "ra", "ki", "mu", "te", "sa", "no", "vi") for b in ("ren", "tal", "mos", "dik", "pa")]
+    paragraphs = [
+        " ".join(rng.choice(vocab) for _ in range(60)).capitalize() + "."
+        for _ in range(max(1, words // 60))
+    ]
+    body = "".join(f"<p>{p}</p>" for p in paragraphs)
+    return f"<html><head><title>Page {path}</title></head><body><article><h1>Page {path}</h1>{body}</article></body></html>"
+
+
+class StandinConfig:
+    def __init__(
+        self,
+        dims: int = 768,
+        base_latency: float = 0.02,
+        per_item_latency: float = 0.002,
+        audio_latency: float = 0.001,
+        concurrency: Optional[int] = None,
+        rate_limit_ratio: float = 0.0,
+        retry_after: float = 0.5,
+        page_words: int = 1500,
+        seed: int = 0,
+    ):
+        self.dims = dims
+        self.base_latency = base_latency
+        self.per_item_latency = per_item_latency
+        self.audio_latency = audio_latency
+        # requests processed at once, like Ollama's OLLAMA_NUM_PARALLEL; None = unbounded
+        self.slots = threading.BoundedSemaphore(concurrency) if concurrency else None
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.page_words = page_words
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.items = 0
+        self.rate_limited = 0
+
+    def throttle(self) -> bool:
+        """True if this request should get a 429."""
+        if not self.rate_limit_ratio:
+            return False
+        with self.lock:
+            if self.random.random() >= self.rate_limit_ratio:
+                return False
+            self.rate_limited += 1
+            return True
+
+    def record(self, n_items: int) -> None:
+        with self.lock:
+            self.requests += 1
+            self.items += n_items
+
+    def simulate(self, n_items: int) -> None:
+        self.record(n_items)
+        if self.slots is None:
+            time.sleep(self.base_latency + self.per_item_latency * n_items)
+            return
+        with self.slots:
+            time.sleep(self.base_latency + self.per_item_latency * n_items)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    config: StandinConfig = None  # set on the per-server subclass
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send(self, body: bytes, content_type: str, status: int = 200, headers: Optional[dict] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, payload: dict, status: int = 200, headers: Optional[dict] = None) -> None:
+        self._send(json.dumps(payload).encode("utf-8"), "application/json", status, headers)
+
+    def _rate_limited(self) -> bool:
+        if not self.config.throttle():
+            return False
+        # the request body must still be read for keep-alive to work
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        wait = self.config.retry_after
+        self._send_json(
+            {"error": {"message": "Rate limit reached (stand-in)", "type": "rate_limit_exceeded", "code": "rate_limit_exceeded"}},
+            status=429,
+            headers={"Retry-After": str(max(1, math.ceil(wait))), "retry-after-ms": str(int(wait * 1000))},
+        )
+        return True
+
+    def do_GET(self):
+        cfg = self.config
+        if not self.path.startswith("/page/"):
+            self._send_json({"error": "not found"}, status=404)
+            return
+        if self._rate_limited():
+            return
+        cfg.simulate(0)
+        self._send(fake_page(self.path, cfg.page_words).encode("utf-8"), "text/html; charset=utf-8")
+
+    def do_POST(self):
+        cfg = self.config
+        if self._rate_limited():
+            return
+        if self.path == "/api/embeddings":
+            body = self._read_json()
+            cfg.simulate(1)
+            self._send_json({"embedding": fake_vector(body.get("prompt", ""), cfg.dims)})
+        elif self.path == "/api/embed":
+            body = self._read_json()
+            inputs = body.get("input", [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            cfg.simulate(len(inputs))
+            self._send_json({
+                "model": body.get("model"),
+                "embeddings": [fake_vector(t, cfg.dims) for t in inputs],
+            })
+        elif self.path == "/v1/embeddings":
+            self._openai_embed()
+        elif self.path == "/v1/audio/transcriptions":
+            self._transcribe()
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _openai_embed(self) -> None:
+        cfg = self.config
+        body = self._read_json()
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dims = int(body.get("dimensions") or cfg.dims)
+        cfg.simulate(len(inputs))
+        data = []
+        for i, t in enumerate(inputs):
+            vec = fake_vector(t, dims)
+            if body.get("encoding_format") == "base64":  # the openai SDK's default
+                vec = base64.b64encode(struct.pack(f"<{dims}f", *vec)).decode("ascii")
+            data.append({"object": "embedding", "index": i, "embedding": vec})
+        tokens = sum(len(t.split()) for t in inputs)
+        self._send_json({
+            "object": "list", "data": data, "model": body.get("model"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    def _transcribe(self) -> None:
+        # OpenAI-compatible: multipart upload; only WAV payloads are understood.
+        cfg = self.config
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        riff = body.find(b"RIFF")
+        if riff < 0:
+            self._send_json({"error": {"message": "stand-in only accepts WAV"}}, status=400)
+            return
+        words = fake_transcript(body[riff:])
+        cfg.record(1)
+        time.sleep(cfg.base_latency + cfg.audio_latency * (words[-1][1] if words else 0))
+        text = " ".join(w for _, _, w in words)
+        if b'name="response_format"\r\n\r\nverbose_json' not in body:
+            self._send_json({"text": text})
+            return
+        segments = []
+        for n, i in enumerate(range(0, len(words), 5)):
+            group = words[i:i + 5]
+            segments.append({
+                "id": n,
+                "start": group[0][0],
+                "end": group[-1][1],
+                "text": " " + " ".join(w for _, _, w in group),
+            })
+        self._send_json({"text": text, "language": "english", "duration": words[-1][1] if words else 0, "segments": segments})
+
+
+class StandinServer:
+    """Runs the stand-in on 127.0.0.1 in a background thread; use as a context manager."""
+
+    def __init__(self, config: Optional[StandinConfig] = None, port: int = 0):
+        self.config = config or StandinConfig()
+        handler = type("Handler", (_Handler,), {"config": self.config})
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "StandinServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()